@@ -0,0 +1,7 @@
+#!/usr/bin/env bash
+
+# For some reason, the working dir isn't added
+# to Python's path on a raspberry pi.
+export PYTHONPATH=$(pwd)
+cat twitter_saver/resources/banner.txt
+exec python3 -m twitter_saver daemon --configuration conf/ "$@"
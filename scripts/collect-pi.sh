@@ -4,4 +4,4 @@
 # to Python's path on a raspberry pi.
 export PYTHONPATH=$(pwd)
 cat twitter_saver/resources/banner.txt
-python3 twitter_saver/saver.py --configuration conf/
+python3 -m twitter_saver collect --configuration conf/ "$@"
@@ -2,4 +2,4 @@
 
 source activate TwitterSave
 cat twitter_saver/resources/banner.txt
-python twitter_saver/saver.py --configuration conf/
+python -m twitter_saver collect --configuration conf/ "$@"
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 source activate TwitterSave
-python twitter_saver/publisher.py --configuration conf/
+python -m twitter_saver publish --configuration conf/ "$@"
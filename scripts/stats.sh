@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+
+source activate TwitterSave
+python -m twitter_saver stats --configuration conf/ "$@"
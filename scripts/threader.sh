@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 source activate TwitterSave
-python twitter_saver/.py --configuration conf/
+python -m twitter_saver thread --configuration conf/ "$@"
@@ -0,0 +1,5 @@
+import sys
+
+from twitter_saver.cli import main
+
+sys.exit(main())
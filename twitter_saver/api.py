@@ -0,0 +1,492 @@
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional
+
+from twitter_saver.metrics import Metrics
+
+if TYPE_CHECKING:
+    import twitter
+
+# The rate-limit family of each endpoint that is called
+ENDPOINTS = {
+    "GetUserTimeline": "/statuses/user_timeline",
+    "GetStatuses": "/statuses/lookup",
+    "GetStatus": "/statuses/show/:id",
+    "UsersLookup": "/users/lookup",
+    "GetUser": "/users/show/:id",
+}
+
+# The calls allowed in each window, for user authentication, until the API says otherwise
+DEFAULT_LIMIT = 900
+WINDOW_SECONDS = 15 * 60
+
+# How many times a call that hit the rate limit is tried again
+MAX_RETRIES = 3
+
+# Twitter's error codes for a rate-limited call, and for a lookup where none of the users exist
+RATE_LIMIT_EXCEEDED = 88
+NO_USER_MATCHES = 17
+
+# The number of keys read from the response cache per query
+BATCH_SIZE = 500
+
+# What each recorded call returns, so it can be turned back into models
+RECORDED_CALLS = {
+    "GetUserTimeline": "statuses",
+    "GetStatuses": "statuses",
+    "GetStatus": "status",
+    "UsersLookup": "users",
+    "GetUser": "user",
+}
+
+
+def create_api(conf) -> "twitter.Api":
+    """
+    :param conf: the Configuration
+    :return: a twitter.Api using the configured credentials, or a stand-in that records
+        or replays its calls, depending on api_mode
+    """
+    if conf.api_mode == "replay":
+        return ReplayApi(conf.api_recording)
+
+    # Imported here, so that the commands that don't use the API start faster
+    import twitter
+
+    # The rate limits are kept to by SharedApi, which knows every endpoint's window
+    api = twitter.Api(consumer_key=conf.consumer_key,
+                      consumer_secret=conf.consumer_secret,
+                      access_token_key=conf.access_token,
+                      access_token_secret=conf.access_token_secret,
+                      tweet_mode="extended",
+                      sleep_on_rate_limit=False)
+    if conf.api_mode == "record":
+        return RecordingApi(api, conf.api_recording)
+    return api
+
+
+def open_api(conf, metrics: Metrics = None) -> "SharedApi":
+    """
+    :param conf: the Configuration
+    :param metrics: where to record the calls made
+    :return: a SharedApi using the configured client and response cache
+    """
+    cache = None if conf.api_cache_file is None else ResponseCache(conf.api_cache_file)
+    return SharedApi(create_api(conf), metrics, cache=cache, ttls=api_ttls(conf))
+
+
+def api_ttls(conf) -> Dict[str, float]:
+    """
+    :return: how long each kind of cached response is kept, in seconds
+    """
+    return {"status": conf.api_cache_days * 24 * 60 * 60,
+            "user": conf.user_ttl_days * 24 * 60 * 60}
+
+
+def _error_code(error: Exception) -> Optional[int]:
+    message = getattr(error, "message", None)
+    if isinstance(message, list):
+        for m in message:
+            if isinstance(m, dict) and "code" in m:
+                return m.get("code")
+    return None
+
+
+def no_user_matches(error: Exception) -> bool:
+    """
+    :return: whether the error is a users/lookup where none of the users exist
+    """
+    return _error_code(error) == NO_USER_MATCHES
+
+
+def _to_json(model) -> dict:
+    # The raw payload, as AsDict() leaves out the media
+    return getattr(model, "_json", None) or model.AsDict()
+
+
+class RateLimiter:
+    """
+    The rate-limit window of each endpoint: how many calls are left, and
+    when the window resets. Calls are counted down locally, so that several
+    threads don't all spend the last call, and the counts are corrected
+    from the API's response headers whenever they are known. A call to an
+    endpoint with nothing left waits for its window to reset.
+    """
+
+    def __init__(self,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        # endpoint: [limit, remaining, reset]
+        self._windows: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, endpoint: str, now: float) -> List[float]:
+        window = self._windows.setdefault(endpoint, [DEFAULT_LIMIT, DEFAULT_LIMIT, 0])
+        if window[2] <= now:
+            # A new window starts with the first call after the last one reset
+            window[1], window[2] = window[0], now + WINDOW_SECONDS
+        return window
+
+    def window(self, endpoint: str) -> tuple:
+        """
+        :return: the (limit, remaining, reset) of the endpoint's current window
+        """
+        with self._lock:
+            return tuple(self._window(endpoint, self.clock()))
+
+    def acquire(self, endpoint: str) -> float:
+        """
+        Takes one call from the endpoint's window, first waiting for the window
+        to reset if there are none left
+        :return: the time spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                window = self._window(endpoint, now)
+                if window[1] > 0:
+                    window[1] -= 1
+                    return waited
+                wait = window[2] - now
+            logging.info("Out of calls to {}, waiting {:.0f}s for the rate limit to reset"
+                         .format(endpoint, wait))
+            self.sleep(wait)
+            waited += wait
+
+    def update(self, endpoint: str, limit: int, remaining: int, reset: float) -> None:
+        """
+        Sets an endpoint's window from the API's response headers
+        """
+        if reset <= self.clock():
+            return
+        with self._lock:
+            self._windows[endpoint] = [limit, remaining, reset]
+
+    def exhausted(self, endpoint: str) -> None:
+        """
+        Marks an endpoint as having no calls left, after the API refused a call
+        """
+        with self._lock:
+            self._window(endpoint, self.clock())[1] = 0
+
+
+class ResponseCache:
+    """
+    The responses to status and user lookups, saved to an SQLite file with
+    the time they were fetched, so that later runs only ask for what is new
+    or has expired. A lookup that found nothing (a deleted tweet, say) is
+    saved too, as None.
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        # Shared by the collection workers, one query at a time
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses "
+                               "(kind TEXT, key TEXT, data TEXT, fetched_at REAL, "
+                               "PRIMARY KEY (kind, key)) WITHOUT ROWID")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get_many(self, kind: str, keys: Iterable, ttl: float) -> Dict[str, Optional[dict]]:
+        """
+        :param kind: the kind of response, such as "status" or "user"
+        :param keys: the keys to look up
+        :param ttl: the age, in seconds, after which a response is out of date
+        :return: the response for each key that is saved and up to date
+        """
+        keys = sorted({str(key) for key in keys})
+        oldest = self.clock() - ttl
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), BATCH_SIZE):
+                batch = keys[start:start + BATCH_SIZE]
+                query = "SELECT key, data FROM responses WHERE kind = ? AND fetched_at >= ? " \
+                        "AND key IN ({})".format(",".join("?" * len(batch)))
+                for key, data in self._conn.execute(query, [kind, oldest] + batch):
+                    found[key] = None if data is None else json.loads(data)
+        return found
+
+    def put_many(self, kind: str, responses: Dict[object, Optional[dict]]) -> None:
+        now = self.clock()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO responses (kind, key, data, fetched_at) "
+                                   "VALUES (?, ?, ?, ?)",
+                                   ((kind, str(key), None if data is None else json.dumps(data),
+                                     now) for key, data in responses.items()))
+
+    def prune(self, kind: str, ttl: float) -> int:
+        """
+        Removes the out of date responses of a kind
+        :return: the number removed
+        """
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM responses WHERE kind = ? AND fetched_at < ?",
+                                      (kind, self.clock() - ttl)).rowcount
+
+
+class RecordingApi:
+    """
+    Passes every call through to a twitter.Api, and appends each lookup and
+    its response (or error) to a recording, for ReplayApi to play back.
+    """
+
+    def __init__(self, api: "twitter.Api", path: str):
+        self.api = api
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if name in RECORDED_CALLS:
+            return functools.partial(self._record, name, attribute)
+        return attribute
+
+    def _record(self, name: str, method, *args, **kwargs):
+        entry = {"call": _call_key(name, args, kwargs)}
+        try:
+            response = method(*args, **kwargs)
+        except Exception as e:
+            entry["error"] = getattr(e, "message", str(e))
+            self._write(entry)
+            raise
+        kind = RECORDED_CALLS[name]
+        entry["response"] = [_to_json(model) for model in response] if kind.endswith("s") \
+            else _to_json(response)
+        self._write(entry)
+        return response
+
+    def _write(self, entry: dict) -> None:
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry, sort_keys=True) + "\n")
+
+
+class ReplayApi:
+    """
+    Answers lookups from a recording made by RecordingApi, without going
+    online. A call made more than once gets the recorded responses in turn,
+    and then the last one again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._responses: Dict[str, List[dict]] = {}
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._responses.setdefault(entry["call"], []).append(entry)
+        self._played: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name not in RECORDED_CALLS:
+            raise AttributeError("{} can't be replayed".format(name))
+        return functools.partial(self._replay, name)
+
+    def _replay(self, name: str, *args, **kwargs):
+        import twitter
+
+        key = _call_key(name, args, kwargs)
+        with self._lock:
+            entries = self._responses.get(key)
+            if entries is None:
+                raise KeyError("The call was not recorded: {}".format(key))
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+        entry = entries[min(played, len(entries) - 1)]
+
+        if "error" in entry:
+            raise twitter.error.TwitterError(entry["error"])
+        kind = RECORDED_CALLS[name]
+        model = twitter.User if kind.startswith("user") else twitter.Status
+        if kind.endswith("s"):
+            return [model.NewFromJsonDict(data) for data in entry["response"]]
+        return model.NewFromJsonDict(entry["response"])
+
+
+def _call_key(name: str, args: tuple, kwargs: dict) -> str:
+    return json.dumps([name, list(args), kwargs], sort_keys=True)
+
+
+class SharedApi:
+    """
+    One twitter.Api (and so one rate-limit budget) shared by several
+    collection workers. Every call waits for a call to be free in its
+    endpoint's rate-limit window, and a call refused by the rate limit is
+    tried again once the window resets.
+
+    Every status seen is cached, and a status that is already being looked
+    up by another worker is waited for rather than requested again, so that
+    a tweet needed by more than one account is only looked up once. Given a
+    ResponseCache, status and user lookups are also kept between runs.
+
+    Given a Metrics, the number of calls and the time spent in each
+    endpoint are recorded, along with the cache hits.
+    """
+
+    def __init__(self,
+                 api: "twitter.Api",
+                 metrics: Metrics = None,
+                 limiter: RateLimiter = None,
+                 cache: ResponseCache = None,
+                 ttls: Dict[str, float] = None):
+        """
+        :param api: the twitter.Api
+        :param metrics: where to record the calls made
+        :param limiter: the rate-limit windows, if they are shared with other clients
+        :param cache: where to keep the status and user lookups between runs
+        :param ttls: how long each kind of cached response is kept, in seconds
+        """
+        self.api = api
+        self.metrics = metrics
+        self.limiter = limiter or RateLimiter()
+        self.cache = cache
+        self.ttls = ttls or {"status": 30 * 24 * 60 * 60, "user": 30 * 24 * 60 * 60}
+        self._statuses: Dict[int, Optional["twitter.Status"]] = {}
+        self._pending: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if callable(attribute):
+            return functools.partial(self._call, name, attribute)
+        return attribute
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+    def _count(self, name: str, value: float = 1) -> None:
+        if self.metrics is not None and value:
+            self.metrics.count(name, value)
+
+    def _call(self, endpoint: str, method, *args, **kwargs):
+        resource = ENDPOINTS.get(endpoint)
+        for attempt in range(MAX_RETRIES + 1):
+            if resource is not None:
+                waited = self.limiter.acquire(resource)
+                self._count("api_rate_limit_wait_seconds", waited)
+            try:
+                if self.metrics is None:
+                    response = method(*args, **kwargs)
+                else:
+                    self.metrics.count("api_calls.{}".format(endpoint))
+                    with self.metrics.stage("api.{}".format(endpoint)):
+                        response = method(*args, **kwargs)
+            except Exception as e:
+                if resource is None or _error_code(e) != RATE_LIMIT_EXCEEDED \
+                        or attempt == MAX_RETRIES:
+                    raise
+                logging.warning("{} was refused by the rate limit".format(endpoint))
+                self._count("api_rate_limited")
+                self.limiter.exhausted(resource)
+                continue
+            if resource is not None:
+                self._sync(resource)
+            return response
+
+    def _sync(self, resource: str) -> None:
+        # python-twitter keeps the limits from each response's headers
+        rate_limit = getattr(self.api, "rate_limit", None)
+        if rate_limit is not None and hasattr(rate_limit, "get_limit"):
+            limit = rate_limit.get_limit(resource)
+            self.limiter.update(resource, limit.limit, limit.remaining, limit.reset)
+
+    def _cache(self, statuses: List["twitter.Status"]) -> None:
+        with self._lock:
+            for status in statuses:
+                self._statuses[status.id] = status
+
+    def GetUserTimeline(self, **kwargs) -> List["twitter.Status"]:
+        timeline = self._call("GetUserTimeline", self.api.GetUserTimeline, **kwargs)
+        self._cache(timeline)
+        return timeline
+
+    def GetStatuses(self, status_ids: List[int], **kwargs) -> List["twitter.Status"]:
+        with self._lock:
+            missing = [id for id in status_ids
+                       if id not in self._statuses and id not in self._pending]
+            waiting = {self._pending[id] for id in status_ids if id in self._pending}
+            for id in missing:
+                self._pending[id] = threading.Event()
+        self._count("api_cache_hits", len(status_ids) - len(missing) - len(waiting))
+
+        try:
+            if missing:
+                self._lookup_statuses(missing, **kwargs)
+        finally:
+            with self._lock:
+                for id in missing:
+                    self._pending.pop(id).set()
+        # Looked up by another worker at the same time
+        for event in waiting:
+            event.wait()
+
+        with self._lock:
+            statuses = [self._statuses.get(id) for id in status_ids]
+        return [status for status in statuses if status is not None]
+
+    def _lookup_statuses(self, status_ids: List[int], **kwargs) -> None:
+        if self.cache is not None:
+            import twitter
+
+            saved = self.cache.get_many("status", status_ids, self.ttls["status"])
+            self._count("api_disk_cache_hits", len(saved))
+            with self._lock:
+                for key, data in saved.items():
+                    self._statuses[int(key)] = None if data is None \
+                        else twitter.Status.NewFromJsonDict(data)
+            status_ids = [id for id in status_ids if str(id) not in saved]
+            if not status_ids:
+                return
+
+        found = self._call("GetStatuses", self.api.GetStatuses, status_ids, **kwargs)
+        self._cache(found)
+        found_ids = {status.id for status in found}
+        with self._lock:
+            # Remember the deleted or protected tweets too
+            for id in status_ids:
+                self._statuses.setdefault(id, None)
+        if self.cache is not None:
+            responses = {status.id: _to_json(status) for status in found}
+            responses.update((id, None) for id in status_ids if id not in found_ids)
+            self.cache.put_many("status", responses)
+
+    def UsersLookup(self, screen_name: List[str] = None, **kwargs) -> List["twitter.User"]:
+        if self.cache is None or not screen_name:
+            return self._call("UsersLookup", self.api.UsersLookup, screen_name=screen_name,
+                              **kwargs)
+        import twitter
+
+        saved = self.cache.get_many("user", [name.lower() for name in screen_name],
+                                    self.ttls["user"])
+        self._count("api_disk_cache_hits", len(saved))
+        users = [twitter.User.NewFromJsonDict(data) for data in saved.values() if data is not None]
+        missing = [name for name in screen_name if name.lower() not in saved]
+        if not missing:
+            return users
+
+        try:
+            found = self._call("UsersLookup", self.api.UsersLookup, screen_name=missing,
+                               **kwargs)
+        except Exception as e:
+            if not no_user_matches(e):
+                raise
+            found = []
+        responses: Dict[str, Optional[dict]] = {name.lower(): None for name in missing}
+        responses.update((user.screen_name.lower(), _to_json(user)) for user in found)
+        self.cache.put_many("user", responses)
+        return users + found
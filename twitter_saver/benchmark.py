@@ -0,0 +1,299 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from twitter_saver import merger
+from twitter_saver.objects import Tweet
+from twitter_saver.rendering import render_thread, render_threads
+from twitter_saver.search import SearchIndex
+from twitter_saver.synthetic import generate_tweets, write_archive
+from twitter_saver.threads import create_threads
+from twitter_saver.utils import clean_text, split_media
+
+# How much slower than the baseline a benchmark can be before it counts as a regression
+THRESHOLD = 1.2
+
+
+class Archive:
+    """
+    The synthetic archive that every benchmark runs against. Each form of
+    it is built the first time a benchmark needs it, and isn't timed.
+    """
+
+    def __init__(self, records: List[dict], work_dir: str):
+        self.records = records
+        self.work_dir = work_dir
+        self._tweets = None
+        self._threads = None
+
+    @property
+    def tweets(self) -> List[Tweet]:
+        if self._tweets is None:
+            self._tweets = [Tweet.new_from_json(record) for record in self.records]
+        return self._tweets
+
+    @property
+    def threads(self) -> List[List[Tweet]]:
+        if self._threads is None:
+            self._threads = create_threads(self.tweets)
+        return self._threads
+
+
+def bench_new_from_json(archive: Archive) -> Callable[[], int]:
+    records = archive.records
+    return lambda: len([Tweet.new_from_json(record) for record in records])
+
+
+def bench_to_dict(archive: Archive) -> Callable[[], int]:
+    tweets = archive.tweets
+    return lambda: len([tweet.to_dict() for tweet in tweets])
+
+
+def bench_split_media(archive: Archive) -> Callable[[], int]:
+    tweets = [tweet for tweet in archive.tweets if tweet.media]
+    return lambda: sum(len(split_media(tweet)) for tweet in tweets)
+
+
+def bench_clean_text(archive: Archive) -> Callable[[], int]:
+    texts = [tweet.text for tweet in archive.tweets]
+    return lambda: len([clean_text(text) for text in texts])
+
+
+def bench_create_threads(archive: Archive) -> Callable[[], int]:
+    tweets = archive.tweets
+    return lambda: len(create_threads(tweets))
+
+
+def _render_jobs(archive: Archive) -> list:
+    authors = {tweet.author for tweet in archive.tweets}
+    users = {author: {"name": author.title(), "profile_picture": "profile/{}.jpg".format(author)}
+             for author in authors}
+    dimensions = {media.filename: (1200, 800) for tweet in archive.tweets for media in tweet.media}
+    return [(thread, users, dimensions) for thread in archive.threads]
+
+
+def bench_render(archive: Archive) -> Callable[[], int]:
+    jobs = _render_jobs(archive)
+
+    def render():
+        for job in jobs:
+            render_thread(*job)
+        return len(jobs)
+
+    return render
+
+
+def bench_render_parallel(archive: Archive) -> Callable[[], int]:
+    jobs = _render_jobs(archive)
+
+    def render():
+        with ProcessPoolExecutor() as executor:
+            return len(list(render_threads(jobs, executor)))
+
+    return render
+
+
+def bench_merge(archive: Archive) -> Callable[[], int]:
+    # Two overlapping exports of the same timeline
+    half = len(archive.records) // 2
+    first = os.path.join(archive.work_dir, "merge-1.json")
+    second = os.path.join(archive.work_dir, "merge-2.json")
+    write_archive(first, archive.records[:half + half // 2])
+    write_archive(second, archive.records[half // 2:])
+    output = os.path.join(archive.work_dir, "merged.sqlite")
+
+    def merge():
+        if os.path.exists(output):
+            os.remove(output)
+        merger.main([first, second], output)
+        return len(archive.records)
+
+    return merge
+
+
+def bench_search_index(archive: Archive) -> Callable[[], int]:
+    path = os.path.join(archive.work_dir, "search-index.sqlite")
+
+    def index():
+        if os.path.exists(path):
+            os.remove(path)
+        with SearchIndex(path) as search_index:
+            return search_index.add(dict(record) for record in archive.records)
+
+    return index
+
+
+def bench_search(archive: Archive) -> Callable[[], int]:
+    path = os.path.join(archive.work_dir, "search-index-queries.sqlite")
+    search_index = SearchIndex(path)
+    search_index.add(dict(record) for record in archive.records)
+    queries = ["archive", "thread reply", '"the archive"', "offline -today", "tweet from:author_1",
+               "since:2019-01-10 until:2019-01-20 reply"]
+
+    return lambda: sum(len(search_index.search(query)) for query in queries)
+
+
+BENCHMARKS = {
+    "new_from_json": bench_new_from_json,
+    "to_dict": bench_to_dict,
+    "split_media": bench_split_media,
+    "clean_text": bench_clean_text,
+    "create_threads": bench_create_threads,
+    "render": bench_render,
+    "render_parallel": bench_render_parallel,
+    "merge": bench_merge,
+    "search_index": bench_search_index,
+    "search": bench_search,
+}
+
+
+def measure(run: Callable[[], int], repeat: int) -> Dict[str, float]:
+    """
+    Times a benchmark (the best of several runs), then runs it once more
+    under tracemalloc to find its peak memory use.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = run()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"seconds": min(times), "peak_bytes": peak, "items": items}
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> List[str]:
+    """
+    :return: the names of the benchmarks that are slower than the baseline by
+             more than the threshold
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        logging.info("{}: {:.3f}s against {:.3f}s ({:.2f}x)".format(
+            name, result["seconds"], before["seconds"], ratio))
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(tweets: int = 10000,
+         output: str = None,
+         benchmarks: List[str] = None,
+         repeat: int = 3,
+         seed: int = 0,
+         **generator_options) -> dict:
+    """
+    Runs the benchmarks against a synthetic archive
+
+    :param tweets: the size of the archive
+    :param output: the JSON file to write the results to
+    :param benchmarks: the names of the benchmarks to run (defaults to all of them)
+    :param repeat: the number of timed runs of each benchmark
+    :param seed: the random seed of the archive
+    :param generator_options: any other options for synthetic.generate_tweets
+    :return: the results
+    """
+    names = list(BENCHMARKS) if not benchmarks else benchmarks
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError("Unknown benchmarks: {}".format(", ".join(unknown)))
+
+    logging.info("Generating {} tweets".format(tweets))
+    records = generate_tweets(tweets, seed=seed, **generator_options)
+
+    results = {
+        "commit": _commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parameters": dict(tweets=tweets, repeat=repeat, seed=seed, **generator_options),
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        archive = Archive(records, work_dir)
+        for name in names:
+            result = measure(BENCHMARKS[name](archive), repeat)
+            results["results"][name] = result
+            logging.info("{}: {:.3f}s, peak {:.1f} MB".format(
+                name, result["seconds"], result["peak_bytes"] / 1024 ** 2))
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+        logging.info("Saved the results to {}".format(output))
+
+    return results
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level="INFO",
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt='%Y-%m-%d %H:%M:%S'
+                        )
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--tweets", "-n", help="the number of tweets in the archive",
+                        type=int, default=10000)
+    parser.add_argument("--output", "-o", help="the JSON file to write the results to", type=str)
+    parser.add_argument("--benchmark", "-b", help="a benchmark to run (defaults to all)",
+                        type=str, action="append", choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", "-r", help="the number of timed runs of each benchmark",
+                        type=int, default=3)
+    parser.add_argument("--seed", help="the random seed of the archive", type=int, default=0)
+    parser.add_argument("--max-depth", help="the longest reply chain", type=int, default=20)
+    parser.add_argument("--branching", help="the share of replies that branch a conversation",
+                        type=float, default=0.1)
+    parser.add_argument("--out-of-order", help="the share of replies to much older tweets",
+                        type=float, default=0.02)
+    parser.add_argument("--media-density", help="the share of tweets with media",
+                        type=float, default=0.2)
+    parser.add_argument("--compare", help="a previous results file to compare against", type=str)
+    parser.add_argument("--threshold", help="the slowdown that counts as a regression",
+                        type=float, default=THRESHOLD)
+
+    args = parser.parse_args()
+
+    results = main(args.tweets, args.output, args.benchmark, args.repeat, args.seed,
+                   max_depth=args.max_depth,
+                   branching=args.branching,
+                   out_of_order=args.out_of_order,
+                   media_density=args.media_density)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            logging.warning("Slower than the baseline: {}".format(", ".join(regressions)))
+            sys.exit(1)
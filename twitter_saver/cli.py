@@ -0,0 +1,196 @@
+import argparse
+import logging
+import os
+import sys
+from typing import List
+
+# Each command's module (and so the API client, Pillow and the other large
+# libraries) is only imported when the command runs, so a short run, such as a
+# collect that finds no new tweets, doesn't pay to load what it won't use.
+
+
+def _configuration(args):
+    if args.configuration is None:
+        raise FileNotFoundError("You have not specified a configuration path")
+
+    from twitter_saver.configuration import Configuration
+
+    conf = Configuration(os.path.join(args.configuration, "configuration.yml"))
+    if getattr(args, "user", None) is not None:
+        conf = conf.for_account(args.user)
+    return conf
+
+
+def _collect(args) -> int:
+    from twitter_saver import saver
+
+    saver.main(_configuration(args), args.backfill, args.profile)
+    return 0
+
+
+def _daemon(args) -> int:
+    from twitter_saver import daemon
+
+    daemon.main(_configuration(args), args.polls, args.profile)
+    return 0
+
+
+def _publish(args) -> int:
+    from twitter_saver import publisher
+
+    publisher.main(_configuration(args), args.profile)
+    return 0
+
+
+def _html(args) -> int:
+    from twitter_saver import html_publisher
+
+    html_publisher.main(_configuration(args), args.profile)
+    return 0
+
+
+def _thread(args) -> int:
+    from twitter_saver import threader
+
+    threader.main(_configuration(args), args.format, args.compress, args.since, args.output)
+    return 0
+
+
+def _merge(args) -> int:
+    from twitter_saver import merger
+
+    merger.main(args.files, args.output, args.conflict, args.run_size)
+    return 0
+
+
+def _search(args) -> int:
+    from twitter_saver import searcher
+
+    searcher.main(_configuration(args), " ".join(args.query), args.limit, args.threads,
+                  args.update)
+    return 0
+
+
+def _stats(args) -> int:
+    from twitter_saver import reporter
+
+    reporter.main(_configuration(args), args.rebuild, args.json, args.top)
+    return 0
+
+
+def create_parser() -> argparse.ArgumentParser:
+    logging_options = argparse.ArgumentParser(add_help=False)
+    logging_options.add_argument("--log", "-l", help="set the logging level", type=str,
+                                 default="INFO")
+
+    configuration_options = argparse.ArgumentParser(add_help=False)
+    configuration_options.add_argument("--configuration", "-c",
+                                       help="the path to the config folder", type=str)
+
+    user_options = argparse.ArgumentParser(add_help=False)
+    user_options.add_argument("--user", "-u",
+                              help="the configured user to use (defaults to the first)", type=str)
+
+    profile_options = argparse.ArgumentParser(add_help=False)
+    profile_options.add_argument("--profile", "-p", help="run the heavy stages under cProfile",
+                                 action="store_true")
+
+    parser = argparse.ArgumentParser(prog="twitter_saver",
+                                     description="Saves tweets, and publishes them offline.")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    collect = commands.add_parser("collect", help="save every configured user's new tweets",
+                                  parents=[configuration_options, logging_options,
+                                           profile_options])
+    collect.add_argument("--backfill", "-b", help="page through the user's full timeline",
+                         action="store_true")
+    collect.set_defaults(run=_collect)
+
+    daemon = commands.add_parser("daemon", help="keep collecting new tweets, polling each user "
+                                 "more often while they are posting",
+                                 parents=[configuration_options, logging_options,
+                                          profile_options])
+    daemon.add_argument("--polls", "-n", help="stop after this many polls (runs until it is "
+                        "interrupted by default)", type=int)
+    daemon.set_defaults(run=_daemon)
+
+    publish = commands.add_parser("publish", help="write a user's threads as a LaTeX document",
+                                  parents=[configuration_options, logging_options, user_options,
+                                           profile_options])
+    publish.set_defaults(run=_publish)
+
+    html = commands.add_parser("html", help="write a user's threads as a static HTML site",
+                               parents=[configuration_options, logging_options, user_options,
+                                        profile_options])
+    html.set_defaults(run=_html)
+
+    thread = commands.add_parser("thread", help="export a user's threads as JSON",
+                                 parents=[configuration_options, logging_options, user_options])
+    thread.add_argument("--format", "-f", help="'ndjson' writes one thread per line, as the "
+                        "threads are produced", type=str, choices=["json", "ndjson"],
+                        default="json")
+    thread.add_argument("--compress", "-z", help="gzip the output", action="store_true")
+    thread.add_argument("--since", "-s", help="only export threads with tweets newer than this "
+                        "tweet ID or date (YYYY-MM-DD)", type=str)
+    thread.add_argument("--output", "-o", help="the file to write (defaults to "
+                        "tweets-threaded.<format> in the user's folder)", type=str)
+    thread.set_defaults(run=_thread)
+
+    merge = commands.add_parser("merge", help="merge tweet databases into one",
+                                parents=[logging_options])
+    merge.add_argument("files", help="the files to merge", type=str, nargs="+")
+    merge.add_argument("--output", "-o", help="the name of the output file", type=str,
+                       required=True)
+    merge.add_argument("--conflict", help="which copy of a conflicting tweet to keep",
+                       type=str, choices=["first", "last", "error"], default="first")
+    merge.add_argument("--run-size", help="the number of tweets to sort in memory at a time",
+                       type=int, default=100000)
+    merge.set_defaults(run=_merge)
+
+    search = commands.add_parser("search", help="search a user's tweets",
+                                 description="Searches the saved tweets. A query is made up of "
+                                 'words, "phrases", -excluded words, from:user, '
+                                 "since:YYYY-MM-DD and until:YYYY-MM-DD.",
+                                 parents=[configuration_options, logging_options, user_options])
+    search.add_argument("query", help="the search", type=str, nargs="+")
+    search.add_argument("--limit", "-n", help="the most tweets to show", type=int, default=50)
+    search.add_argument("--threads", "-t", help="show the whole thread of each matching tweet",
+                        action="store_true")
+    search.add_argument("--update", help="index any saved tweets that are missing from the "
+                        "index first", action="store_true")
+    search.set_defaults(run=_search)
+
+    stats = commands.add_parser("stats", help="show the statistics of a user's archive",
+                                parents=[configuration_options, logging_options, user_options])
+    stats.add_argument("--rebuild", "-r", help="count every saved tweet again",
+                       action="store_true")
+    stats.add_argument("--json", "-j", help="print the statistics as JSON", action="store_true")
+    stats.add_argument("--top", "-t", help="the number of repliers and busiest days to show",
+                       type=int, default=10)
+    stats.set_defaults(run=_stats)
+
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Runs a twitter_saver command
+    :param argv: the command and its arguments (defaults to the command line)
+    :return: the exit status
+    """
+    parser = create_parser()
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    numeric_level = getattr(logging, args.log.upper(), None)
+    if not isinstance(numeric_level, int):
+        raise ValueError("Invalid log level: {}".format(args.log))
+
+    logging.basicConfig(level=numeric_level,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt='%Y-%m-%d %H:%M:%S'
+                        )
+
+    return args.run(args)
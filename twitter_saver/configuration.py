@@ -1,6 +1,14 @@
+import copy
 import os
 import yaml
 
+API_MODES = ["live", "record", "replay"]
+
+DB_FILES = {
+    "json": "tweets-db.json",
+    "sqlite": "tweets-db.sqlite",
+}
+
 
 class Configuration:
     def __init__(self, config_file):
@@ -9,12 +17,53 @@ class Configuration:
 
         self.settings = conf.get("general")
 
-        self.screen_name = self.settings["screen_name"]
+        # Either a single user, or a list of users to collect together
+        screen_names = self.settings["screen_name"]
+        if isinstance(screen_names, list):
+            self.screen_names = [str(name) for name in screen_names]
+        else:
+            self.screen_names = [str(screen_names)]
+        self.screen_name = self.screen_names[0]
+
         self.max_tweets = self.settings["max_tweets"]
+        self.download_workers = self.settings.get("download_workers", 8)
+        self.user_ttl_days = self.settings.get("user_ttl_days", 30)
+        self.max_conversation_depth = self.settings.get("max_conversation_depth", 50)
+        self.account_workers = self.settings.get("account_workers", 4)
+        self.render_workers = self.settings.get("render_workers", 0) or os.cpu_count() or 1
+        self.site_page_threads = self.settings.get("site_page_threads", 50)
+        self.site_page_tweets = self.settings.get("site_page_tweets", 500)
+        self.print_dpi = self.settings.get("print_dpi", 200)
+        self.print_quality = self.settings.get("print_quality", 85)
+        self.search_index = bool(self.settings.get("search_index", True))
+        self.poll_min_interval = self.settings.get("poll_min_interval", 60)
+        self.poll_max_interval = self.settings.get("poll_max_interval", 3600)
+        if self.poll_min_interval > self.poll_max_interval:
+            raise ValueError("poll_min_interval is longer than poll_max_interval")
 
-        self.save_path = self._get_path(self.settings.get("save_path"), self.screen_name)
-        self.media_path = self._get_path(self.save_path, "media")
-        self.profile_path = self._get_path(self.media_path, "profile")
+        self.storage = self.settings.get("storage", "sqlite")
+        if self.storage not in DB_FILES:
+            raise ValueError("Unknown storage backend: {}".format(self.storage))
+
+        self._set_paths()
+
+        # Metrics are written for the whole run, not per user
+        root_path = self.settings.get("save_path")
+        metrics_path = self.settings.get("metrics_path", "metrics")
+        self.metrics_path = None if not metrics_path else os.path.join(root_path, metrics_path)
+        self.prometheus_path = self.settings.get("prometheus_textfile_path") or None
+
+        # The API response cache and recordings are shared by every user
+        api_cache_file = self.settings.get("api_cache_file", "api-cache.sqlite")
+        self.api_cache_file = None if not api_cache_file \
+            else os.path.join(root_path, api_cache_file)
+        self.api_cache_days = self.settings.get("api_cache_days", 30)
+        self.api_mode = self.settings.get("api_mode", "live")
+        if self.api_mode not in API_MODES:
+            raise ValueError("Unknown API mode: {}".format(self.api_mode))
+        api_recording = self.settings.get("api_recording", "api-recording.ndjson")
+        self.api_recording = os.path.join(root_path, api_recording)
+        self.profile = bool(self.settings.get("profile", False))
 
         credentials = conf.get("credentials")
         self.consumer_key = credentials["consumer_key"]
@@ -22,6 +71,24 @@ class Configuration:
         self.access_token = credentials["access_token"]
         self.access_token_secret = credentials["access_secret"]
 
+    def for_account(self, screen_name):
+        """
+        Creates a copy of the configuration for one of the configured users,
+        with the paths pointing to that user's own database and media.
+        """
+        account = copy.copy(self)
+        account.screen_name = screen_name
+        account._set_paths()
+        return account
+
+    def _set_paths(self):
+        self.save_path = self._get_path(self.settings.get("save_path"), self.screen_name)
+        self.media_path = self._get_path(self.save_path, "media")
+        self.profile_path = self._get_path(self.media_path, "profile")
+        self.db_file = os.path.join(self.save_path, DB_FILES[self.storage])
+        self.search_file = os.path.join(self.save_path, "search-index.sqlite")
+        self.stats_file = os.path.join(self.save_path, "stats.json")
+
     def _get_path(self, path, name):
         full_path = os.path.join(path, name)
 
@@ -0,0 +1,58 @@
+import logging
+from typing import TYPE_CHECKING, Iterable, List, Set
+
+if TYPE_CHECKING:
+    import twitter
+
+# The most tweets that statuses/lookup returns per call
+LOOKUP_BATCH_SIZE = 100
+
+
+def fetch_ancestors(api: "twitter.Api",
+                    tweets: Iterable["twitter.Status"],
+                    known_ids: Set[int],
+                    max_depth: int = 50) -> List["twitter.Status"]:
+    """
+    Completes the conversations that a set of tweets reply to, by walking up
+    through in_reply_to_status_id one level at a time, until each chain
+    reaches its root, a tweet that is already known, or the depth limit.
+    Each level is looked up in batches.
+
+    :param api: the twitter.Api
+    :param tweets: the newly collected tweets
+    :param known_ids: the IDs of every tweet already in the archive
+    :param max_depth: the most levels to walk up from any tweet
+    :return: the ancestor tweets that were found, nearest level first
+    """
+    tweets = list(tweets)
+    # Every ID that has been looked up, or is about to be saved with the tweets
+    seen = {tweet.id for tweet in tweets}
+
+    def missing_parents(children):
+        parents = {tweet.in_reply_to_status_id for tweet in children}
+        return sorted(id for id in parents
+                      if id is not None and id not in known_ids and id not in seen)
+
+    ancestors = []
+    parent_ids = missing_parents(tweets)
+    depth = 0
+
+    while parent_ids and depth < max_depth:
+        depth += 1
+        logging.debug("Looking up {} tweets upstream, at depth {}".format(len(parent_ids), depth))
+
+        found = []
+        for start in range(0, len(parent_ids), LOOKUP_BATCH_SIZE):
+            found.extend(api.GetStatuses(parent_ids[start:start + LOOKUP_BATCH_SIZE]))
+
+        # Deleted or protected tweets aren't returned, and aren't asked for again
+        seen.update(parent_ids)
+        seen.update(tweet.id for tweet in found)
+        ancestors.extend(found)
+
+        parent_ids = missing_parents(found)
+
+    if parent_ids:
+        logging.info("Stopped {} conversations at the depth limit".format(len(parent_ids)))
+
+    return ancestors
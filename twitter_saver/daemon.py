@@ -0,0 +1,267 @@
+import logging
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from twitter_saver.api import ENDPOINTS, RateLimiter, ResponseCache, SharedApi, api_ttls, create_api
+from twitter_saver.configuration import Configuration
+from twitter_saver.media import MediaDownloader
+from twitter_saver.metrics import Metrics
+from twitter_saver.saver import Collector
+
+if TYPE_CHECKING:
+    import twitter
+
+# How much longer the interval gets after each poll that finds nothing, and
+# how much shorter after each poll that finds something
+BACKOFF = 2.0
+
+# The weight of the latest poll in the smoothed posting rate
+SMOOTHING = 0.3
+
+# The rate-limit family of the timeline endpoint, which every poll calls
+TIMELINE_ENDPOINT = ENDPOINTS["GetUserTimeline"]
+
+
+class PollSchedule:
+    """
+    How long to wait before polling one user's timeline again. The interval
+    follows the user's smoothed posting rate: it doubles after every poll
+    that finds nothing, and shrinks towards the average time between their
+    tweets while they are posting, within the configured bounds.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = BACKOFF):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        # Tweets a second, or None until there have been two polls
+        self.rate: Optional[float] = None
+        self.last_poll: Optional[float] = None
+
+    def record(self, now: float, new_tweets: int) -> float:
+        """
+        :param now: when the poll happened
+        :param new_tweets: the number of new tweets it found
+        :return: the time to wait before the next poll
+        """
+        if self.last_poll is not None:
+            observed = new_tweets / max(now - self.last_poll, 1.0)
+            self.rate = observed if self.rate is None \
+                else SMOOTHING * observed + (1 - SMOOTHING) * self.rate
+        self.last_poll = now
+
+        if new_tweets == 0:
+            self.interval *= self.backoff
+        elif self.rate:
+            self.interval = min(self.interval / self.backoff, 1 / self.rate)
+        else:
+            # The first poll only catches up on the tweets since the last run
+            self.interval = self.min_interval
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+        return self.interval
+
+
+def budget_interval(remaining: int, reset: float, calls: float, now: float) -> float:
+    """
+    The shortest time between polls that spreads the calls left in a
+    rate-limit window over the rest of the window
+    :param remaining: the calls left in the window
+    :param reset: when the window resets (seconds since the epoch, 0 if unknown)
+    :param calls: the calls that each poll makes
+    :param now: the current time
+    :return: the time to wait between polls, 0 if there is no need to wait
+    """
+    window = reset - now
+    if window <= 0:
+        return 0.0
+    if remaining < calls:
+        # Out of calls: wait for the window to reset
+        return window
+    return window * calls / remaining
+
+
+class CollectorDaemon:
+    """
+    Polls every configured user's timeline on their own schedule, keeping
+    each user's archive and the API client open between polls. Each page of
+    new tweets is committed as it arrives, so stopping between polls (or a
+    crash during one) loses nothing.
+
+    Each user's archive is opened, used and closed by its own worker thread,
+    as the SQLite connections can only be used by the thread that made them.
+    """
+
+    def __init__(self,
+                 conf: Configuration,
+                 client: "twitter.Api",
+                 clock: Callable[[], float] = time.time):
+        """
+        :param conf: the Configuration
+        :param client: the twitter.Api, kept for the life of the daemon
+        :param clock: gives the current time, in seconds since the epoch
+        """
+        self.conf = conf
+        self.client = client
+        self.clock = clock
+        self.accounts = [conf.for_account(screen_name) for screen_name in conf.screen_names]
+        self.schedules = {account.screen_name: PollSchedule(conf.poll_min_interval,
+                                                            conf.poll_max_interval)
+                          for account in self.accounts}
+        self.due = {account.screen_name: 0.0 for account in self.accounts}
+        self.polls = 0
+        # The rate-limit windows and the response cache outlive each poll's client
+        self.limiter = RateLimiter(clock)
+        self.cache = None if conf.api_cache_file is None else ResponseCache(conf.api_cache_file)
+        self._collectors: Dict[str, Collector] = {}
+        self._workers = {account.screen_name: ThreadPoolExecutor(max_workers=1)
+                         for account in self.accounts}
+        self._stop = threading.Event()
+
+    def stop(self, signum=None, frame=None) -> None:
+        """
+        Stops the daemon once the current poll has finished (usable as a signal handler)
+        """
+        if signum is not None:
+            logging.info("Received signal {}, stopping after the current poll"
+                         .format(signal.Signals(signum).name))
+        self._stop.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def close(self) -> None:
+        for screen_name, collector in list(self._collectors.items()):
+            self._workers[screen_name].submit(collector.close).result()
+            del self._collectors[screen_name]
+
+    def shutdown(self) -> None:
+        self.close()
+        for worker in self._workers.values():
+            worker.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+
+    def poll(self, downloader: MediaDownloader, profile: bool = False) -> Dict[str, int]:
+        """
+        Polls the users that are due, and schedules their next poll
+        :return: the number of new tweets found for each user that was polled
+        """
+        now = self.clock()
+        accounts = [account for account in self.accounts
+                    if self.due[account.screen_name] <= now]
+        if not accounts:
+            return {}
+
+        # Each poll gets its own metrics, and so its own status cache
+        metrics = Metrics("daemon", profile=profile or self.conf.profile)
+        api = SharedApi(self.client, metrics, self.limiter, self.cache, api_ttls(self.conf))
+
+        def collect(account: Configuration) -> int:
+            collector = self._collectors.get(account.screen_name)
+            if collector is None:
+                collector = self._collectors[account.screen_name] = Collector(account, metrics)
+            return collector.collect(api, downloader, metrics)
+
+        futures = {account.screen_name: self._workers[account.screen_name].submit(collect, account)
+                   for account in accounts}
+        found = {}
+        for screen_name, future in futures.items():
+            try:
+                found[screen_name] = future.result()
+            except Exception:
+                # The pages saved before the error are kept, and the poll is tried again later
+                logging.exception("The poll of {} failed".format(screen_name))
+                metrics.count("poll_errors")
+                found[screen_name] = 0
+        self.polls += 1
+
+        now = self.clock()
+        budget = self._budget(metrics, len(accounts), now)
+        for screen_name, new_tweets in found.items():
+            interval = self.schedules[screen_name].record(now, new_tweets)
+            if budget > interval:
+                logging.info("Polling {} in {:.0f}s to stay within the rate limit"
+                             .format(screen_name, budget))
+            self.due[screen_name] = now + max(interval, budget)
+            metrics.count("poll_interval.{}".format(screen_name), max(interval, budget))
+
+        logging.info("Found {} new tweets, next poll in {:.0f}s. Time spent: {}"
+                     .format(sum(found.values()), self.wait_time(), metrics.summary()))
+        if self.conf.metrics_path is not None:
+            metrics.save(self.conf.metrics_path, self.conf.prometheus_path)
+        return found
+
+    def _budget(self, metrics: Metrics, polled: int, now: float) -> float:
+        """
+        :return: the shortest interval between each user's polls that stays within the
+            timeline's rate limit, which every user's polls share
+        """
+        limit, remaining, reset = self.limiter.window(TIMELINE_ENDPOINT)
+        calls = max(metrics.counters.get("api_calls.GetUserTimeline", 0) / polled, 1.0)
+        interval = budget_interval(remaining, reset, calls, now)
+        if remaining < calls:
+            # Out of calls: every user waits for the same reset
+            return interval
+        # The calls left are spread over every user, but no user waits past the reset
+        return min(interval * len(self.accounts), max(reset - now, 0.0))
+
+    def wait_time(self) -> float:
+        """
+        :return: the time until the next user is due
+        """
+        return max(0.0, min(self.due.values()) - self.clock())
+
+    def run(self, max_polls: Optional[int] = None, profile: bool = False) -> int:
+        """
+        Polls until stopped
+        :param max_polls: stop after this many polls (None to run until stopped)
+        :param profile: whether to run the heavy stages under cProfile
+        :return: the number of new tweets found
+        """
+        total = 0
+        with MediaDownloader(workers=self.conf.download_workers) as downloader:
+            try:
+                while not self.stopped and (max_polls is None or self.polls < max_polls):
+                    total += sum(self.poll(downloader, profile).values())
+                    if max_polls is None or self.polls < max_polls:
+                        self._stop.wait(self.wait_time())
+            finally:
+                self.close()
+        return total
+
+
+def main(conf: Configuration, max_polls: Optional[int] = None, profile: bool = False) -> int:
+    """
+    Runs the collector daemon until it receives SIGINT or SIGTERM
+    :param conf: the Configuration
+    :param max_polls: stop after this many polls (None to run until stopped)
+    :param profile: whether to run the heavy stages under cProfile
+    :return: the number of new tweets found
+    """
+    daemon = CollectorDaemon(conf, create_api(conf))
+
+    signals = [signal.SIGINT, signal.SIGTERM]
+    handlers = {signum: signal.signal(signum, daemon.stop) for signum in signals}
+    logging.info("Collecting tweets for {} every {}s to {}s".format(
+        ", ".join(conf.screen_names), conf.poll_min_interval, conf.poll_max_interval))
+    try:
+        total = daemon.run(max_polls, profile)
+    finally:
+        daemon.shutdown()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+    logging.info("Stopped after {} polls, {} new tweets were found".format(daemon.polls, total))
+    return total
+
+
+if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
+
+    sys.exit(cli_main(["daemon"] + sys.argv[1:]))
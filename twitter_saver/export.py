@@ -0,0 +1,103 @@
+import gzip
+import json
+from typing import IO, Iterable, List, Optional, Tuple
+
+from twitter_saver.storage import TweetStore
+from twitter_saver.threads import index_threads, iter_threads
+from twitter_saver.timestamps import parse_date
+
+FORMATS = ["json", "ndjson"]
+
+
+def parse_since(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    :param value: a tweet ID, or a date (YYYY-MM-DD, or an ISO date and time, UTC if no
+                  timezone is given)
+    :return: (since_id, since_timestamp), one of which is None
+    """
+    if value is None:
+        return None, None
+    if value.isdigit():
+        return int(value), None
+    return None, parse_date(value)
+
+
+def open_output(path: str, compress: bool = False) -> IO[str]:
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def _indent(text: str, spaces: int) -> str:
+    return "\n".join(" " * spaces + line for line in text.split("\n"))
+
+
+def export_threads(store: TweetStore,
+                   f: IO[str],
+                   fmt: str = "ndjson",
+                   since: Optional[str] = None) -> int:
+    """
+    Writes the threads of a tweet database as they are produced, either as
+    one JSON object per line ('ndjson'), or as the pretty {"threads": [...]}
+    document ('json'). Each thread is {"id": <position>, "tweets": [...]};
+    NDJSON lines also carry the root tweet's ID, which doesn't change as
+    the archive grows.
+
+    :param store: the tweet database
+    :param f: where to write the threads
+    :param fmt: 'ndjson' or 'json'
+    :param since: only export the threads with a tweet newer than this tweet
+                  ID or date (see parse_since)
+    :return: the number of threads written
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown export format: {}".format(fmt))
+
+    keys = list(store.iter_keys())
+    thread_ids = index_threads(keys)
+    positions = list(range(1, len(thread_ids) + 1))
+
+    since_id, since_timestamp = parse_since(since)
+    if since_id is not None or since_timestamp is not None:
+        timestamps = {key[0]: key[2] for key in keys}
+
+        def is_changed(ids):
+            if since_id is not None:
+                return max(ids) > since_id
+            return max(timestamps[id] for id in ids) >= since_timestamp
+
+        changed = [i for i, ids in enumerate(thread_ids) if is_changed(ids)]
+        thread_ids = [thread_ids[i] for i in changed]
+        positions = [positions[i] for i in changed]
+    del keys
+
+    threads = zip(positions, thread_ids, iter_threads(store, thread_ids))
+    if fmt == "ndjson":
+        return _write_ndjson(f, threads)
+    return _write_json(f, threads)
+
+
+def _write_ndjson(f: IO[str], threads: Iterable[Tuple[int, List[int], list]]) -> int:
+    count = 0
+    for position, ids, thread in threads:
+        f.write(json.dumps({"id": position,
+                            "root_id": ids[0],
+                            "tweets": [tweet.to_dict() for tweet in thread]},
+                           sort_keys=True))
+        f.write("\n")
+        count += 1
+    return count
+
+
+def _write_json(f: IO[str], threads: Iterable[Tuple[int, List[int], list]]) -> int:
+    # The same output as a json.dump of the whole document with indent=4 and
+    # sort_keys, without holding it all in memory
+    f.write('{\n    "threads": [')
+    count = 0
+    for position, ids, thread in threads:
+        thread_dict = {"id": position, "tweets": [tweet.to_dict() for tweet in thread]}
+        f.write(",\n" if count else "\n")
+        f.write(_indent(json.dumps(thread_dict, indent=4, sort_keys=True), 8))
+        count += 1
+    f.write("\n    ]\n}" if count else "]\n}")
+    return count
@@ -0,0 +1,78 @@
+import logging
+import os
+import sys
+
+from twitter_saver.api import open_api
+from twitter_saver.configuration import Configuration
+from twitter_saver.media import MediaDownloader, MediaIndex
+from twitter_saver.metrics import Metrics
+from twitter_saver.storage import open_archive
+from twitter_saver.threads import index_threads, iter_threads
+from twitter_saver.users import UserDatabase
+from twitter_saver.website import SiteBuilder
+
+
+def main(conf: Configuration, profile: bool = False) -> str:
+    """
+    Publishes a user's threads as a static HTML site, in the site folder of their folder
+    :param conf: the Configuration for the user
+    :param profile: whether to run the heavy stages under cProfile
+    :return: the path of the site's index page
+    """
+    metrics = Metrics("site", profile=profile or conf.profile)
+
+    try:
+        store = open_archive(conf, create=False)
+        logging.info("Loaded tweet database")
+    except FileNotFoundError:
+        logging.error("Database not found!")
+        raise
+
+    with metrics.stage("threading", profile=True):
+        thread_ids = index_threads(store.iter_keys())
+    metrics.count("threads", len(thread_ids))
+
+    users = UserDatabase(os.path.join(conf.save_path, "users-db.json"),
+                         conf.profile_path,
+                         conf.settings.get("default_user_image"),
+                         conf.user_ttl_days)
+
+    # Look up every author up front, in batches
+    api = open_api(conf, metrics)
+    with metrics.stage("users"), MediaDownloader(workers=conf.download_workers) as downloader:
+        users.prefetch(api, store.authors(), downloader)
+    api.close()
+
+    media_index = MediaIndex(conf.media_path)
+
+    site = SiteBuilder(os.path.join(conf.save_path, "site"),
+                       "@{} tweet archive".format(conf.screen_name),
+                       users.get,
+                       media_index.dimensions,
+                       media_url="../media",
+                       page_threads=conf.site_page_threads,
+                       page_tweets=conf.site_page_tweets)
+
+    logging.info("Creating HTML site from threads")
+    with metrics.stage("render", profile=True):
+        # Every image of a tweet is shown together, so tweets aren't split by their media
+        pages = site.build(iter_threads(store, thread_ids, split_media_bool=False))
+
+    store.close()
+    media_index.save()
+
+    metrics.count("pages", pages)
+    metrics.count("site_files_written", site.written)
+    metrics.count("site_files_unchanged", site.unchanged)
+    if conf.metrics_path is not None:
+        metrics.save(conf.metrics_path, conf.prometheus_path)
+
+    index_file = os.path.join(site.path, "index.html")
+    logging.info("Finished creating the site: {}".format(index_file))
+    return index_file
+
+
+if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
+
+    sys.exit(cli_main(["html"] + sys.argv[1:]))
@@ -29,8 +29,3 @@ titleTeX = """
 \\end{{titlepage}}
 
 """
-
-tweetTeX = "\\tweet{{{}}}{{{}}}{{{}}}{{{}}}{{{}}}{{{}}}{{{}}}{{{}}}"
-mediaTeX = "\\tweetmedia{{{}}}"
-threadTeX = "\\threadline{{{}}}"
-ruleTeX = "\\threadrule\n"
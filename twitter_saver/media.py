@@ -0,0 +1,454 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+# Responses that are worth trying again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# The image files that print derivatives are made of
+PRINT_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+# Bytes read at a time when hashing a media file
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def _umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# The mode of a saved media file, as open() would give it. Files made by
+# mkstemp can only be read by their owner, which would hide them from a web
+# server running as another user.
+FILE_MODE = 0o666 & ~_umask()
+
+
+class DownloadSummary:
+    def __init__(self):
+        self.downloaded = 0
+        self.copied = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        rate = self.bytes / self.seconds / 1e6 if self.seconds > 0 else 0.0
+        return ("Downloaded {} files ({:.2f} MB) in {:.2f}s ({:.2f} MB/s), copied {}, "
+                "skipped {} already saved, {} failed".format(self.downloaded,
+                                                             self.bytes / 1e6,
+                                                             self.seconds,
+                                                             rate,
+                                                             self.copied,
+                                                             self.skipped,
+                                                             self.failed))
+
+    def add(self, field: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+
+class MediaDownloader:
+    """
+    Downloads media files over a pool of threads, which share one
+    keep-alive connection pool per host. Files already on disk are
+    skipped, and each file is written to a temporary file first, so
+    an interrupted download never leaves a partial file behind.
+
+    A downloader can be shared between several users' collections: a
+    url that was already saved to another path is copied from there.
+    """
+
+    def __init__(self,
+                 workers: int = 8,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 timeout: float = 30,
+                 on_saved: Optional[Callable[[str], None]] = None):
+        """
+        :param workers: the number of files to download at once
+        :param retries: how many times to retry a failed download
+        :param backoff: seconds to wait before the first retry, doubling each time
+        :param timeout: seconds to wait for the server to respond
+        :param on_saved: called with the path of each newly downloaded file
+        """
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.on_saved = on_saved
+
+        # url -> path of every file saved by this downloader
+        self._saved: Dict[str, str] = {}
+        self._saved_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def fetch(self, url: str, path: str) -> int:
+        """
+        Saves a single online media object to a specific location, retrying with
+        an exponential backoff on connection errors and server errors.
+        :param url: location of the media object
+        :param path: file to save the media object to
+        :return: the number of bytes saved
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return self._write(path, response.content)
+                error = requests.HTTPError("{} for url: {}".format(response.status_code, url))
+            except requests.HTTPError:
+                raise
+            except requests.RequestException as e:
+                error = e
+            if attempt < self.retries:
+                logging.debug("Retrying {} after: {}".format(url, error))
+                time.sleep(self.backoff * 2 ** attempt)
+        raise error
+
+    @staticmethod
+    def _write(path: str, content: bytes) -> int:
+        directory = os.path.dirname(path) or "."
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return len(content)
+
+    def _copy(self, url: str, path: str) -> bool:
+        with self._saved_lock:
+            source = self._saved.get(url)
+        if source is None or source == path or not os.path.exists(source):
+            return False
+        directory = os.path.dirname(path) or "."
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        os.close(fd)
+        shutil.copyfile(source, temp_path)
+        os.chmod(temp_path, FILE_MODE)
+        os.replace(temp_path, path)
+        return True
+
+    def _download(self,
+                  url: str,
+                  path: str,
+                  summary: DownloadSummary,
+                  on_saved: Optional[Callable[[str], None]],
+                  overwrite: bool) -> None:
+        if not overwrite and os.path.exists(path) and os.path.getsize(path) > 0:
+            summary.add("skipped")
+            return
+        try:
+            if self._copy(url, path):
+                summary.add("copied")
+            else:
+                summary.add("bytes", self.fetch(url, path))
+                summary.add("downloaded")
+            with self._saved_lock:
+                self._saved[url] = path
+            if on_saved is not None:
+                on_saved(path)
+        except (requests.RequestException, OSError) as e:
+            logging.warning("Could not download {}: {}".format(url, e))
+            summary.add("failed")
+
+    def download(self,
+                 jobs: Iterable[Tuple[str, str]],
+                 on_saved: Optional[Callable[[str], None]] = None,
+                 overwrite: bool = False) -> DownloadSummary:
+        """
+        Downloads every (url, path) pair that isn't already saved
+        :param jobs: the url of each media object, and the file to save it to
+        :param on_saved: replaces the downloader's on_saved callback for these files
+        :param overwrite: whether to download the files that are already saved again, replacing
+                          each one only once its new copy has been saved
+        :return: a summary of the files downloaded
+        """
+        on_saved = self.on_saved if on_saved is None else on_saved
+        summary = DownloadSummary()
+        start = time.perf_counter()
+
+        # The same file may be referenced by more than one tweet
+        jobs = dict((path, url) for url, path in jobs)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._download, url, path, summary, on_saved, overwrite)
+                       for path, url in jobs.items()]
+            # Download errors are counted as failures; anything else is a bug, and is raised
+            for future in futures:
+                future.result()
+
+        summary.seconds = time.perf_counter() - start
+        logging.info(summary)
+        return summary
+
+
+class MediaIndex:
+    """
+    A persistent record of the pixel dimensions of each media file, so they
+    can be looked up without opening the images. Entries are keyed by
+    filename, and are only trusted while the file's size and modification
+    time are unchanged.
+    """
+
+    def __init__(self, media_path: str, filename: str = "media-index.json"):
+        self.media_path = media_path
+        self.path = os.path.join(media_path, filename)
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.path, "r") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.save()
+
+    def add(self, path: str) -> Optional[Tuple[int, int]]:
+        """
+        Records the dimensions of a media file, reading only the image header
+        :param path: the media file, which must be inside the media path
+        :return: (width, height), or None if the file isn't an image
+        """
+        # Pillow is only imported once an image needs to be read
+        from PIL import Image
+
+        stat = os.stat(path)
+        try:
+            with Image.open(path) as img:
+                (width, height) = img.size
+        except OSError:
+            logging.warning("Could not read the dimensions of {}".format(path))
+            return None
+
+        with self._lock:
+            self._entries[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns,
+                                                     width, height]
+            self._dirty = True
+        return width, height
+
+    def dimensions(self, filename: str) -> Optional[Tuple[int, int]]:
+        """
+        :param filename: name of the file in the media path
+        :return: (width, height), or None if the file is missing or not an image
+        """
+        path = os.path.join(self.media_path, filename)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        entry = self._entries.get(filename)
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2], entry[3]
+        return self.add(path)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            fd, temp_path = tempfile.mkstemp(dir=self.media_path, suffix=".part")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_derivative(source: str, folder: str, width: int, quality: int) -> Tuple[str, str]:
+    """
+    Makes the print-sized copy of an image, unless one was already made from
+    the same content. Run in a worker process by PrintMedia.
+
+    :param source: the original image
+    :param folder: the folder of derivatives
+    :param width: the most pixels across
+    :param quality: the JPEG quality of the derivative
+    :return: the hash of the original, and the filename of the derivative in the
+             folder, or "" if the original should be used as it is
+    """
+    from PIL import Image
+
+    digest = _file_hash(source)
+    try:
+        with Image.open(source) as img:
+            if img.width <= width:
+                return digest, ""
+            height = max(1, round(img.height * width / img.width))
+            transparent = img.mode in ("RGBA", "LA") or \
+                (img.mode == "P" and "transparency" in img.info)
+            filename = "{}-{}-{}.{}".format(digest[:20], width, quality,
+                                            "png" if transparent else "jpg")
+            target = os.path.join(folder, filename)
+            if os.path.exists(target):
+                return digest, filename
+
+            # Only decode a large JPEG at the smallest scale that is still big enough
+            img.draft("RGB", (width, height))
+            img = img.convert("RGBA" if transparent else "RGB")
+            img = img.resize((width, height), Image.LANCZOS)
+
+            fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    if transparent:
+                        img.save(f, "PNG", optimize=True)
+                    else:
+                        img.save(f, "JPEG", quality=quality, optimize=True)
+                os.chmod(temp_path, FILE_MODE)
+                os.replace(temp_path, target)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            return digest, filename
+    except OSError as e:
+        logging.warning("Could not make a print copy of {}: {}".format(source, e))
+        return digest, ""
+
+
+class PrintMedia:
+    """
+    Downscaled, recompressed copies of the media images, sized for the
+    width they are printed at, which the LaTeX document includes instead of
+    the originals. Each copy is named after the hash of its original, so an
+    image is only processed once, and the hashes are only worked out again
+    for files whose size or modification time changed.
+    """
+
+    def __init__(self,
+                 media_path: str,
+                 width: int,
+                 quality: int = 85,
+                 folder: str = "print",
+                 filename: str = "print-index.json"):
+        """
+        :param media_path: the folder of the original media files
+        :param width: the most pixels across, for the print width and resolution
+        :param quality: the JPEG quality of the copies
+        :param folder: the folder of the copies, inside the media path
+        :param filename: the record of the originals' hashes, inside the media path
+        """
+        self.media_path = media_path
+        self.width = width
+        self.quality = quality
+        self.folder = folder
+        self.path = os.path.join(media_path, folder)
+        self.index_file = os.path.join(media_path, filename)
+        self.processed = 0
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(self.index_file, "r") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+
+    def _is_current(self, filename: str, stat: os.stat_result) -> bool:
+        entry = self._entries.get(filename)
+        return entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns] and \
+            entry[3] == [self.width, self.quality] and \
+            (entry[4] == "" or os.path.exists(os.path.join(self.path, entry[4])))
+
+    def update(self, executor: Optional[Executor] = None) -> int:
+        """
+        Makes the copies of any new or changed images in the media path, and
+        deletes the copies that are no longer used
+        :param executor: where to process the images (such as a ProcessPoolExecutor),
+                         or None to process them here
+        :return: the number of images processed
+        """
+        jobs: List[Tuple[str, os.stat_result]] = []
+        found = set()
+        with os.scandir(self.media_path) as entries:
+            for entry in entries:
+                if not entry.is_file() or \
+                        os.path.splitext(entry.name)[1].lower() not in PRINT_EXTENSIONS:
+                    continue
+                found.add(entry.name)
+                stat = entry.stat()
+                if not self._is_current(entry.name, stat):
+                    jobs.append((entry.name, stat))
+
+        paths = [os.path.join(self.media_path, name) for name, _ in jobs]
+        count = len(jobs)
+        if executor is None:
+            results = map(make_derivative, paths, [self.path] * count,
+                          [self.width] * count, [self.quality] * count)
+        else:
+            results = executor.map(make_derivative, paths, [self.path] * count,
+                                   [self.width] * count, [self.quality] * count)
+        for (name, stat), (digest, derivative) in zip(jobs, results):
+            self._entries[name] = [stat.st_size, stat.st_mtime_ns, digest,
+                                   [self.width, self.quality], derivative]
+
+        # Forget the originals that were removed, and the copies nothing uses
+        for name in set(self._entries) - found:
+            del self._entries[name]
+        used = {entry[4] for entry in self._entries.values()}
+        for name in os.listdir(self.path):
+            if name not in used:
+                os.remove(os.path.join(self.path, name))
+
+        fd, temp_path = tempfile.mkstemp(dir=self.media_path, suffix=".part")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(temp_path, self.index_file)
+
+        self.processed += count
+        return count
+
+    def file(self, filename: str) -> str:
+        """
+        :param filename: the name of an original media file
+        :return: the file to include instead, relative to the media path
+        """
+        entry = self._entries.get(filename)
+        if entry is None or not entry[4]:
+            return filename
+        return "{}/{}".format(self.folder, entry[4])
+
+    def files(self) -> Dict[str, str]:
+        """
+        :return: the file to include for each original that has a copy
+        """
+        return {filename: self.file(filename) for filename, entry in self._entries.items()
+                if entry[4]}
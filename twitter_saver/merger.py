@@ -1,48 +1,133 @@
-import argparse
+import hashlib
+import heapq
+import itertools
 import json
 import logging
 import os
-
-logging.basicConfig(level="INFO",
-                    format="%(asctime)s [%(levelname)s] %(message)s",
-                    datefmt='%Y-%m-%d %H:%M:%S'
-                    )
-
-
-def main(file1, file2, output):
-
-    with open(os.path.expanduser(file1), "r") as f:
-        jdb = json.load(f)
-        db_1 = jdb.get("tweets")
-
-    with open(os.path.expanduser(file2), "r") as f:
-        jdb = json.load(f)
-        db_2 = jdb.get("tweets")
-
-    # Union the two tweet databases
-    db_2_unique = [tweet for tweet in db_2 if tweet not in db_1]
-    merged_tweets = db_1 + db_2_unique
-
-    jdb = {"tweets": list(merged_tweets)}
-
-    with open(os.path.expanduser(output), "w") as f:
-        json.dump(jdb, f)
-
-    filename1 = str(file1).split('\\')[-1]
-    filename2 = str(file2).split('\\')[-1]
-
-    logging.info(f"Merged {len(db_1)} tweets in {filename1} "
-                 f"with {len(db_2_unique)} unique tweets in {filename2}.")
+import shutil
+import sys
+import tempfile
+from typing import Dict, Iterator, List, Tuple
+
+from twitter_saver.storage import iter_tweets, open_store, write_json_tweets
+
+# What to do when the same tweet ID has different content in two files
+CONFLICT_POLICIES = ["first", "last", "error"]
+
+# The number of tweets sorted in memory at a time
+RUN_SIZE = 100000
+
+
+def _write_runs(path: str, run_dir: str, run_size: int) -> List[str]:
+    """
+    Splits an archive into sorted runs on disk, newest first.
+    Each line of a run is: id <tab> content hash <tab> tweet JSON
+    """
+    runs = []
+    tweets = iter_tweets(path)
+    while True:
+        chunk = list(itertools.islice(tweets, run_size))
+        if not chunk:
+            return runs
+        chunk.sort(key=lambda tweet: tweet.get("id"), reverse=True)
+        run_file = os.path.join(run_dir, "run-{}.txt".format(len(os.listdir(run_dir))))
+        with open(run_file, "w") as f:
+            for tweet in chunk:
+                digest = hashlib.sha1(json.dumps(tweet, sort_keys=True).encode("utf-8"))
+                line = [str(tweet.get("id")), digest.hexdigest(), json.dumps(tweet)]
+                f.write("\t".join(line) + "\n")
+        runs.append(run_file)
+
+
+def _read_run(run_file: str, file_index: int) -> Iterator[Tuple[int, int, int, str, str]]:
+    with open(run_file, "r") as f:
+        for seq, line in enumerate(f):
+            tweet_id, digest, data = line.rstrip("\n").split("\t", 2)
+            yield -int(tweet_id), file_index, seq, digest, data
+
+
+def _merge_runs(runs: List[Tuple[str, int]],
+                stats: List[Dict[str, int]],
+                conflict: str) -> Iterator[dict]:
+    """
+    Merges the sorted runs of every file, yielding each tweet ID once, newest first.
+    Copies of a tweet are compared by a hash of their content.
+    """
+    merged = heapq.merge(*[_read_run(run_file, file_index) for run_file, file_index in runs])
+
+    for _, group in itertools.groupby(merged, key=lambda item: item[0]):
+        copies = list(group)
+        keep = copies[-1] if conflict == "last" else copies[0]
+
+        for copy in copies:
+            if copy is keep:
+                stats[copy[1]]["unique"] += 1
+                continue
+            stats[copy[1]]["duplicates"] += 1
+            if copy[3] != keep[3]:
+                if conflict == "error":
+                    raise ValueError("Tweet {} has different content in different files"
+                                     .format(-copy[0]))
+                stats[copy[1]]["conflicts"] += 1
+
+        yield json.loads(keep[4])
+
+
+def main(files: List[str], output: str, conflict: str = "first", run_size: int = RUN_SIZE):
+    """
+    Merges any number of tweet databases into one, sorted newest first. Tweets
+    are de-duplicated by ID, using an external sort so the inputs don't need
+    to fit in memory.
+
+    :param files: the databases to merge (.json, .db or .sqlite)
+    :param output: the database to write
+    :param conflict: which copy to keep when a tweet ID has different content:
+                     the one from the 'first' file listed, the 'last' one, or
+                     'error' to stop the merge
+    :param run_size: the number of tweets sorted in memory at a time
+    :return: per-file counts of tweets, unique tweets, duplicates and conflicts
+    """
+    if conflict not in CONFLICT_POLICIES:
+        raise ValueError("Unknown conflict policy: {}".format(conflict))
+
+    stats = [{"tweets": 0, "unique": 0, "duplicates": 0, "conflicts": 0} for _ in files]
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        runs = []
+        for file_index, path in enumerate(files):
+            runs.extend((run_file, file_index)
+                        for run_file in _write_runs(path, run_dir, run_size))
+
+        # Written next to the output and moved into place once the merge has finished, so a
+        # failed merge leaves any existing output as it was
+        root, extension = os.path.splitext(str(output))
+        temp_path = root + ".part" + extension
+        tweets = _merge_runs(runs, stats, conflict)
+        try:
+            if extension.lower() == ".json":
+                total = write_json_tweets(temp_path, tweets)
+            else:
+                if os.path.exists(output):
+                    # Tweets are added to an existing database
+                    shutil.copyfile(output, temp_path)
+                with open_store(temp_path) as store:
+                    total = store.add(tweets)
+            os.replace(temp_path, output)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    for path, file_stats in zip(files, stats):
+        file_stats["tweets"] = file_stats["unique"] + file_stats["duplicates"]
+        logging.info("{}: {tweets} tweets, {unique} unique, {duplicates} duplicates, "
+                     "{conflicts} conflicts".format(os.path.basename(str(path)), **file_stats))
+
+    logging.info("Merged {} files into {} tweets in {}.".format(len(files), total, output))
+
+    return dict(zip([str(path) for path in files], stats))
 
 
 if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
 
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument("--file1", "-f1", help="the first file to merge", type=str)
-    parser.add_argument("--file2", "-f2", help="the second file to merge", type=str)
-    parser.add_argument("--output", "-o", help="the name of the output file", type=str)
-
-    args = parser.parse_args()
-
-    main(args.file1, args.file2, args.output)
+    sys.exit(cli_main(["merge"] + sys.argv[1:]))
@@ -0,0 +1,138 @@
+import cProfile
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+# The start of the run in the names of its metrics and profile files, so runs don't overwrite
+# each other
+RUN_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+class Metrics:
+    """
+    Named stage timers and counters for one run of a script. Stages and
+    counters can be updated from several threads at once; the time of a
+    stage is the total over every thread that ran it.
+
+    With profiling switched on, the stages that ask for it are also run under
+    cProfile (one stage at a time), and each stage's statistics are saved to
+    its own .prof file.
+    """
+
+    def __init__(self, run: str, profile: bool = False):
+        self.run = run
+        self.profile = profile
+        self.started = time.time()
+        self.timers: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._profiling = threading.Lock()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, profile: bool = False) -> Iterator[None]:
+        """
+        Times the code run inside the block
+        :param name: the name of the stage
+        :param profile: whether to run the stage under cProfile, if profiling is on
+        """
+        profiler = None
+        if self.profile and profile and self._profiling.acquire(blocking=False):
+            with self._lock:
+                profiler = self._profiles.setdefault(name, cProfile.Profile())
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._profiling.release()
+            with self._lock:
+                timer = self.timers.setdefault(name, {"seconds": 0.0, "count": 0})
+                timer["seconds"] += seconds
+                timer["count"] += 1
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"run": self.run,
+                    "started": self.started,
+                    "seconds": time.time() - self.started,
+                    "stages": {name: dict(timer) for name, timer in self.timers.items()},
+                    "counters": dict(self.counters)}
+
+    def to_prometheus(self) -> str:
+        """
+        :return: the metrics in the Prometheus text exposition format
+        """
+        metrics = self.to_dict()
+        run = 'run="{}"'.format(self.run)
+        lines = ["# HELP twitter_saver_run_seconds The length of the last run",
+                 "# TYPE twitter_saver_run_seconds gauge",
+                 "twitter_saver_run_seconds{{{}}} {}".format(run, metrics["seconds"]),
+                 "# HELP twitter_saver_run_started_seconds When the last run started",
+                 "# TYPE twitter_saver_run_started_seconds gauge",
+                 "twitter_saver_run_started_seconds{{{}}} {}".format(run, metrics["started"]),
+                 "# HELP twitter_saver_stage_seconds The time spent in each stage of the last run",
+                 "# TYPE twitter_saver_stage_seconds gauge"]
+        for name, timer in sorted(metrics["stages"].items()):
+            lines.append('twitter_saver_stage_seconds{{{},stage="{}"}} {}'
+                         .format(run, name, timer["seconds"]))
+        lines.extend(["# HELP twitter_saver_stage_calls The number of times each stage ran",
+                      "# TYPE twitter_saver_stage_calls gauge"])
+        for name, timer in sorted(metrics["stages"].items()):
+            lines.append('twitter_saver_stage_calls{{{},stage="{}"}} {}'
+                         .format(run, name, timer["count"]))
+        lines.extend(["# HELP twitter_saver_count The counters of the last run",
+                      "# TYPE twitter_saver_count gauge"])
+        for name, value in sorted(metrics["counters"].items()):
+            lines.append('twitter_saver_count{{{},name="{}"}} {}'.format(run, name, value))
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str, prometheus_path: Optional[str] = None) -> None:
+        """
+        Writes metrics-<run>-<start>.json (and any cProfile statistics) to a folder,
+        and optionally twitter_saver_<run>.prom to a textfile collector folder, which
+        only keeps the latest run
+        :param path: the folder for the JSON metrics
+        :param prometheus_path: the textfile collector folder, or None
+        """
+        os.makedirs(path, exist_ok=True)
+        started = time.strftime(RUN_TIME_FORMAT, time.localtime(self.started))
+        _write(os.path.join(path, "metrics-{}-{}.json".format(self.run, started)),
+               json.dumps(self.to_dict(), indent=4, sort_keys=True))
+
+        for name, profiler in self._profiles.items():
+            profile_file = os.path.join(path, "{}-{}-{}.prof".format(self.run, name, started))
+            profiler.dump_stats(profile_file)
+            logging.info("Saved the profile of {} to {}".format(name, profile_file))
+
+        if prometheus_path is not None:
+            os.makedirs(prometheus_path, exist_ok=True)
+            _write(os.path.join(prometheus_path, "twitter_saver_{}.prom".format(self.run)),
+                   self.to_prometheus())
+
+    def summary(self) -> str:
+        """
+        :return: a one-line summary of the time spent in each stage
+        """
+        return ", ".join("{} {:.2f}s".format(name, timer["seconds"])
+                         for name, timer in self.to_dict()["stages"].items())
+
+
+def _write(path: str, text: str) -> None:
+    # Written to a temporary file first, so that nothing reads a half-written file
+    temp_path = path + ".part"
+    with open(temp_path, "w") as f:
+        f.write(text)
+    os.replace(temp_path, path)
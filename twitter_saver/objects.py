@@ -1,10 +1,17 @@
 import os
-import twitter
-from typing import List
+from typing import TYPE_CHECKING, List
 import urllib.request
 
+from twitter_saver.timestamps import tweet_epoch
+
+if TYPE_CHECKING:
+    import twitter
+
 
 class TwitterObject:
+    __slots__ = ("id",)
+    # Every field of the class, including those of its parents
+    FIELDS = frozenset(__slots__)
 
     def __init__(self, id: int):
         self.id = id
@@ -13,36 +20,35 @@ class TwitterObject:
         return self.id == other.id
 
     def from_dict(self, **entries) -> None:
-        self.__dict__.update(entries)
+        for (key, value) in entries.items():
+            setattr(self, key, value)
 
     @classmethod
     def new_from_json(cls, data, **kwargs):
         """ Create a new instance based on a JSON dict. Any kwargs should be
-        supplied by the inherited, calling class.
+        supplied by the inherited, calling class. Keys that aren't fields of
+        the class (such as a raw '_json' payload) are ignored.
 
         Args:
             data: A JSON dict, as converted from the JSON in the twitter API.
 
         """
 
-        json_data = data.copy()
-        json_data.pop("_json", None)
-        if kwargs:
-            for key, val in kwargs.items():
-                json_data[key] = val
-        c = cls(**json_data)
-        c._json = data
-        return c
+        json_data = {key: value for (key, value) in data.items() if key in cls.FIELDS}
+        json_data.update(kwargs)
+        return cls(**json_data)
 
 
 class MediaItem(TwitterObject):
+    __slots__ = ("url", "filename", "type")
+    FIELDS = TwitterObject.FIELDS.union(__slots__)
+
     def __init__(self,
                  id: int,
                  url: str,
                  filename: str,
                  type: str):
         super(MediaItem, self).__init__(id)
-        self.id = id
         self.url = url
         self.filename = filename
         self.type = type
@@ -60,8 +66,15 @@ class MediaItem(TwitterObject):
         """
         urllib.request.urlretrieve(self.url, os.path.join(media_path, self.filename))
 
+    def to_dict(self) -> dict:
+        return {"id": self.id, "url": self.url, "filename": self.filename, "type": self.type}
+
 
 class Tweet(TwitterObject):
+    __slots__ = ("created_at", "timestamp", "author", "in_reply_to", "in_reply_to_status_id",
+                 "text", "media")
+    FIELDS = TwitterObject.FIELDS.union(__slots__)
+
     def __init__(self,
                  id: int = None,
                  created_at: str = None,
@@ -69,24 +82,23 @@ class Tweet(TwitterObject):
                  in_reply_to: str = None,
                  in_reply_to_status_id: str = None,
                  text: str = None,
-                 media: List[MediaItem] = None):
+                 media: List[MediaItem] = None,
+                 timestamp: int = None):
         super(Tweet, self).__init__(id)
-        self.id = id
         self.created_at = created_at
+        # Seconds since the epoch (UTC), which older databases don't have
+        if timestamp is None and created_at is not None:
+            timestamp = tweet_epoch(created_at)
+        self.timestamp = timestamp
         self.author = author
         self.in_reply_to = in_reply_to
         self.in_reply_to_status_id = in_reply_to_status_id
         self.text = text
-        if media is not None:
-            if len(media) != 0:
-                if type(media[0]) == MediaItem:
-                    self.media = media
-                elif type(media[0]) == dict:
-                    self.media = [self.new_from_json(m) for m in media]
-            else:
-                self.media = media
-        else:
+        if media is None:
             self.media = []
+        else:
+            self.media = [MediaItem.new_from_json(m) if isinstance(m, dict) else m
+                          for m in media]
 
     def __repr__(self):
         return "Tweet(ID={tweet_id}, Author={author}, Text='{text}...')".format(
@@ -94,53 +106,44 @@ class Tweet(TwitterObject):
             author=self.author,
             text=self.text)
 
-    @classmethod
-    def new_from_json(cls, data, **kwargs):
-        """ Create a new instance based on a JSON dict.
-
-        Args:
-            data: A JSON dict, as converted from the JSON in the twitter API
-
-        Returns:
-            A twitter.Status instance
+    def with_media(self, media: List[MediaItem]) -> "Tweet":
         """
-        media = None
-
-        if 'media' in data.keys():
-            media = [MediaItem.new_from_json(m) for m in data['media']]
-
-        return super(cls, cls).new_from_json(data=data, media=media)
+        :return: a copy of the tweet, with a different list of media
+        """
+        return Tweet(id=self.id,
+                     created_at=self.created_at,
+                     author=self.author,
+                     in_reply_to=self.in_reply_to,
+                     in_reply_to_status_id=self.in_reply_to_status_id,
+                     text=self.text,
+                     media=media,
+                     timestamp=self.timestamp)
 
     def to_dict(self) -> dict:
         """
         Produces a dict object of the tweet for use in saving to a json database
         :return: dict object
         """
-
-        json_dict = {}
-
-        for (key, value) in self.__dict__.items():
-            if key == "media" and len(value) != 0:
-                media_list = []
-                for media in value:
-                    if isinstance(value[0], MediaItem):
-                        media_list.append(media.__dict__)
-                    else:
-                        media_list.append(media)
-                json_dict["media"] = media_list
-            else:
-                json_dict[key] = value
-
-        return json_dict
+        return {"id": self.id,
+                "created_at": self.created_at,
+                "timestamp": self.timestamp,
+                "author": self.author,
+                "in_reply_to": self.in_reply_to,
+                "in_reply_to_status_id": self.in_reply_to_status_id,
+                "text": self.text,
+                "media": [media.to_dict() for media in self.media]}
 
 
 class User(TwitterObject):
+    __slots__ = ("author", "screen_name", "profile_picture")
+    FIELDS = TwitterObject.FIELDS.union(__slots__)
+
     def __init__(self,
                  id: int,
                  author: str,
                  screen_name: str,
                  profile_picture: str):
-        super(TwitterObject, self).__init__(id)
+        super(User, self).__init__(id)
         self.author = author
         self.screen_name = screen_name
         self.profile_picture = profile_picture
@@ -150,8 +153,28 @@ class User(TwitterObject):
             user_id=self.id,
             author=self.author)
 
+    def to_dict(self) -> dict:
+        return {"id": self.id,
+                "author": self.author,
+                "screen_name": self.screen_name,
+                "profile_picture": self.profile_picture}
+
+
+def strip_raw_payload(data: dict) -> bool:
+    """
+    Removes the raw '_json' copies that older versions kept in each saved
+    tweet and media item.
+    :param data: a saved tweet dict, which is changed in place
+    :return: whether anything was removed
+    """
+    changed = data.pop("_json", None) is not None
+    for media in data.get("media") or []:
+        if isinstance(media, dict):
+            changed = (media.pop("_json", None) is not None) or changed
+    return changed
+
 
-def parse_tweet(tweet: twitter.Status) -> Tweet:
+def parse_tweet(tweet: "twitter.Status") -> Tweet:
     """
     Converts each tweet (Status object from python-twitter)
     into a simplified format, while grabbing all media items
@@ -181,4 +204,5 @@ def parse_tweet(tweet: twitter.Status) -> Tweet:
                  in_reply_to=tweet.in_reply_to_screen_name,
                  in_reply_to_status_id=tweet.in_reply_to_status_id,
                  text=text,
-                 media=media_list)
+                 media=media_list,
+                 timestamp=tweet.created_at_in_seconds)
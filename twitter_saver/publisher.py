@@ -1,153 +1,131 @@
-import argparse
-import json
+from concurrent.futures import ProcessPoolExecutor
 import logging
-import math
 import os
-from PIL import Image
 import shutil
-import twitter
+import sys
 import urllib.request
 
+from twitter_saver.api import open_api
 from twitter_saver.configuration import Configuration
-from twitter_saver.latex_functions import *
-from twitter_saver.objects import Tweet
-from twitter_saver.utils import create_threads, format_timestamp, clean_text
-
-parser = argparse.ArgumentParser()
-parser.add_argument("--configuration", "-c", help="the path to the config folder", type=str)
-parser.add_argument("--log", "-l", help="set the logging level", type=str, default="INFO")
-
-args = parser.parse_args()
-if args.configuration is None:
-    print(parser.format_help())
-    raise FileNotFoundError("You have not specified a configuration path")
-
-numeric_level = getattr(logging, args.log.upper(), None)
-if not isinstance(numeric_level, int):
-    raise ValueError("Invalid log level: {}".format(args.log))
-
-logging.basicConfig(level=numeric_level,
-                    format="%(asctime)s [%(levelname)s] %(message)s",
-                    datefmt='%Y-%m-%d %H:%M:%S'
-                    )
-
-yaml_conf = os.path.join(args.configuration, "configuration.yml")
-
-conf = Configuration(yaml_conf)
-
-db_file = os.path.join(conf.save_path, "tweets-db.json")
-user_db_file = os.path.join(conf.save_path, "users-db.json")
-
-# Get a copy of the twitter logo for LaTeX doc front page
-if not os.path.exists(os.path.join(conf.media_path, "twitter_logo.png")):
-    url = ("https://upload.wikimedia.org/wikipedia/en/thumb/9/9f/"
-           "Twitter_bird_logo_2012.svg/295px-Twitter_bird_logo_2012.svg.png")
-    urllib.request.urlretrieve(url, os.path.join(conf.media_path, "twitter_logo.png"))
-
-# Database file (JSON)
-try:
-    with open(db_file, "r") as f:
-        jdb = json.load(f)
+from twitter_saver.latex_functions import titleTeX
+from twitter_saver.media import MediaDownloader, MediaIndex, PrintMedia
+from twitter_saver.metrics import Metrics
+from twitter_saver.rendering import MEDIA_WIDTH_CM, FragmentCache
+from twitter_saver.storage import open_archive
+from twitter_saver.threads import index_threads, iter_threads
+from twitter_saver.users import UserDatabase
+from twitter_saver.utils import clean_text, format_timestamp
+
+# Bytes of LaTeX held in memory before each write to the file
+WRITE_BUFFER_SIZE = 1 << 20
+
+HEADER_FILE = os.path.join(os.path.dirname(__file__), "resources", "header.tex")
+
+
+def main(conf: Configuration, profile: bool = False) -> str:
+    """
+    Publishes a user's threads as a LaTeX document, tweets.tex in their folder
+    :param conf: the Configuration for the user
+    :param profile: whether to run the heavy stages under cProfile
+    :return: the path of the LaTeX document
+    """
+    user_db_file = os.path.join(conf.save_path, "users-db.json")
+
+    # Get a copy of the twitter logo for LaTeX doc front page
+    if not os.path.exists(os.path.join(conf.media_path, "twitter_logo.png")):
+        url = ("https://upload.wikimedia.org/wikipedia/en/thumb/9/9f/"
+               "Twitter_bird_logo_2012.svg/295px-Twitter_bird_logo_2012.svg.png")
+        urllib.request.urlretrieve(url, os.path.join(conf.media_path, "twitter_logo.png"))
+
+    metrics = Metrics("publish", profile=profile or conf.profile)
+
+    try:
+        store = open_archive(conf, create=False)
         logging.info("Loaded tweet database")
-except FileNotFoundError:
-    logging.error("Database not found!")
-    raise
-
-api = twitter.Api(consumer_key=conf.consumer_key,
-                  consumer_secret=conf.consumer_secret,
-                  access_token_key=conf.access_token,
-                  access_token_secret=conf.access_token_secret,
-                  tweet_mode="extended")
-
-all_tweets = []
-
-for j_tweet in jdb["tweets"]:
-    tweet = Tweet.new_from_json(j_tweet)
-    all_tweets.append(tweet)
-
-threads = create_threads(all_tweets)
-
-# Users Database file (JSON)
-try:
-    with open(user_db_file, "r") as f:
-        user_dict = json.load(f)
-        logging.info("Loaded user database")
-except FileNotFoundError:
-    user_dict = {}
-    logging.info("Creating new user database")
-
-
-def get_user_data(screen_name):
-    if screen_name not in user_dict:
-        logging.debug("Looking up profile info for user: {}".format(screen_name))
-        try:
-            user = api.GetUser(screen_name=screen_name, include_entities=True)
-        except twitter.error.TwitterError:
-            default = conf.settings.get("default_user_image")
-            user = twitter.User(screen_name=screen_name, profile_image_url=default)
-        profile_picture = "profile/{}.jpg".format(screen_name)
-
-        path = os.path.join(conf.profile_path, "{}.jpg".format(screen_name))
-        if not os.path.exists(path):
-            urllib.request.urlretrieve(user.profile_image_url, path)
-        user_dict[screen_name] = {}
-        user_dict[screen_name]["name"] = user.name
-        user_dict[screen_name]["profile_picture"] = profile_picture
-
-    return user_dict[screen_name]
-
-
-tex_file = os.path.join(conf.save_path, "tweets.tex")
-shutil.copyfile(os.path.join("twitter_saver", "resources", "header.tex"), tex_file)
-
-
-def calculate_margins(tweet):
-    text_margin = 0.7 + 0.5 * math.floor(len(tweet.text) / 82)
-    picture_margin = []
-    for img in tweet.media:
-        file_path = os.path.join(conf.media_path, img.filename)
-        if not os.path.exists(file_path):
-            logging.warning("File {} not found in media path!".format(file_path))
-        (width, height) = Image.open(file_path).size
-        picture_margin.append((12.5 / width) * height)
-    picture_margin = sum(picture_margin)
-    return text_margin + picture_margin
-
-
-with open(tex_file, "a") as f:
-    f.write(titleTeX.format(screenName=conf.screen_name,
-                            fromDate=format_timestamp(threads[0][0].created_at),
-                            toDate=format_timestamp(threads[-1][-1].created_at)))
-    logging.info("Creating LaTeX file from threads")
-    for thread in threads:
-        if "Mechanical" in thread[0].text:
-            print(thread[0])
-            print([t.id for t in thread])
-        f.write("% ---------------- THREAD ---------------\n")
-        for i, tweet in enumerate(thread):
-            # Don"t print a thread line for last tweet
-            if tweet == thread[-1]:
-                threadLine = ""
-            else:
-                modifier = "{0:.2f}".format(calculate_margins(tweet))
-                threadLine = threadTeX.format(modifier)
-            media_str = " ".join(mediaTeX.format(m.filename) for m in tweet.media) \
-                        + "\n\\vspace{10pt}\n"
-            f.write(tweetTeX.format(get_user_data(tweet.author).get("profile_picture"),
-                                    threadLine,
-                                    clean_text(get_user_data(tweet.author).get("name")),
-                                    "@" + clean_text(tweet.author),
-                                    format_timestamp(tweet.created_at),
-                                    clean_text(tweet.text),
-                                    media_str,
-                                    len(thread) - (i + 1)
-                                    ))
-            f.write("\n\n")  # Force a new line between each tweet
-        f.write(ruleTeX)
-        f.write("% ---------------------------------------\n\n")
-    f.write("\n\\end{document}")
-
-with open(user_db_file, "w") as f:
-    json.dump(user_dict, f)
-
-logging.info("Finished creating LaTeX file")
+    except FileNotFoundError:
+        logging.error("Database not found!")
+        raise
+
+    # Thread the tweets by ID only; each thread's tweets are read when it is rendered
+    with metrics.stage("threading", profile=True):
+        thread_ids = index_threads(store.iter_keys())
+    metrics.count("threads", len(thread_ids))
+
+    users = UserDatabase(user_db_file,
+                         conf.profile_path,
+                         conf.settings.get("default_user_image"),
+                         conf.user_ttl_days)
+
+    # Look up every author up front, in batches
+    api = open_api(conf, metrics)
+    with metrics.stage("users"), MediaDownloader(workers=conf.download_workers) as downloader:
+        users.prefetch(api, store.authors(), downloader)
+    api.close()
+
+    tex_file = os.path.join(conf.save_path, "tweets.tex")
+    shutil.copyfile(HEADER_FILE, tex_file)
+
+    first_tweet = store.get(thread_ids[0][0])
+    last_tweet = store.get(thread_ids[-1][-1])
+
+    media_index = MediaIndex(conf.media_path)
+    fragments = FragmentCache(os.path.join(conf.save_path, "fragments"))
+
+    def render_jobs():
+        # Each thread's tweets are read, and its users and media looked up, as it is reached
+        for thread in iter_threads(store, thread_ids):
+            thread_users = {tweet.author: users.get(tweet.author) for tweet in thread}
+            media = [m.filename for tweet in thread for m in tweet.media]
+            dimensions = {filename: media_index.dimensions(filename) for filename in media}
+            files = {} if print_media is None else \
+                {filename: print_media.file(filename) for filename in media}
+            yield thread, thread_users, dimensions, files
+
+    # The images are processed, and the threads that aren't cached are rendered,
+    # across several processes
+    executor = ProcessPoolExecutor(conf.render_workers) if conf.render_workers > 1 else None
+    print_media = None
+    try:
+        if conf.print_dpi:
+            print_media = PrintMedia(conf.media_path,
+                                     width=round(MEDIA_WIDTH_CM / 2.54 * conf.print_dpi),
+                                     quality=conf.print_quality)
+            logging.info("Making print copies of the images")
+            with metrics.stage("print_media"):
+                metrics.count("images_processed", print_media.update(executor))
+
+        # Fragments are collected in a large buffer, rather than written one at a time
+        with open(tex_file, "a", buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(titleTeX.format(screenName=clean_text(conf.screen_name),
+                                    fromDate=format_timestamp(first_tweet.get("timestamp")),
+                                    toDate=format_timestamp(last_tweet.get("timestamp"))))
+            logging.info("Creating LaTeX file from threads")
+
+            # The threads are written out in their original order
+            with metrics.stage("render", profile=True):
+                f.writelines(fragments.render_many(render_jobs(), executor))
+            f.write("\n\\end{document}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    store.close()
+    media_index.save()
+    fragments.prune()
+
+    metrics.count("fragments_rendered", fragments.misses)
+    metrics.count("fragments_reused", fragments.hits)
+
+    logging.info("Rendered {} new or changed threads, reused {}"
+                 .format(fragments.misses, fragments.hits))
+    logging.info("Time spent: {}".format(metrics.summary()))
+    if conf.metrics_path is not None:
+        metrics.save(conf.metrics_path, conf.prometheus_path)
+    logging.info("Finished creating LaTeX file")
+    return tex_file
+
+
+if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
+
+    sys.exit(cli_main(["publish"] + sys.argv[1:]))
@@ -0,0 +1,245 @@
+from concurrent.futures import Executor
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from twitter_saver.objects import Tweet
+from twitter_saver.timestamps import format_timestamp
+from twitter_saver.utils import clean_text
+
+# Change this whenever the LaTeX output changes, so cached fragments are rendered again
+RENDER_VERSION = 3
+
+# The width that media is printed at, in cm
+MEDIA_WIDTH_CM = 12.5
+
+THREAD_START = "% ---------------- THREAD ---------------\n"
+THREAD_END = "\\threadrule\n% ---------------------------------------\n\n"
+MEDIA_END = "\n\\vspace{10pt}\n"
+
+# The number of threads handed to a worker process at a time
+RENDER_CHUNK_SIZE = 16
+
+Dimensions = Dict[str, Optional[Tuple[int, int]]]
+
+# The file to include for a media file, where it isn't the original
+MediaFiles = Dict[str, str]
+
+# Everything needed to render a thread: (thread, users, dimensions, files), where
+# the files may be left out if every original is included
+RenderJob = Tuple[List[Tweet], Dict[str, dict], Dimensions, MediaFiles]
+
+
+def calculate_margins(tweet: Tweet, dimensions: Dimensions) -> float:
+    """
+    Works out the length of the thread line that joins a tweet to the next one
+    :param tweet: the tweet
+    :param dimensions: (width, height) of each media file, or None if it is missing
+    :return: the length of the line, in cm
+    """
+    text_margin = 0.7 + 0.5 * math.floor(len(tweet.text) / 82)
+    picture_margin = []
+    for img in tweet.media:
+        size = dimensions.get(img.filename)
+        if size is None:
+            logging.warning("File {} not found in media path!".format(img.filename))
+            continue
+        (width, height) = size
+        picture_margin.append((MEDIA_WIDTH_CM / width) * height)
+    picture_margin = sum(picture_margin)
+    return text_margin + picture_margin
+
+
+def render_thread(thread: List[Tweet],
+                  users: Dict[str, dict],
+                  dimensions: Dimensions,
+                  files: MediaFiles = None) -> str:
+    """
+    Renders one thread of tweets as a LaTeX fragment
+    :param thread: the tweets of the thread
+    :param users: the user data of each author in the thread
+    :param dimensions: (width, height) of each media file in the thread
+    :param files: the print-sized copy of each media file that has one
+    :return: the LaTeX fragment
+    """
+    files = files or {}
+    parts = [THREAD_START]
+    # The user fields are escaped once per author, rather than once per tweet
+    authors = {}
+    last_id = thread[-1].id
+    remaining = len(thread)
+    for tweet in thread:
+        remaining -= 1
+        # Don't print a thread line for last tweet
+        if tweet.id == last_id:
+            thread_line = ""
+        else:
+            thread_line = _thread_line(calculate_margins(tweet, dimensions))
+        author = authors.get(tweet.author)
+        if author is None:
+            user = users[tweet.author]
+            author = authors[tweet.author] = (user.get("profile_picture"),
+                                              clean_text(user.get("name")),
+                                              clean_text(tweet.author))
+        media = " ".join(["\\tweetmedia{" + files.get(m.filename, m.filename) + "}"
+                          for m in tweet.media]) + MEDIA_END
+        parts.append(_tweet(author[0], thread_line, author[1], author[2],
+                            _format_date(tweet.timestamp), clean_text(tweet.text), media,
+                            remaining))
+    parts.append(THREAD_END)
+    return "".join(parts)
+
+
+def _thread_line(margin: float) -> str:
+    return f"\\threadline{{{margin:.2f}}}"
+
+
+def _tweet(picture: str, thread_line: str, name: str, author: str, date: str, text: str,
+           media: str, remaining: int) -> str:
+    # Followed by a blank line, to force a new line between each tweet
+    return (f"\\tweet{{{picture}}}{{{thread_line}}}{{{name}}}{{@{author}}}{{{date}}}"
+            f"{{{text}}}{{{media}}}{{{remaining}}}\n\n")
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_day(day: int) -> str:
+    return format_timestamp(day * 86400)
+
+
+def _format_date(timestamp: int) -> str:
+    # Every tweet from the same (UTC) day has the same date
+    return _format_day(timestamp // 86400)
+
+
+def _render_job(job: RenderJob) -> str:
+    return render_thread(*job)
+
+
+def render_threads(jobs: List[RenderJob],
+                   executor: Executor = None,
+                   chunk_size: int = RENDER_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Renders threads, in order, spread over an executor (such as a
+    ProcessPoolExecutor) in chunks. The fragments are the same as those
+    of render_thread.
+    :param jobs: the thread, users, dimensions (and media files) of each thread
+    :param executor: where to render the threads, or None to render them here
+    :param chunk_size: the number of threads sent to a worker at a time
+    :return: the LaTeX fragment of each thread
+    """
+    if executor is None:
+        return map(_render_job, jobs)
+    return executor.map(_render_job, jobs, chunksize=chunk_size)
+
+
+def thread_key(thread: List[Tweet],
+               users: Dict[str, dict],
+               dimensions: Dimensions,
+               files: MediaFiles = None) -> str:
+    """
+    :return: a hash of everything that goes into rendering the thread
+    """
+    content = {
+        "version": RENDER_VERSION,
+        "tweets": [[t.id, t.timestamp, t.author, t.text, [m.filename for m in t.media]]
+                   for t in thread],
+        "users": {author: [users[author].get("name"), users[author].get("profile_picture")]
+                  for author in {t.author for t in thread}},
+        "dimensions": dimensions,
+        "files": files or {},
+    }
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FragmentCache:
+    """
+    Saves the rendered LaTeX of each thread, keyed by a hash of its content,
+    so that only new or changed threads are rendered on each publish.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, "{}.tex".format(key))
+
+    def get(self, key: str) -> Optional[str]:
+        self._used.add(key)
+        try:
+            with open(self._file(key), "r", encoding="utf-8") as f:
+                fragment = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return fragment
+
+    def put(self, key: str, fragment: str) -> None:
+        self._used.add(key)
+        temp_path = self._file(key) + ".part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(fragment)
+        os.replace(temp_path, self._file(key))
+
+    def render(self,
+               thread: List[Tweet],
+               users: Dict[str, dict],
+               dimensions: Dimensions,
+               files: MediaFiles = None) -> str:
+        """
+        Returns the thread's cached fragment, rendering it if there isn't one
+        """
+        key = thread_key(thread, users, dimensions, files)
+        fragment = self.get(key)
+        if fragment is None:
+            fragment = render_thread(thread, users, dimensions, files)
+            self.put(key, fragment)
+        return fragment
+
+    def render_many(self,
+                    jobs: Iterable[RenderJob],
+                    executor: Executor = None,
+                    chunk_size: int = RENDER_CHUNK_SIZE,
+                    batch_size: int = 1024) -> Iterator[str]:
+        """
+        Returns the fragment of each thread in order, like render, but renders
+        the threads that aren't cached over an executor, a batch at a time
+        :param jobs: the thread, users, dimensions (and media files) of each thread
+        :param executor: where to render the threads, or None to render them here
+        :param chunk_size: the number of threads sent to a worker at a time
+        :param batch_size: the number of threads read ahead of the output
+        """
+        jobs = iter(jobs)
+        while True:
+            batch = list(itertools.islice(jobs, batch_size))
+            if not batch:
+                return
+            keys = [thread_key(*job) for job in batch]
+            fragments = [self.get(key) for key in keys]
+            missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+            rendered = render_threads([batch[i] for i in missing], executor, chunk_size)
+            for i, fragment in zip(missing, rendered):
+                self.put(keys[i], fragment)
+                fragments[i] = fragment
+            yield from fragments
+
+    def prune(self) -> int:
+        """
+        Deletes the fragments of threads that weren't used since the cache was opened
+        :return: the number of fragments deleted
+        """
+        removed = 0
+        for filename in os.listdir(self.path):
+            if filename.endswith(".tex") and filename[:-4] not in self._used:
+                os.remove(os.path.join(self.path, filename))
+                removed += 1
+        return removed
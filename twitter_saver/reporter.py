@@ -0,0 +1,43 @@
+import json
+import logging
+import sys
+
+from twitter_saver.configuration import Configuration
+from twitter_saver.stats import ArchiveStats, rebuild_stats
+from twitter_saver.storage import open_archive
+
+
+def main(conf: Configuration, rebuild: bool = False, as_json: bool = False,
+         top: int = 10) -> ArchiveStats:
+    """
+    Prints the statistics of a user's archive
+    :param conf: the Configuration for the user
+    :param rebuild: whether to count every saved tweet again
+    :param as_json: whether to print the statistics as JSON
+    :param top: the number of repliers and busiest days to show
+    :return: the statistics
+    """
+    # The statistics are read from their summary file; the database is only opened to rebuild them
+    stats = None if rebuild else ArchiveStats.load(conf.stats_file)
+    if stats is None:
+        try:
+            store = open_archive(conf, create=False)
+        except FileNotFoundError:
+            logging.error("Database not found!")
+            raise
+        with store:
+            stats = rebuild_stats(store, conf.media_path)
+        stats.save(conf.stats_file)
+
+    if as_json:
+        print(json.dumps(stats.data, indent=4, sort_keys=True))
+    else:
+        print("Statistics for @{}".format(conf.screen_name))
+        print(stats.report(top))
+    return stats
+
+
+if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
+
+    sys.exit(cli_main(["stats"] + sys.argv[1:]))
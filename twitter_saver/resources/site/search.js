@@ -0,0 +1,85 @@
+// Searches the prebuilt index of the site. Each word is kept in a file named
+// after its first two characters, so only the files for the searched words are
+// fetched. The words are split in the same way as search.tokenize in
+// twitter_saver/search.py, so keep the two in sync.
+(function () {
+    "use strict";
+
+    var DOCS_SIZE = 1000;
+    var MAX_RESULTS = 100;
+
+    function tokenize(text) {
+        return text.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || [];
+    }
+
+    function shardName(token) {
+        return (token + "__").slice(0, 2).split("").map(function (c) {
+            return /[a-z0-9]/.test(c) ? c : "_";
+        }).join("");
+    }
+
+    var cache = {};
+
+    function fetchJson(url) {
+        if (!(url in cache)) {
+            cache[url] = fetch(url).then(function (response) {
+                return response.ok ? response.json() : {};
+            });
+        }
+        return cache[url];
+    }
+
+    function search(query) {
+        var tokens = Array.from(new Set(tokenize(query)));
+        if (tokens.length === 0) {
+            return Promise.resolve([]);
+        }
+        return Promise.all(tokens.map(function (token) {
+            return fetchJson("search/" + shardName(token) + ".json").then(function (shard) {
+                return shard[token] || [];
+            });
+        })).then(function (postings) {
+            // Threads with every word, in document order
+            postings.sort(function (a, b) { return a.length - b.length; });
+            return postings.slice(1).reduce(function (matches, positions) {
+                var found = new Set(positions);
+                return matches.filter(function (position) { return found.has(position); });
+            }, postings[0]);
+        });
+    }
+
+    function describe(position) {
+        var chunk = Math.floor(position / DOCS_SIZE);
+        return fetchJson("search/threads-" + chunk + ".json").then(function (docs) {
+            var doc = docs[position];
+            var item = document.createElement("li");
+            var link = document.createElement("a");
+            link.href = doc[0] + "#t" + position;
+            link.textContent = doc[1] + " @" + doc[2];
+            item.appendChild(link);
+            item.appendChild(document.createTextNode(" " + doc[3]));
+            return item;
+        });
+    }
+
+    var form = document.getElementById("search");
+    var results = document.getElementById("results");
+
+    form.addEventListener("submit", function (event) {
+        event.preventDefault();
+        search(form.elements.q.value).then(function (positions) {
+            return Promise.all(positions.slice(0, MAX_RESULTS).map(describe)).then(function (items) {
+                results.textContent = "";
+                if (items.length === 0) {
+                    results.textContent = "No tweets found.";
+                }
+                items.forEach(function (item) { results.appendChild(item); });
+                if (positions.length > MAX_RESULTS) {
+                    var more = document.createElement("li");
+                    more.textContent = (positions.length - MAX_RESULTS) + " more threads";
+                    results.appendChild(more);
+                }
+            });
+        });
+    });
+}());
@@ -1,106 +1,208 @@
-import argparse
-import json
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
 import sys
-import twitter
 
+from twitter_saver.api import SharedApi, open_api
 from twitter_saver.configuration import Configuration
+from twitter_saver.conversation import fetch_ancestors
+from twitter_saver.media import MediaDownloader, MediaIndex
+from twitter_saver.metrics import Metrics
 from twitter_saver.objects import parse_tweet
-
-parser = argparse.ArgumentParser()
-parser.add_argument("--configuration", "-c", help="the path to the config folder", type=str)
-parser.add_argument("--log", "-l", help="set the logging level", type=str, default="INFO")
-
-args = parser.parse_args()
-if args.configuration is None:
-    logging.warning(parser.format_help())
-    raise FileNotFoundError("You have not specified a configuration path")
-
-numeric_level = getattr(logging, args.log.upper(), None)
-if not isinstance(numeric_level, int):
-    raise ValueError("Invalid log level: {}".format(args.log))
-
-logging.basicConfig(level=numeric_level,
-                    format="%(asctime)s [%(levelname)s] %(message)s",
-                    datefmt='%Y-%m-%d %H:%M:%S'
-                    )
-
-yaml_conf = os.path.join(args.configuration, "configuration.yml")
-
-conf = Configuration(yaml_conf)
-
-logging.info("Grabbing all new tweets for user: {}".format(conf.screen_name))
-
-db_file = os.path.join(conf.save_path, "tweets-db.json")
-
-api = twitter.Api(consumer_key=conf.consumer_key,
-                  consumer_secret=conf.consumer_secret,
-                  access_token_key=conf.access_token,
-                  access_token_secret=conf.access_token_secret,
-                  tweet_mode="extended")
-
-# Database file (JSON)
-try:
-    with open(db_file, "r") as f:
-        jdb = json.load(f)
-        # Sort the database to get the last known tweet
-        db_tweet_ids = sorted([tweet.get("id") for tweet in jdb.get("tweets")])
-        last_found_tweet = str(db_tweet_ids[-1])
-except FileNotFoundError:
-    logging.warning("Database not found, creating new file...")
-    jdb = {"tweets": []}
-    last_found_tweet = None
-
-logging.info("Getting primary feed")
-
-feed = api.GetUserTimeline(screen_name=conf.screen_name,
-                           since_id=last_found_tweet,
-                           count=conf.max_tweets,
-                           include_rts=False)
-
-if len(feed) == 0:
-    logging.info("No new tweets were found.")
-    sys.exit(0)
-
-if last_found_tweet is not None:
-    logging.info("Found {} tweets since tweet.id = {}".format(len(feed), last_found_tweet))
-
-new_tweets = []
-reply_ids = []
-parsed_ids = []
-
-logging.info("Parsing tweets.")
-for tweet in feed:
-    new_tweets.append(parse_tweet(tweet))
-    reply_ids.append(tweet.in_reply_to_status_id)
-    parsed_ids.append(tweet.id)
-
-# Get a list of the parent tweets not already grabbed
-parent_ids = [id for id in reply_ids if id not in parsed_ids]
-parent_ids = list(filter(lambda x: x is not None, parent_ids))
-
-# Only run if we have extra tweets to collect
-if len(parent_ids) != 0:
-    logging.info("Getting tweets upstream from replies")
-    feed = api.GetStatuses(parent_ids)
-
-    logging.info("Found {} upstream tweets.".format(len(feed)))
-    for tweet in feed:
-        new_tweets.append(parse_tweet(tweet))
-
-logging.info("Downloading all media items")
-for tweet in new_tweets:
-    for media in tweet.media:
-        media.get_media(conf.media_path)
-
-sorted_tweets = sorted(new_tweets, key=lambda x: x.id, reverse=True)
-json_tweets = [tweet.to_dict() for tweet in sorted_tweets]
-
-jdb["tweets"] = json_tweets + jdb["tweets"]
-
-logging.info("Saving to database")
-with open(db_file, "w") as f:
-    json.dump(jdb, f)
-
-logging.info("Database now stands at {} captured tweets.".format(len(jdb["tweets"])))
+from twitter_saver.search import SearchIndex
+from twitter_saver.stats import ArchiveStats, rebuild_stats
+from twitter_saver.storage import open_archive
+from twitter_saver.threads import index_threads
+from twitter_saver.timeline import TimelineCheckpoint, fetch_timeline
+
+
+class Collector:
+    """
+    One user's archive, kept open between collections: the database, the
+    IDs already saved, the search index and the statistics. A single run
+    opens it once; the daemon keeps it open, so that each poll only pays for
+    the new tweets.
+    """
+
+    def __init__(self, account: Configuration, metrics: Metrics):
+        """
+        :param account: the Configuration for the user
+        :param metrics: where to record the time spent opening the archive
+        """
+        self.account = account
+
+        with metrics.stage("open_database"):
+            self.store = open_archive(account)
+            self.known_ids = self.store.ids()
+        self.search_index = None
+        if account.search_index:
+            with metrics.stage("search_index"):
+                self.search_index = SearchIndex(account.search_file)
+                # Catches up on tweets saved without the index, such as by a migration or a merge
+                indexed = self.search_index.update(self.store, self.known_ids)
+            if indexed:
+                logging.info("Added {} saved tweets to the search index".format(indexed))
+        with metrics.stage("stats"):
+            self.stats = ArchiveStats.load(account.stats_file)
+            if self.stats is None:
+                self.stats = rebuild_stats(self.store, account.media_path)
+                self.stats.save(account.stats_file)
+            elif self.stats.is_stale(len(self.known_ids)):
+                logging.warning("The statistics for {} have missed some tweets, run the stats "
+                                "command with --rebuild to count them again"
+                                .format(account.screen_name))
+        self.checkpoint = TimelineCheckpoint(os.path.join(account.save_path,
+                                                          "timeline-checkpoint.json"))
+
+    def close(self) -> None:
+        self.store.close()
+        if self.search_index is not None:
+            self.search_index.close()
+
+    def collect(self,
+                api: SharedApi,
+                downloader: MediaDownloader,
+                metrics: Metrics,
+                backfill: bool = False) -> int:
+        """
+        Collects all new tweets for the user, committing each page as it arrives
+        :param api: the API client, shared by every user's collection
+        :param downloader: the media downloader, shared by every user's collection
+        :param metrics: where to record the time spent in each stage
+        :param backfill: whether to page through the user's full timeline
+        :return: the number of new tweets found
+        """
+        account, store, known_ids, stats = self.account, self.store, self.known_ids, self.stats
+        logging.info("Grabbing all new tweets for user: {}".format(account.screen_name))
+
+        if backfill:
+            # Walk back through the whole timeline, keeping anything not already saved
+            last_found_tweet = None
+            logging.info("Backfilling the full timeline for {}".format(account.screen_name))
+        else:
+            last_found_tweet = store.max_id()
+            if last_found_tweet is None:
+                logging.warning("Database for {} is empty, collecting from the start of the "
+                                "timeline...".format(account.screen_name))
+
+        def save_page(feed):
+            """
+            Parses a page of the timeline, grabs the tweets it replies to and all
+            of the media, and commits them to the database.
+            """
+            logging.info("Parsing {} tweets.".format(len(feed)))
+            with metrics.stage("parse", profile=True):
+                new_tweets = [parse_tweet(tweet) for tweet in feed]
+
+            # Complete the conversations the tweets reply to, skipping anything already saved
+            with metrics.stage("ancestors", profile=True):
+                upstream = fetch_ancestors(api, feed, known_ids, account.max_conversation_depth)
+            if len(upstream) != 0:
+                logging.info("Found {} upstream tweets.".format(len(upstream)))
+                with metrics.stage("parse", profile=True):
+                    new_tweets.extend(parse_tweet(tweet) for tweet in upstream)
+            metrics.count("tweets_parsed", len(new_tweets))
+            metrics.count("upstream_tweets", len(upstream))
+
+            logging.info("Downloading all media items")
+            with metrics.stage("media"), MediaIndex(account.media_path) as media_index:
+                summary = downloader.download(((media.url,
+                                                os.path.join(account.media_path, media.filename))
+                                               for tweet in new_tweets for media in tweet.media),
+                                              on_saved=media_index.add)
+            for field in ["downloaded", "copied", "skipped", "failed", "bytes"]:
+                metrics.count("media_{}".format(field), getattr(summary, field))
+
+            logging.info("Saving to database")
+            with metrics.stage("database"):
+                sorted_tweets = sorted(new_tweets, key=lambda x: x.id, reverse=True)
+                json_tweets = [tweet.to_dict() for tweet in sorted_tweets]
+                metrics.count("tweets_saved", store.add(json_tweets))
+            with metrics.stage("stats"):
+                # Only the tweets saved for the first time are counted
+                new_tweets_by_id = {tweet["id"]: tweet for tweet in json_tweets
+                                    if tweet["id"] not in known_ids}
+                stats.add(new_tweets_by_id.values(), account.media_path)
+                stats.save(account.stats_file)
+            if self.search_index is not None:
+                with metrics.stage("search_index"):
+                    metrics.count("tweets_indexed", self.search_index.add(json_tweets))
+            known_ids.update(tweet.id for tweet in new_tweets)
+
+        logging.info("Getting primary feed")
+
+        total = fetch_timeline(api, account.screen_name, last_found_tweet, save_page,
+                               self.checkpoint, page_size=account.max_tweets)
+
+        if total > 0:
+            # New replies can join any thread, so the threads are counted again
+            with metrics.stage("stats", profile=True):
+                stats.set_threads(index_threads(store.iter_keys()))
+                stats.save(account.stats_file)
+
+        if total == 0:
+            logging.info("No new tweets were found for {}.".format(account.screen_name))
+        elif last_found_tweet is not None:
+            logging.info("Found {} tweets since tweet.id = {}".format(total, last_found_tweet))
+
+        logging.info("Database for {} now stands at {} captured tweets."
+                     .format(account.screen_name, len(store)))
+        return total
+
+
+def collect(account: Configuration,
+            api: SharedApi,
+            downloader: MediaDownloader,
+            metrics: Metrics,
+            backfill: bool = False) -> int:
+    """
+    Collects all new tweets for one user into their own database
+    :param account: the Configuration for the user
+    :param api: the API client, shared by every user's collection
+    :param downloader: the media downloader, shared by every user's collection
+    :param metrics: where to record the time spent in each stage
+    :param backfill: whether to page through the user's full timeline
+    :return: the number of new tweets found
+    """
+    collector = Collector(account, metrics)
+    try:
+        return collector.collect(api, downloader, metrics, backfill)
+    finally:
+        collector.close()
+
+
+def main(conf: Configuration, backfill: bool = False, profile: bool = False) -> int:
+    """
+    Collects all new tweets for every configured user, a few users at a time
+    :param conf: the Configuration
+    :param backfill: whether to page through each user's full timeline
+    :param profile: whether to run the heavy stages under cProfile
+    :return: the number of new tweets found
+    """
+    metrics = Metrics("collect", profile=profile or conf.profile)
+
+    # One client, status cache and downloader, shared by every user's collection
+    api = open_api(conf, metrics)
+    accounts = [conf.for_account(screen_name) for screen_name in conf.screen_names]
+
+    with MediaDownloader(workers=conf.download_workers) as downloader, \
+            ThreadPoolExecutor(max_workers=max(1, min(len(accounts),
+                                                      conf.account_workers))) as pool:
+        totals = list(pool.map(lambda account: collect(account, api, downloader, metrics,
+                                                       backfill),
+                               accounts))
+    api.close()
+
+    logging.info("Time spent: {}".format(metrics.summary()))
+    if conf.metrics_path is not None:
+        metrics.save(conf.metrics_path, conf.prometheus_path)
+
+    if sum(totals) == 0:
+        logging.info("No new tweets were found.")
+    return sum(totals)
+
+
+if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
+
+    sys.exit(cli_main(["collect"] + sys.argv[1:]))
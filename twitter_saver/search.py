@@ -0,0 +1,266 @@
+from array import array
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Set
+
+from twitter_saver.storage import TweetStore
+from twitter_saver.threads import WINDOW_DAYS, index_threads
+from twitter_saver.timestamps import parse_date, stamp_tweet
+
+# Change this whenever the way tweets are indexed changes, so the index is rebuilt
+INDEX_VERSION = 1
+
+# The number of IDs looked up per query
+BATCH_SIZE = 500
+
+_WORD = re.compile(r"\w+")
+_QUERY_PART = re.compile(r'(-?)(?:(\w+):)?(?:"([^"]*)"?|(\S+))')
+
+# The position of each word in a tweet, packed into a postings row
+_POSITIONS = "H"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into the lowercase words that are searched on.
+    The HTML site's search.js does the same in the browser.
+    """
+    return _WORD.findall(text.lower())
+
+
+class Query:
+    """
+    A parsed search: every word and phrase must be in the tweet, none of the
+    excluded ones may be, and the tweet must match the author and dates
+    """
+
+    def __init__(self,
+                 words: List[str] = None,
+                 phrases: List[List[str]] = None,
+                 excluded: List[List[str]] = None,
+                 authors: List[str] = None,
+                 since: Optional[int] = None,
+                 until: Optional[int] = None):
+        self.words = words or []
+        self.phrases = phrases or []
+        self.excluded = excluded or []
+        self.authors = authors or []
+        self.since = since
+        self.until = until
+
+    def __eq__(self, other):
+        return isinstance(other, Query) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return "Query({})".format(vars(self))
+
+    @property
+    def has_text(self) -> bool:
+        return bool(self.words or self.phrases)
+
+
+def parse_query(text: str) -> Query:
+    """
+    Parses a search, made up of any of:
+      word            tweets with the word
+      "two words"     tweets with the phrase
+      -word           tweets without the word (or -"two words")
+      from:name       tweets by the user (several are OR-ed)
+      since:date      tweets from the date on (YYYY-MM-DD, UTC)
+      until:date      tweets before the date
+    """
+    query = Query()
+    for match in _QUERY_PART.finditer(text):
+        negated, operator, phrase, word = match.groups()
+        value = phrase if phrase is not None else word
+        if operator == "from":
+            query.authors.append(value.lstrip("@").lower())
+        elif operator in ("since", "until"):
+            setattr(query, operator, parse_date(value))
+        else:
+            # An unknown operator is searched for as part of the text
+            tokens = tokenize(match.group(0) if operator else value)
+            if not tokens:
+                continue
+            if negated:
+                query.excluded.append(tokens)
+            elif len(tokens) == 1:
+                query.words.append(tokens[0])
+            else:
+                query.phrases.append(tokens)
+    return query
+
+
+class SearchIndex:
+    """
+    An on-disk inverted index of the tweets in an archive: for each word,
+    the tweets it appears in and where. Tweets are added as they are saved,
+    so searching never needs to read the archive itself.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            # Built by another version: start again, and let update() fill it
+            with self._conn:
+                self._conn.execute("DROP TABLE IF EXISTS postings")
+                self._conn.execute("DROP TABLE IF EXISTS tweets")
+                self._conn.execute("PRAGMA user_version = {}".format(INDEX_VERSION))
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS tweets "
+                               "(id INTEGER PRIMARY KEY, author TEXT, timestamp INTEGER)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tweets_author ON tweets (author)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tweets_timestamp "
+                               "ON tweets (timestamp)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS postings "
+                               "(term TEXT, tweet_id INTEGER, positions BLOB, "
+                               "PRIMARY KEY (term, tweet_id)) WITHOUT ROWID")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def ids(self) -> Set[int]:
+        return {row[0] for row in self._conn.execute("SELECT id FROM tweets")}
+
+    def add(self, tweets: Iterable[dict]) -> int:
+        """
+        Indexes tweets that are not already in the index
+        :param tweets: saved tweet dicts
+        :return: the number of tweets that were indexed
+        """
+        count = 0
+        with self._conn:
+            for tweet in tweets:
+                stamp_tweet(tweet)
+                cursor = self._conn.execute("INSERT OR IGNORE INTO tweets (id, author, timestamp) "
+                                            "VALUES (?, ?, ?)",
+                                            (tweet.get("id"), (tweet.get("author") or "").lower(),
+                                             tweet.get("timestamp")))
+                if cursor.rowcount == 0:
+                    continue
+                positions: Dict[str, array] = {}
+                for position, token in enumerate(tokenize(tweet.get("text") or "")):
+                    positions.setdefault(token, array(_POSITIONS)).append(min(position, 0xffff))
+                self._conn.executemany("INSERT INTO postings (term, tweet_id, positions) "
+                                       "VALUES (?, ?, ?)",
+                                       ((token, tweet.get("id"), found.tobytes())
+                                        for token, found in positions.items()))
+                count += 1
+        return count
+
+    def update(self, store: TweetStore, store_ids: Set[int] = None) -> int:
+        """
+        Indexes every tweet in the archive that is missing from the index
+        :param store: the tweet database
+        :param store_ids: the IDs in the database, if they are already known
+        :return: the number of tweets that were indexed
+        """
+        if store_ids is None:
+            store_ids = store.ids()
+        missing = sorted(store_ids - self.ids())
+        count = 0
+        for start in range(0, len(missing), BATCH_SIZE):
+            count += self.add(store.get_many(missing[start:start + BATCH_SIZE]).values())
+        return count
+
+    def _postings(self, term: str) -> Dict[int, bytes]:
+        return dict(self._conn.execute("SELECT tweet_id, positions FROM postings WHERE term = ?",
+                                       (term,)))
+
+    def _matching(self, tokens: List[str]) -> Set[int]:
+        """
+        :return: the tweets with the word, or with the words next to each other
+        """
+        if len(tokens) == 1:
+            return {row[0] for row in self._conn.execute(
+                "SELECT tweet_id FROM postings WHERE term = ?", (tokens[0],))}
+
+        postings = [self._postings(token) for token in tokens]
+        ids = set.intersection(*(set(found) for found in postings))
+        matches = set()
+        for tweet_id in ids:
+            positions = [set(array(_POSITIONS, found[tweet_id])) for found in postings]
+            if any(all(start + offset in positions[offset] for offset in range(1, len(tokens)))
+                   for start in positions[0]):
+                matches.add(tweet_id)
+        return matches
+
+    def search(self, query, limit: Optional[int] = None) -> List[int]:
+        """
+        :param query: a Query, or the text of one (see parse_query)
+        :param limit: the most tweets to return
+        :return: the IDs of the matching tweets, newest first
+        """
+        if isinstance(query, str):
+            query = parse_query(query)
+
+        ids = None
+        # Intersect the rarest words first, to keep the sets small
+        for tokens in sorted([[word] for word in query.words] + query.phrases,
+                             key=lambda tokens: self._document_count(tokens[0])):
+            matches = self._matching(tokens)
+            ids = matches if ids is None else ids & matches
+            if not ids:
+                return []
+
+        conditions, parameters = [], []
+        if query.authors:
+            conditions.append("author IN ({})".format(",".join("?" * len(query.authors))))
+            parameters.extend(query.authors)
+        if query.since is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append(query.since)
+        if query.until is not None:
+            conditions.append("timestamp < ?")
+            parameters.append(query.until)
+
+        if ids is None:
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            ids = {row[0] for row in self._conn.execute("SELECT id FROM tweets" + where,
+                                                        parameters)}
+        elif conditions:
+            ids = self._filter(sorted(ids), conditions, parameters)
+
+        for tokens in query.excluded:
+            ids -= self._matching(tokens)
+
+        return sorted(ids, reverse=True)[:limit]
+
+    def _document_count(self, term: str) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?",
+                                  (term,)).fetchone()[0]
+
+    def _filter(self, ids: List[int], conditions: List[str], parameters: list) -> Set[int]:
+        matches = set()
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            query = "SELECT id FROM tweets WHERE id IN ({}) AND {}".format(
+                ",".join("?" * len(batch)), " AND ".join(conditions))
+            matches.update(row[0] for row in self._conn.execute(query, batch + parameters))
+        return matches
+
+
+def matching_threads(store: TweetStore,
+                     tweet_ids: Iterable[int],
+                     window: int = WINDOW_DAYS) -> List[List[int]]:
+    """
+    Finds the threads that the matching tweets are part of, using only the
+    threading keys of the archive
+    :param store: the tweet database
+    :param tweet_ids: the IDs of the matching tweets
+    :param window: day period in which to look forward while filtering threads
+    :return: the threads, as from threads.index_threads, in order
+    """
+    wanted = set(tweet_ids)
+    return [ids for ids in index_threads(store.iter_keys(), window) if not wanted.isdisjoint(ids)]
@@ -0,0 +1,76 @@
+import logging
+import sys
+import time
+from typing import List
+
+from twitter_saver.configuration import Configuration
+from twitter_saver.search import SearchIndex, matching_threads, parse_query
+from twitter_saver.storage import open_archive
+from twitter_saver.threads import iter_threads
+from twitter_saver.timestamps import format_timestamp
+
+
+def print_tweet(tweet: dict, marker: str = " ") -> None:
+    print("{} {} @{} {}".format(marker, format_timestamp(tweet.get("timestamp")),
+                                tweet.get("author"), tweet.get("id")))
+    for line in (tweet.get("text") or "").splitlines():
+        print("    " + line)
+
+
+def main(conf: Configuration,
+         query: str,
+         limit: int = 50,
+         threads: bool = False,
+         update: bool = False) -> List[int]:
+    """
+    Searches a user's tweets using the search index, and prints the matches
+    :param conf: the Configuration for the user
+    :param query: the search (see search.parse_query)
+    :param limit: the most tweets to show
+    :param threads: whether to show the whole thread of each matching tweet
+    :param update: whether to first index any saved tweets that are missing from the index
+    :return: the IDs of the matching tweets, newest first
+    """
+    query = parse_query(query)
+    index = SearchIndex(conf.search_file)
+
+    store = None
+    if update or threads or len(index) == 0:
+        try:
+            store = open_archive(conf, create=False)
+        except FileNotFoundError:
+            logging.error("Database not found!")
+            raise
+
+    if store is not None and (update or len(index) == 0):
+        logging.info("Updating the search index")
+        logging.info("Indexed {} tweets".format(index.update(store)))
+
+    start = time.perf_counter()
+    ids = index.search(query, limit)
+    milliseconds = (time.perf_counter() - start) * 1000
+    logging.info("Found {} tweets in {:.1f} ms".format(len(ids), milliseconds))
+    index.close()
+
+    if threads:
+        found = set(ids)
+        for thread in iter_threads(store, matching_threads(store, found), split_media_bool=False):
+            print("-" * 40)
+            for tweet in thread:
+                print_tweet(tweet.to_dict(), "*" if tweet.id in found else " ")
+    elif ids:
+        if store is None:
+            store = open_archive(conf, create=False)
+        tweets = store.get_many(ids)
+        for tweet_id in ids:
+            print_tweet(tweets[tweet_id])
+
+    if store is not None:
+        store.close()
+    return ids
+
+
+if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
+
+    sys.exit(cli_main(["search"] + sys.argv[1:]))
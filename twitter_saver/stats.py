@@ -0,0 +1,191 @@
+import datetime
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+from twitter_saver.storage import TweetStore
+from twitter_saver.threads import index_threads
+from twitter_saver.timestamps import stamp_tweet
+
+# Change this whenever the summary changes, so it is rebuilt
+STATS_VERSION = 1
+
+# The thread lengths that are reported together
+THREAD_BUCKETS = [(1, 1), (2, 2), (3, 5), (6, 10), (11, 20), (21, None)]
+
+
+def _increment(counts: Dict[str, int], key: str, value: int = 1) -> None:
+    counts[key] = counts.get(key, 0) + value
+
+
+class ArchiveStats:
+    """
+    Running totals for an archive, kept in a small JSON summary file, so
+    they can be reported without reading the archive. Tweets are added as
+    they are saved; the thread lengths are worked out again from the
+    threading keys, as a new reply can extend any thread in the window.
+    """
+
+    def __init__(self, data: dict = None):
+        self.data = data or {"version": STATS_VERSION,
+                             "tweets": 0,
+                             "roots": 0,
+                             "replies": 0,
+                             "max_id": None,
+                             "first": None,
+                             "last": None,
+                             "days": {},
+                             "weeks": {},
+                             "months": {},
+                             "repliers": {},
+                             "media": {"items": 0, "bytes": 0, "missing": 0, "types": {}},
+                             "threads": {"count": 0, "lengths": {}}}
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ArchiveStats"]:
+        """
+        :return: the saved statistics, or None if there are none, or they need rebuilding
+        """
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get("version") != STATS_VERSION:
+            return None
+        return cls(data)
+
+    def save(self, path: str) -> None:
+        temp_path = path + ".part"
+        with open(temp_path, "w") as f:
+            json.dump(self.data, f, sort_keys=True)
+        os.replace(temp_path, path)
+
+    def add(self, tweets: Iterable[dict], media_path: Optional[str] = None) -> int:
+        """
+        Counts newly saved tweets. Each tweet must only be added once.
+        :param tweets: saved tweet dicts
+        :param media_path: where the media files are saved, to add up their sizes
+        :return: the number of tweets counted
+        """
+        data = self.data
+        media = data["media"]
+        count = 0
+        for tweet in tweets:
+            stamp_tweet(tweet)
+            timestamp = tweet.get("timestamp")
+            date = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+            _increment(data["days"], date.strftime("%Y-%m-%d"))
+            _increment(data["weeks"], date.strftime("%G-W%V"))
+            _increment(data["months"], date.strftime("%Y-%m"))
+            data["first"] = timestamp if data["first"] is None else min(data["first"], timestamp)
+            data["last"] = timestamp if data["last"] is None else max(data["last"], timestamp)
+            data["max_id"] = tweet.get("id") if data["max_id"] is None \
+                else max(data["max_id"], tweet.get("id"))
+
+            if tweet.get("in_reply_to_status_id") is None:
+                data["roots"] += 1
+            else:
+                data["replies"] += 1
+                _increment(data["repliers"], tweet.get("author"))
+
+            for item in tweet.get("media") or []:
+                media["items"] += 1
+                _increment(media["types"], item.get("type") or "unknown")
+                if media_path is not None:
+                    try:
+                        media["bytes"] += os.path.getsize(
+                            os.path.join(media_path, item.get("filename")))
+                    except OSError:
+                        media["missing"] += 1
+            count += 1
+        data["tweets"] += count
+        return count
+
+    def set_threads(self, thread_ids: List[List[int]]) -> None:
+        """
+        :param thread_ids: every thread of the archive, as from threads.index_threads
+        """
+        lengths: Dict[str, int] = {}
+        for ids in thread_ids:
+            _increment(lengths, str(len(ids)))
+        self.data["threads"] = {"count": len(thread_ids), "lengths": lengths}
+
+    def is_stale(self, tweets: int) -> bool:
+        """
+        :param tweets: the number of tweets in the archive
+        :return: whether the statistics have missed some of the tweets
+        """
+        return self.data["tweets"] != tweets
+
+    def report(self, top: int = 10, periods: int = 12) -> str:
+        """
+        :param top: the number of repliers and busiest days to list
+        :param periods: the number of recent weeks and months to list
+        :return: a plain text report of the statistics
+        """
+        data = self.data
+        lines = ["Tweets: {} ({} starting a conversation, {} replies)"
+                 .format(data["tweets"], data["roots"], data["replies"])]
+        if data["tweets"] == 0:
+            return "\n".join(lines)
+
+        first, last = (datetime.datetime.fromtimestamp(data[key], datetime.timezone.utc)
+                       for key in ["first", "last"])
+        days = (last.date() - first.date()).days + 1
+        lines.append("From {:%Y-%m-%d} to {:%Y-%m-%d}, {:.1f} tweets a day"
+                     .format(first, last, data["tweets"] / days))
+
+        lines.append("")
+        lines.append("Busiest days:")
+        lines.extend(_rows(sorted(data["days"].items(), key=lambda day: (-day[1], day[0]))[:top]))
+        lines.append("")
+        lines.append("Recent months:")
+        lines.extend(_rows(sorted(data["months"].items())[-periods:]))
+        lines.append("")
+        lines.append("Recent weeks:")
+        lines.extend(_rows(sorted(data["weeks"].items())[-periods:]))
+
+        lines.append("")
+        lines.append("Top repliers:")
+        lines.extend(_rows(sorted(data["repliers"].items(),
+                                  key=lambda author: (-author[1], author[0]))[:top]))
+
+        media = data["media"]
+        lines.append("")
+        types = ", ".join("{} {}".format(count, kind)
+                          for kind, count in sorted(media["types"].items()))
+        lines.append("Media: {} items ({}), {:.1f} MB, {} missing".format(
+            media["items"], types, media["bytes"] / 1e6, media["missing"]))
+
+        threads = data["threads"]
+        lengths = {int(length): count for length, count in threads["lengths"].items()}
+        lines.append("")
+        lines.append("Threads: {}, the longest has {} tweets"
+                     .format(threads["count"], max(lengths, default=0)))
+        for low, high in THREAD_BUCKETS:
+            label = str(low) if low == high else "{}+".format(low) if high is None \
+                else "{}-{}".format(low, high)
+            lines.append("  {:>8} tweets: {}".format(label, sum(
+                count for length, count in lengths.items()
+                if low <= length and (high is None or length <= high))))
+        return "\n".join(lines)
+
+
+def _rows(counts) -> List[str]:
+    return ["  {:>10}: {}".format(key, value) for key, value in counts]
+
+
+def rebuild_stats(store: TweetStore, media_path: Optional[str] = None) -> ArchiveStats:
+    """
+    Works out the statistics from scratch, streaming the tweets from the database
+    :param store: the tweet database
+    :param media_path: where the media files are saved
+    :return: the statistics
+    """
+    logging.info("Rebuilding the archive statistics")
+    stats = ArchiveStats()
+    stats.add(store, media_path)
+    stats.set_threads(index_threads(store.iter_keys()))
+    return stats
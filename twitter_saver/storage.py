@@ -0,0 +1,463 @@
+import abc
+import json
+import logging
+import os
+import sqlite3
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from twitter_saver.objects import strip_raw_payload
+from twitter_saver.timestamps import stamp_tweet
+
+# Characters read at a time when streaming a JSON database
+CHUNK_SIZE = 1 << 16
+
+# The number of tweets added to the new database at a time when migrating
+MIGRATE_BATCH_SIZE = 1000
+
+# The fields needed to thread a tweet: (id, in_reply_to_status_id, timestamp)
+TweetKey = Tuple[int, Optional[int], int]
+
+
+class TweetStore(abc.ABC):
+    """
+    Interface for the tweet database. Tweets are stored as the dicts
+    produced by Tweet.to_dict, and are keyed by their ID.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __contains__(self, tweet_id: int) -> bool:
+        return self.get(tweet_id) is not None
+
+    @abc.abstractmethod
+    def __iter__(self) -> Iterator[dict]:
+        """
+        Yields every tweet in the database, newest first
+        """
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abc.abstractmethod
+    def add(self, tweets: Iterable[dict]) -> int:
+        """
+        Inserts tweets that are not already in the database
+        :param tweets: tweet dicts, newest first
+        :return: the number of tweets that were inserted
+        """
+
+    def authors(self) -> Set[str]:
+        """
+        :return: the screen name of every author in the database
+        """
+        return {tweet.get("author") for tweet in self}
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get(self, tweet_id: int) -> Optional[dict]:
+        pass
+
+    def get_many(self, tweet_ids: List[int]) -> Dict[int, dict]:
+        """
+        :return: the tweets found for the given IDs, keyed by ID
+        """
+        tweets = ((tweet_id, self.get(tweet_id)) for tweet_id in tweet_ids)
+        return {tweet_id: tweet for tweet_id, tweet in tweets if tweet is not None}
+
+    @abc.abstractmethod
+    def ids(self) -> Set[int]:
+        pass
+
+    def iter_keys(self) -> Iterator[TweetKey]:
+        """
+        Yields just the fields needed to thread each tweet, newest first
+        """
+        for tweet in self:
+            stamp_tweet(tweet)
+            yield tweet.get("id"), tweet.get("in_reply_to_status_id"), tweet.get("timestamp")
+
+    @abc.abstractmethod
+    def max_id(self) -> Optional[int]:
+        """
+        :return: the ID of the newest tweet in the database
+        """
+
+
+class JsonTweetStore(TweetStore):
+    """
+    The original single-file database: {"tweets": [...]}, newest first.
+    Iterating over the tweets streams them from the file; anything else
+    (including looking up the tweets of each thread) loads the whole file,
+    which is then rewritten on closing. Use the SQLite backend to keep the
+    memory used bounded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._dirty = False
+        self.tweets = None
+
+    def _load(self) -> None:
+        if self.tweets is not None:
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.tweets = json.load(f).get("tweets")
+        except FileNotFoundError:
+            self.tweets = []
+        # Files saved by older versions are rewritten without the raw
+        # payloads, and with the epoch timestamps
+        for tweet in self.tweets:
+            if strip_raw_payload(tweet) | stamp_tweet(tweet):
+                self._dirty = True
+        self._index = {tweet.get("id"): tweet for tweet in self.tweets}
+        self._max_id = max(self._index, default=None)
+
+    def __iter__(self) -> Iterator[dict]:
+        if self.tweets is not None:
+            return iter(self.tweets)
+        if not os.path.exists(self.path):
+            return iter([])
+        return iter_json_tweets(self.path)
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self.tweets)
+
+    def add(self, tweets: Iterable[dict]) -> int:
+        self._load()
+        new_tweets = []
+        for tweet in tweets:
+            if tweet.get("id") not in self._index:
+                stamp_tweet(tweet)
+                self._index[tweet.get("id")] = tweet
+                new_tweets.append(tweet)
+        if new_tweets:
+            self.tweets = new_tweets + self.tweets
+            self._max_id = max(self._index)
+            self._dirty = True
+        return len(new_tweets)
+
+    def close(self) -> None:
+        if self._dirty:
+            with open(self.path, "w") as f:
+                json.dump({"tweets": self.tweets}, f)
+            self._dirty = False
+
+    def get(self, tweet_id: int) -> Optional[dict]:
+        self._load()
+        return self._index.get(tweet_id)
+
+    def ids(self) -> Set[int]:
+        self._load()
+        return set(self._index)
+
+    def max_id(self) -> Optional[int]:
+        self._load()
+        return self._max_id
+
+
+class SQLiteTweetStore(TweetStore):
+    """
+    An append-only database, indexed by tweet ID. New tweets are
+    inserted without reading or rewriting the existing ones. The fields
+    used for threading are kept in their own columns, so they can be
+    read without decoding every tweet.
+    """
+
+    SCHEMA_VERSION = 4
+
+    # The number of IDs looked up per query
+    BATCH_SIZE = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tweets "
+                           "(id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self._upgrade()
+
+    def _upgrade(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+
+        if self._conn.execute("SELECT 1 FROM tweets LIMIT 1").fetchone() is not None:
+            logging.info("Upgrading the tweet database {} from version {} to {}"
+                         .format(self.path, version, self.SCHEMA_VERSION))
+
+        with self._conn:
+            if version < 2:
+                self._add_columns([("in_reply_to_status_id", "INTEGER"),
+                                   ("created_at", "TEXT"),
+                                   ("author", "TEXT")])
+                self._update_rows(lambda tweet: self._columns(tweet)[1:4],
+                                  "in_reply_to_status_id = ?, created_at = ?, author = ?")
+            if version < 3:
+                self._update_rows(lambda tweet: (json.dumps(tweet),) if strip_raw_payload(tweet)
+                                  else None, "data = ?")
+            if version < 4:
+                self._add_columns([("timestamp", "INTEGER")])
+                self._update_rows(self._timestamp_columns, "data = ?, timestamp = ?")
+            self._conn.execute("PRAGMA user_version = {}".format(self.SCHEMA_VERSION))
+
+    def _add_columns(self, columns: List[Tuple[str, str]]) -> None:
+        """
+        :param columns: the (name, type) of each column to add, if it's not already there
+        """
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(tweets)")}
+        for column, column_type in columns:
+            if column not in existing:
+                self._conn.execute("ALTER TABLE tweets ADD COLUMN {} {}"
+                                   .format(column, column_type))
+
+    def _update_rows(self, columns: Callable[[dict], tuple], assignments: str) -> None:
+        """
+        Fills in columns for every existing tweet, a batch at a time
+        :param columns: gives the new column values for a tweet, or None to leave it as it is
+        :param assignments: the SQL SET clause for the columns
+        """
+        query = "UPDATE tweets SET {} WHERE id = ?".format(assignments)
+        last_id = None
+        while True:
+            rows = self._conn.execute("SELECT id, data FROM tweets WHERE ? IS NULL OR id > ? "
+                                      "ORDER BY id LIMIT ?",
+                                      (last_id, last_id, self.BATCH_SIZE)).fetchall()
+            if not rows:
+                return
+            updates = []
+            for tweet_id, data in rows:
+                values = columns(json.loads(data))
+                if values is not None:
+                    updates.append(values + (tweet_id,))
+            self._conn.executemany(query, updates)
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def _columns(tweet: dict) -> tuple:
+        return (tweet.get("id"),
+                tweet.get("in_reply_to_status_id"),
+                tweet.get("created_at"),
+                tweet.get("author"),
+                tweet.get("timestamp"))
+
+    @staticmethod
+    def _timestamp_columns(tweet: dict) -> tuple:
+        stamp_tweet(tweet)
+        return json.dumps(tweet), tweet.get("timestamp")
+
+    @classmethod
+    def _row(cls, tweet: dict) -> tuple:
+        stamp_tweet(tweet)
+        return cls._columns(tweet) + (json.dumps(tweet),)
+
+    def __contains__(self, tweet_id: int) -> bool:
+        cursor = self._conn.execute("SELECT 1 FROM tweets WHERE id = ?", (tweet_id,))
+        return cursor.fetchone() is not None
+
+    def __iter__(self) -> Iterator[dict]:
+        for (data,) in self._conn.execute("SELECT data FROM tweets ORDER BY id DESC"):
+            yield json.loads(data)
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+
+    def add(self, tweets: Iterable[dict]) -> int:
+        before = self._conn.total_changes
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO tweets (id, in_reply_to_status_id, "
+                                   "created_at, author, timestamp, data) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)",
+                                   (self._row(tweet) for tweet in tweets))
+        return self._conn.total_changes - before
+
+    def authors(self) -> Set[str]:
+        return {row[0] for row in self._conn.execute("SELECT DISTINCT author FROM tweets")}
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def get(self, tweet_id: int) -> Optional[dict]:
+        row = self._conn.execute("SELECT data FROM tweets WHERE id = ?", (tweet_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_many(self, tweet_ids: List[int]) -> Dict[int, dict]:
+        tweets = {}
+        for start in range(0, len(tweet_ids), self.BATCH_SIZE):
+            batch = tweet_ids[start:start + self.BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            query = "SELECT id, data FROM tweets WHERE id IN ({})".format(placeholders)
+            for tweet_id, data in self._conn.execute(query, batch):
+                tweets[tweet_id] = json.loads(data)
+        return tweets
+
+    def ids(self) -> Set[int]:
+        return {row[0] for row in self._conn.execute("SELECT id FROM tweets")}
+
+    def iter_keys(self) -> Iterator[TweetKey]:
+        return self._conn.execute("SELECT id, in_reply_to_status_id, timestamp FROM tweets "
+                                  "ORDER BY id DESC")
+
+    def max_id(self) -> Optional[int]:
+        # The id is the table's rowid, so SQLite reads this straight from the index
+        return self._conn.execute("SELECT MAX(id) FROM tweets").fetchone()[0]
+
+
+STORES = {
+    ".json": JsonTweetStore,
+    ".db": SQLiteTweetStore,
+    ".sqlite": SQLiteTweetStore,
+}
+
+
+def open_store(path: str) -> TweetStore:
+    """
+    Opens a tweet database, choosing the backend from the file extension
+    :param path: location of the database file
+    :return: the opened database
+    """
+    path = os.path.expanduser(str(path))
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in STORES:
+        raise ValueError("Unknown tweet database type: {}".format(path))
+    return STORES[extension](path)
+
+
+def iter_json_tweets(path: str) -> Iterator[dict]:
+    """
+    Streams the tweets out of a {"tweets": [...]} JSON database one at a time,
+    without loading the whole document into memory.
+    :param path: location of the JSON database
+    """
+    decoder = json.JSONDecoder()
+
+    with open(os.path.expanduser(str(path)), "r") as f:
+        buffer = ""
+        pos = -1
+        # Find the start of the list of tweets
+        while pos == -1:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            key = buffer.find('"tweets"')
+            if key != -1:
+                pos = buffer.find("[", key)
+        pos += 1
+
+        eof = False
+        while True:
+            # Skip over the separators between tweets
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                if pos == len(buffer):
+                    raise ValueError
+                tweet, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # The next tweet runs past the end of the buffer
+                if eof:
+                    raise ValueError("Unexpected end of file in {}".format(path))
+                chunk = f.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield tweet
+            pos = end
+
+
+def write_json_tweets(path: str, tweets: Iterable[dict]) -> int:
+    """
+    Writes tweets to a {"tweets": [...]} JSON database as they are produced
+    :param path: location of the JSON database
+    :param tweets: tweet dicts, in the order they should be saved
+    :return: the number of tweets written
+    """
+    count = 0
+    with open(os.path.expanduser(str(path)), "w") as f:
+        f.write('{"tweets": [')
+        for tweet in tweets:
+            if count:
+                f.write(", ")
+            f.write(json.dumps(tweet))
+            count += 1
+        f.write("]}")
+    return count
+
+
+def iter_tweets(path: str) -> Iterator[dict]:
+    """
+    Streams the tweets out of any database file
+    :param path: location of the database
+    """
+    if str(path).lower().endswith(".json"):
+        yield from iter_json_tweets(path)
+    else:
+        with open_store(path) as store:
+            yield from store
+
+
+def migrate_json(json_file: str, store: TweetStore) -> int:
+    """
+    Copies every tweet from an original tweets-db.json file into another
+    store, streaming them from the file in batches
+    :param json_file: path to the JSON database
+    :param store: the database to copy the tweets into
+    :return: the number of tweets copied
+    """
+    count = 0
+    batch = []
+    for tweet in iter_json_tweets(json_file):
+        strip_raw_payload(tweet)
+        batch.append(tweet)
+        if len(batch) == MIGRATE_BATCH_SIZE:
+            count += store.add(batch)
+            batch = []
+    return count + store.add(batch)
+
+
+def open_archive(conf, create: bool = True) -> TweetStore:
+    """
+    Opens the configured tweet database. The first time an SQLite database is
+    used, any existing tweets-db.json is migrated into it.
+    :param conf: the Configuration
+    :param create: whether to start a new database if none exists yet
+    :return: the opened database
+    """
+    json_file = os.path.join(conf.save_path, "tweets-db.json")
+    migrate = conf.db_file != json_file and \
+        not os.path.exists(conf.db_file) and os.path.exists(json_file)
+
+    if not create and not migrate and not os.path.exists(conf.db_file):
+        raise FileNotFoundError("Database not found: {}".format(conf.db_file))
+
+    if migrate:
+        # Migrated next to the database and moved into place once finished, so a run that is
+        # killed part way leaves no database behind, and the next run migrates again
+        root, extension = os.path.splitext(conf.db_file)
+        temp_path = root + ".part" + extension
+        # Along with the journal of any migration that was killed during a commit
+        for stale in (temp_path, temp_path + "-journal"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        logging.info("Migrating {} to {}".format(json_file, conf.db_file))
+        try:
+            with open_store(temp_path) as store:
+                count = migrate_json(json_file, store)
+            os.replace(temp_path, conf.db_file)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        logging.info("Migrated {} tweets".format(count))
+    return open_store(conf.db_file)
@@ -0,0 +1,133 @@
+import argparse
+import random
+import time
+from array import array
+from typing import List
+
+from twitter_saver.storage import open_store, write_json_tweets
+
+# 2019-01-01 00:00:00 UTC, when the synthetic timelines start
+START_EPOCH = 1546300800
+
+# Text that exercises the LaTeX escaping, along with ordinary words
+WORDS = ["the", "a", "thread", "reply", "tweet", "archive", "offline", "today", "and", "of",
+         "#hashtag", "@someone", "50%", "$5", "{braces}", "snake_case", "Q&A", "~tilde",
+         "^caret", "back\\slash", "https://t.co/abcdef", "🙂"]
+
+
+def generate_tweets(count: int,
+                    max_depth: int = 20,
+                    reply_rate: float = 0.6,
+                    branching: float = 0.1,
+                    out_of_order: float = 0.02,
+                    media_density: float = 0.2,
+                    authors: int = 3,
+                    seed: int = 0) -> List[dict]:
+    """
+    Generates a realistic archive of tweet dicts, in the format that is saved
+    to the database. The same arguments always produce the same archive.
+
+    :param count: the number of tweets
+    :param max_depth: the longest reply chain
+    :param reply_rate: the share of tweets that are replies
+    :param branching: the share of replies made to a recent tweet, rather than
+                      to the end of a conversation
+    :param out_of_order: the share of replies made to a tweet from any time
+                         before, usually far outside the threading window
+    :param media_density: the share of tweets with media (1 to 4 items)
+    :param authors: the number of different authors
+    :param seed: the random seed
+    :return: the tweets, newest first
+    """
+    rng = random.Random(seed)
+    names = ["author_{}".format(n) for n in range(authors)]
+
+    # The reply depth of each tweet, indexed by id - 1
+    depths = array("H")
+    # The tweets at the end of an open conversation
+    tails = []
+
+    tweets = []
+    epoch = START_EPOCH
+    for tweet_id in range(1, count + 1):
+        epoch += int(rng.expovariate(1 / 900)) + 1
+
+        parent = None
+        roll = rng.random()
+        if tweet_id > 1 and roll < reply_rate:
+            roll /= reply_rate
+            if roll < out_of_order:
+                parent = rng.randint(1, tweet_id - 1)
+            elif roll < out_of_order + branching or not tails:
+                parent = rng.randint(max(1, tweet_id - 500), tweet_id - 1)
+            else:
+                position = rng.randrange(len(tails))
+                parent = tails.pop(position)
+            if depths[parent - 1] >= max_depth:
+                parent = None
+
+        depths.append(0 if parent is None else depths[parent - 1] + 1)
+        tails.append(tweet_id)
+        if len(tails) > 64:
+            tails.pop(0)
+
+        media = []
+        if rng.random() < media_density:
+            for n in range(rng.randint(1, 4)):
+                filename = "{}_{}.jpg".format(tweet_id, n)
+                media.append({"id": tweet_id * 10 + n,
+                              "url": "https://pbs.twimg.com/media/" + filename,
+                              "filename": filename,
+                              "type": "photo"})
+
+        tweets.append({"id": tweet_id,
+                       "created_at": time.strftime("%a %b %d %H:%M:%S +0000 %Y",
+                                                   time.gmtime(epoch)),
+                       "timestamp": epoch,
+                       "author": rng.choice(names),
+                       "in_reply_to": None if parent is None else tweets[parent - 1]["author"],
+                       "in_reply_to_status_id": parent,
+                       "text": " ".join(rng.choices(WORDS, k=rng.randint(3, 45))),
+                       "media": media})
+
+    tweets.reverse()
+    return tweets
+
+
+def write_archive(path: str, tweets: List[dict]) -> int:
+    """
+    Saves generated tweets to a database file (.json, .db or .sqlite)
+    :return: the number of tweets written
+    """
+    if str(path).lower().endswith(".json"):
+        return write_json_tweets(path, tweets)
+    with open_store(path) as store:
+        return store.add(tweets)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("output", help="the database file to write", type=str)
+    parser.add_argument("--tweets", "-n", help="the number of tweets", type=int, default=10000)
+    parser.add_argument("--max-depth", help="the longest reply chain", type=int, default=20)
+    parser.add_argument("--reply-rate", help="the share of tweets that are replies",
+                        type=float, default=0.6)
+    parser.add_argument("--branching", help="the share of replies that branch a conversation",
+                        type=float, default=0.1)
+    parser.add_argument("--out-of-order", help="the share of replies to much older tweets",
+                        type=float, default=0.02)
+    parser.add_argument("--media-density", help="the share of tweets with media",
+                        type=float, default=0.2)
+    parser.add_argument("--seed", help="the random seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    write_archive(args.output, generate_tweets(args.tweets,
+                                               max_depth=args.max_depth,
+                                               reply_rate=args.reply_rate,
+                                               branching=args.branching,
+                                               out_of_order=args.out_of_order,
+                                               media_density=args.media_density,
+                                               seed=args.seed))
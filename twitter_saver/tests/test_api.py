@@ -0,0 +1,220 @@
+import threading
+import time
+
+import pytest
+from twitter import Status, User
+from twitter.error import TwitterError
+
+from twitter_saver.api import MAX_RETRIES, NO_USER_MATCHES, RATE_LIMIT_EXCEEDED, WINDOW_SECONDS, \
+    RateLimiter, RecordingApi, ReplayApi, ResponseCache, SharedApi
+from twitter_saver.metrics import Metrics
+from twitter_saver.objects import parse_tweet
+
+
+class FakeApi:
+    def __init__(self):
+        self.calls = []
+
+    def GetStatuses(self, status_ids):
+        self.calls.append(list(status_ids))
+        return [Status(id=i) for i in status_ids if i != 3]
+
+    def GetUserTimeline(self, screen_name):
+        return [Status(id=10), Status(id=11)]
+
+    def GetUser(self, screen_name):
+        return screen_name
+
+
+def test_shared_api_statuses():
+    fake = FakeApi()
+    api = SharedApi(fake)
+
+    assert [s.id for s in api.GetStatuses([1, 2, 3])] == [1, 2], "The wrong statuses were returned!"
+    assert [s.id for s in api.GetStatuses([2, 3, 4])] == [2, 4], "The wrong statuses were returned!"
+    assert fake.calls == [[1, 2, 3], [4]], "Statuses already looked up were requested again!"
+
+
+def test_shared_api_timeline():
+    fake = FakeApi()
+    api = SharedApi(fake)
+
+    api.GetUserTimeline(screen_name="user")
+
+    assert [s.id for s in api.GetStatuses([10, 11])] == [10, 11], "The statuses were not found!"
+    assert fake.calls == [], "Statuses from a timeline were requested again!"
+    assert api.GetUser(screen_name="user") == "user", "Other calls were not passed through!"
+
+
+def test_shared_api_metrics():
+    metrics = Metrics("test")
+    api = SharedApi(FakeApi(), metrics)
+
+    api.GetUserTimeline(screen_name="user")
+    api.GetStatuses([10, 1])
+    api.GetUser(screen_name="user")
+
+    assert metrics.counters == {"api_calls.GetUserTimeline": 1,
+                                "api_calls.GetStatuses": 1,
+                                "api_calls.GetUser": 1,
+                                "api_cache_hits": 1}, "The API calls were not counted!"
+    assert "api.GetStatuses" in metrics.timers, "The API calls were not timed!"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def new_status(id):
+    return Status.NewFromJsonDict({
+        "id": id, "full_text": "tweet {}".format(id), "user": {"screen_name": "user"},
+        "created_at": "Thu Mar 28 00:00:00 +0000 2019",
+        "extended_entities": {"media": [{"id": id, "type": "photo",
+                                         "media_url": "http://pbs/{}.jpg".format(id)}]}})
+
+
+class LimitedApi:
+    """
+    Refuses the first calls with a rate-limit error
+    """
+
+    def __init__(self, refusals):
+        self.refusals = refusals
+        self.calls = 0
+
+    def GetStatuses(self, status_ids):
+        self.calls += 1
+        if self.calls <= self.refusals:
+            raise TwitterError([{"code": RATE_LIMIT_EXCEEDED, "message": "Rate limit exceeded"}])
+        return [Status(id=i) for i in status_ids]
+
+
+def test_rate_limiter():
+    clock = Clock()
+    limiter = RateLimiter(clock, clock.sleep)
+    limiter.update("/statuses/lookup", 900, 2, clock.now + 300)
+
+    assert limiter.acquire("/statuses/lookup") == 0, "A free call was waited for!"
+    assert limiter.acquire("/statuses/lookup") == 0, "A free call was waited for!"
+    assert limiter.acquire("/statuses/lookup") == 300, "The window was not waited out!"
+    assert limiter.window("/statuses/lookup") == (900, 899, clock.now + WINDOW_SECONDS), \
+        "A new window was not started!"
+
+
+def test_shared_api_rate_limited():
+    clock = Clock()
+    api = SharedApi(LimitedApi(refusals=1), limiter=RateLimiter(clock, clock.sleep))
+
+    assert [s.id for s in api.GetStatuses([1, 2])] == [1, 2], "The refused call was not retried!"
+    assert clock.slept == [WINDOW_SECONDS], "The retry did not wait for the window to reset!"
+
+    api = SharedApi(LimitedApi(refusals=MAX_RETRIES + 1), limiter=RateLimiter(clock, clock.sleep))
+    with pytest.raises(TwitterError):
+        api.GetStatuses([1])
+
+
+def test_shared_api_coalescing():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowApi(FakeApi):
+        def GetStatuses(self, status_ids):
+            if not started.is_set():
+                started.set()
+                release.wait(5)
+            return super().GetStatuses(status_ids)
+
+    fake = SlowApi()
+    api = SharedApi(fake)
+    results = {}
+    first = threading.Thread(target=lambda: results.update(first=api.GetStatuses([1, 2])))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.update(second=api.GetStatuses([2, 4])))
+    second.start()
+    # The first lookup is still running when the second one is made
+    while not fake.calls:
+        time.sleep(0.01)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert sorted(fake.calls) == [[1, 2], [4]], "A status being looked up was requested again!"
+    assert [s.id for s in results["second"]] == [2, 4], "The waiting lookup missed a status!"
+
+
+def test_response_cache(tmpdir):
+    clock = Clock()
+    cache = ResponseCache(str(tmpdir.join("cache.sqlite")), clock)
+    fake = FakeApi()
+    fake.GetStatuses = lambda status_ids: fake.calls.append(list(status_ids)) or \
+        [new_status(i) for i in status_ids if i != 3]
+
+    SharedApi(fake, cache=cache).GetStatuses([1, 2, 3])
+    statuses = SharedApi(fake, cache=cache).GetStatuses([1, 2, 3, 4])
+
+    assert fake.calls == [[1, 2, 3], [4]], "Statuses saved by an earlier run were requested!"
+    assert [s.id for s in statuses] == [1, 2, 4], "The wrong statuses were returned!"
+    assert statuses[0].media[0].media_url == "http://pbs/1.jpg", "The media were not kept!"
+
+    clock.now += 100
+    SharedApi(fake, cache=cache, ttls={"status": 50, "user": 50}).GetStatuses([1])
+    assert fake.calls[-1] == [1], "An expired status was not looked up again!"
+    assert cache.prune("status", 50) == 3, "The expired statuses were not removed!"
+    cache.close()
+
+
+def test_response_cache_users(tmpdir):
+    cache = ResponseCache(str(tmpdir.join("cache.sqlite")))
+    calls = []
+
+    class UsersApi:
+        def UsersLookup(self, screen_name, include_entities=True):
+            calls.append(list(screen_name))
+            found = [User(screen_name=name, name=name.upper()) for name in screen_name
+                     if name != "gone"]
+            if not found:
+                raise TwitterError([{"code": NO_USER_MATCHES, "message": "No user matches"}])
+            return found
+
+    SharedApi(UsersApi(), cache=cache).UsersLookup(screen_name=["a", "B", "gone"])
+    users = SharedApi(UsersApi(), cache=cache).UsersLookup(screen_name=["a", "b", "gone", "c"])
+
+    assert calls == [["a", "B", "gone"], ["c"]], "Users saved by an earlier run were requested!"
+    assert sorted(user.name for user in users) == ["A", "B", "C"], "The wrong users were returned!"
+    assert SharedApi(UsersApi(), cache=cache).UsersLookup(screen_name=["gone"]) == [], \
+        "A missing user was not remembered!"
+    cache.close()
+
+
+def test_record_replay(tmpdir):
+    recording = str(tmpdir.join("recording.ndjson"))
+
+    class LiveApi:
+        def GetUserTimeline(self, screen_name, since_id=None):
+            return [new_status(2), new_status(1)]
+
+        def GetStatuses(self, status_ids):
+            raise TwitterError("Over capacity")
+
+    api = RecordingApi(LiveApi(), recording)
+    timeline = api.GetUserTimeline(screen_name="user", since_id=None)
+    with pytest.raises(TwitterError):
+        api.GetStatuses([5])
+
+    replay = ReplayApi(recording)
+    replayed = replay.GetUserTimeline(screen_name="user", since_id=None)
+    assert [parse_tweet(s).to_dict() for s in replayed] == \
+        [parse_tweet(s).to_dict() for s in timeline], "The timeline was not replayed!"
+    with pytest.raises(TwitterError):
+        replay.GetStatuses([5])
+    with pytest.raises(KeyError):
+        replay.GetUserTimeline(screen_name="someone", since_id=None)
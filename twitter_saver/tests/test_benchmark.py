@@ -0,0 +1,23 @@
+import json
+
+from twitter_saver import benchmark
+
+
+def test_main(tmpdir):
+    output = str(tmpdir.join("results.json"))
+
+    results = benchmark.main(tweets=300, output=output, repeat=1)
+
+    with open(output, "r") as f:
+        saved = json.load(f)
+
+    assert set(saved["results"]) == set(benchmark.BENCHMARKS), "Not every benchmark was run!"
+    assert all(result["seconds"] >= 0 and result["peak_bytes"] >= 0
+               for result in saved["results"].values()), "A result was not recorded!"
+    assert saved["parameters"]["tweets"] == 300, "The parameters were not saved!"
+
+    slower = {"results": {name: dict(result, seconds=result["seconds"] * 2)
+                          for name, result in results["results"].items()}}
+    assert benchmark.compare(slower, results) == list(benchmark.BENCHMARKS), \
+        "The regressions were not found!"
+    assert benchmark.compare(results, slower) == [], "A faster run was marked as a regression!"
@@ -0,0 +1,74 @@
+import json
+import subprocess
+import sys
+
+from twitter_saver import cli, export, merger
+from twitter_saver.storage import open_store
+from twitter_saver.tests.test_export import new_store
+
+
+def new_configuration(tmpdir):
+    tmpdir.join("configuration.yml").write(open("conf/configuration-defaults.yml").read()
+                                           .replace("save_path: .", "save_path: {}".format(tmpdir))
+                                           .replace("screen_name: ''", "screen_name: nobody"))
+    return str(tmpdir)
+
+
+def test_lazy_imports():
+    # A fresh interpreter, as the tests have already imported everything
+    code = ("import sys; from twitter_saver import cli; cli.create_parser(); "
+            "print([name for name in ['twitter', 'PIL', 'tqdm', 'requests', 'yaml'] "
+            "if name in sys.modules])")
+    loaded = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout.strip()
+
+    assert loaded == "[]", "A large library was imported before a command ran!"
+
+
+def test_library_imports():
+    # Importing the commands' modules must not run them
+    from twitter_saver import html_publisher, publisher, reporter, saver, searcher, threader
+
+    modules = [html_publisher, publisher, reporter, saver, searcher, threader]
+    assert all(callable(module.main) for module in modules), \
+        "A command could not be called from its module!"
+
+
+def test_choices():
+    actions = {action.dest: action for command in ["thread", "merge"]
+               for action in cli.create_parser()._subparsers._group_actions[0]
+               .choices[command]._actions}
+
+    assert actions["format"].choices == export.FORMATS, "The export formats did not match!"
+    assert actions["conflict"].choices == merger.CONFLICT_POLICIES, \
+        "The conflict policies did not match!"
+    assert actions["run_size"].default == merger.RUN_SIZE, "The run size did not match!"
+
+
+def test_commands(tmpdir, capsys):
+    configuration = new_configuration(tmpdir)
+    store = new_store(tmpdir.mkdir("nobody"))
+    count = len(store)
+    store.close()
+    tmpdir.join("nobody", "db.sqlite").rename(tmpdir.join("nobody", "tweets-db.sqlite"))
+
+    output = str(tmpdir.join("threads.ndjson"))
+    assert cli.main(["thread", "-c", configuration, "-f", "ndjson", "-o", output]) == 0, \
+        "The thread command failed!"
+    with open(output, "r") as f:
+        assert sum(len(json.loads(line)["tweets"]) for line in f) == count, \
+            "The threads were not written!"
+
+    merged = str(tmpdir.join("merged.sqlite"))
+    assert cli.main(["merge", str(tmpdir.join("nobody", "tweets-db.sqlite")), "-o", merged]) == 0
+    with open_store(merged) as store:
+        assert len(store) == count, "The databases were not merged!"
+
+    capsys.readouterr()
+    assert cli.main(["stats", "-c", configuration]) == 0, "The stats command failed!"
+    assert "Tweets: {}".format(count) in capsys.readouterr().out, "The statistics were not shown!"
+
+    assert cli.main(["search", "-c", configuration, "from:nobody", "-n", "2"]) == 0
+    assert capsys.readouterr().out.count("@nobody") == 2, "The search results were not shown!"
+
+    assert cli.main([]) == 2, "Running without a command did not fail!"
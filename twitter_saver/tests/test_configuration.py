@@ -6,3 +6,19 @@ def test_configuration():
 
     assert type(conf.screen_name) == str, "The param: screen_name was not a string!"
     assert type(conf.max_tweets) == int, "The param: max_tweets was not an int!"
+
+
+def test_configuration_accounts(tmpdir):
+    config_file = tmpdir.join("configuration.yml")
+    config_file.write(open("conf/configuration-defaults.yml").read()
+                      .replace("save_path: .", "save_path: {}".format(tmpdir))
+                      .replace("screen_name: ''", "screen_name: [first, second]"))
+
+    conf = Configuration(str(config_file))
+    account = conf.for_account("second")
+
+    assert conf.screen_names == ["first", "second"], "The list of users was not read!"
+    assert conf.screen_name == "first", "The first user was not the default!"
+    assert account.save_path == str(tmpdir.join("second")), "The user's path was not correct!"
+    assert account.db_file.startswith(account.save_path), "The database was not the user's own!"
+    assert conf.save_path == str(tmpdir.join("first")), "The original paths were changed!"
@@ -0,0 +1,51 @@
+from twitter import Status
+
+from twitter_saver.conversation import fetch_ancestors
+
+
+class FakeApi:
+    """
+    Serves a conversation where each tweet n replies to tweet n - 1,
+    starting from tweet 1. Tweet 150 has been deleted.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def GetStatuses(self, status_ids):
+        self.calls.append(list(status_ids))
+        return [Status(id=i, in_reply_to_status_id=i - 1 if i > 1 else None)
+                for i in status_ids if i != 150]
+
+
+def test_fetch_ancestors():
+    api = FakeApi()
+    tweets = [Status(id=1000 + i, in_reply_to_status_id=i) for i in range(1, 251)]
+
+    ancestors = fetch_ancestors(api, tweets, known_ids={3})
+
+    assert [len(call) for call in api.calls] == [100, 100, 49], \
+        "The missing parents were not looked up in batches!"
+    expected = [1, 2] + list(range(4, 150)) + list(range(151, 251))
+    assert sorted(t.id for t in ancestors) == expected, "The wrong ancestors were returned!"
+
+
+def test_fetch_ancestors_depth():
+    api = FakeApi()
+    tweets = [Status(id=100, in_reply_to_status_id=99)]
+
+    ancestors = fetch_ancestors(api, tweets, known_ids=set(), max_depth=5)
+
+    assert [t.id for t in ancestors] == [99, 98, 97, 96, 95], \
+        "The conversation was not walked up to the depth limit!"
+    assert api.calls == [[99], [98], [97], [96], [95]], "The calls were not one per level!"
+
+
+def test_fetch_ancestors_known():
+    api = FakeApi()
+    tweets = [Status(id=10, in_reply_to_status_id=9), Status(id=9, in_reply_to_status_id=8)]
+
+    ancestors = fetch_ancestors(api, tweets, known_ids={7})
+
+    assert [t.id for t in ancestors] == [8], "The chain did not stop at a saved tweet!"
+    assert api.calls == [[8]], "Tweets in the same batch or already saved were looked up!"
@@ -0,0 +1,161 @@
+import os
+import signal
+
+import pytest
+
+from twitter import Status, User
+from twitter.ratelimit import EndpointRateLimit
+
+from twitter_saver.configuration import Configuration
+from twitter_saver.daemon import CollectorDaemon, PollSchedule, budget_interval
+from twitter_saver.storage import open_archive
+from twitter_saver.tests.test_cli import new_configuration
+
+
+class FakeRateLimit:
+    def __init__(self, remaining, reset):
+        self.limit = EndpointRateLimit(900, remaining, reset)
+
+    def get_limit(self, url):
+        return self.limit
+
+
+class FakeApi:
+    """
+    Serves a timeline that the tests add tweets to between polls
+    """
+
+    def __init__(self, remaining=900, reset=0):
+        self.timeline = []
+        self.calls = 0
+        self.rate_limit = FakeRateLimit(remaining, reset)
+
+    def post(self, *ids):
+        self.timeline = [Status(id=i, full_text="tweet {}".format(i),
+                                created_at="Thu Mar 28 00:00:00 +0000 2019",
+                                user=User(screen_name="nobody"))
+                         for i in sorted(ids, reverse=True)] + self.timeline
+
+    def GetUserTimeline(self, screen_name, since_id=None, max_id=None, count=20,
+                        include_rts=True):
+        self.calls += 1
+        limit = self.rate_limit.limit
+        self.rate_limit.limit = limit._replace(remaining=max(limit.remaining - 1, 0))
+        tweets = [t for t in self.timeline
+                  if (since_id is None or t.id > since_id) and (max_id is None or t.id <= max_id)]
+        return tweets[:count]
+
+    def GetStatuses(self, ids):
+        return []
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_schedule():
+    schedule = PollSchedule(60, 3600)
+
+    assert schedule.record(0, 5) == 60, "A first poll with tweets did not keep the shortest time!"
+    assert schedule.record(60, 0) == 120, "A quiet poll did not back off!"
+    assert schedule.record(180, 0) == 240, "A quiet poll did not back off!"
+    for poll in range(10):
+        interval = schedule.record(1000 + poll * 10000, 0)
+    assert interval == 3600, "The interval was longer than the longest time!"
+
+    interval = schedule.record(200000, 1)
+    assert interval == 1800, "A poll with new tweets did not shorten the interval!"
+    now = 200000
+    for poll in range(20):
+        now += interval
+        interval = schedule.record(now, 10)
+    assert interval == 60, "A busy user was not polled as often as possible!"
+
+
+def test_budget_interval():
+    assert budget_interval(900, 0, 1, 100) == 0, "An unknown window was waited for!"
+    assert budget_interval(10, 400, 2, 100) == 60, "The calls were not spread over the window!"
+    assert budget_interval(1, 400, 2, 100) == 300, "An empty window was not waited out!"
+
+
+def test_daemon(tmpdir):
+    conf = Configuration(os.path.join(new_configuration(tmpdir), "configuration.yml"))
+    api = FakeApi()
+    clock = Clock()
+    daemon = CollectorDaemon(conf, api, clock)
+
+    api.post(1, 2, 3)
+    assert daemon.run(max_polls=1) == 3, "The first poll did not catch up!"
+    assert daemon.due["nobody"] == clock.now + 60, "The next poll was not scheduled!"
+
+    clock.now += 60
+    assert daemon.run(max_polls=2) == 0, "Tweets were found twice!"
+    assert daemon.due["nobody"] == clock.now + 120, "The daemon did not back off!"
+
+    api.post(4, 5)
+    clock.now += 120
+    assert daemon.run(max_polls=3) == 2, "The new tweets were not found!"
+    with open_archive(conf.for_account("nobody"), create=False) as store:
+        assert sorted(store.ids()) == [1, 2, 3, 4, 5], "The new tweets were not saved!"
+    assert not daemon._collectors, "The archives were not closed!"
+    daemon.shutdown()
+
+
+def test_daemon_error(tmpdir):
+    conf = Configuration(os.path.join(new_configuration(tmpdir), "configuration.yml"))
+    api = FakeApi()
+    clock = Clock()
+    daemon = CollectorDaemon(conf, api, clock)
+    api.timeline = None
+
+    assert daemon.run(max_polls=1) == 0, "A failed poll found tweets!"
+    assert daemon.due["nobody"] == clock.now + 120, "A failed poll did not back off!"
+
+    api.timeline = []
+    api.post(1)
+    clock.now += 120
+    assert daemon.run(max_polls=2) == 1, "The daemon did not recover from a failed poll!"
+    daemon.shutdown()
+
+
+def test_daemon_rate_limit(tmpdir):
+    conf = Configuration(os.path.join(new_configuration(tmpdir), "configuration.yml"))
+    clock = Clock()
+    api = FakeApi(remaining=4, reset=clock.now + 900)
+    daemon = CollectorDaemon(conf, api, clock)
+
+    daemon.run(max_polls=1)
+
+    assert daemon.due["nobody"] == clock.now + 300, "The poll did not wait for the rate limit!"
+    daemon.shutdown()
+
+
+@pytest.mark.parametrize("remaining", [4, 6])
+def test_daemon_rate_limit_accounts(tmpdir, remaining):
+    new_configuration(tmpdir)
+    conf_file = tmpdir.join("configuration.yml")
+    conf_file.write(conf_file.read().replace("screen_name: nobody", "screen_name: [a, b, c, d]"))
+    conf = Configuration(str(conf_file))
+    clock = Clock()
+    daemon = CollectorDaemon(conf, FakeApi(remaining=remaining, reset=clock.now + 900), clock)
+
+    daemon.run(max_polls=1)
+
+    # With no calls left, or too few for every user, they all wait for the reset, and no longer
+    assert set(daemon.due.values()) == {clock.now + 900}, \
+        "The users were not polled again when the rate limit reset!"
+    daemon.shutdown()
+
+
+def test_daemon_stop(tmpdir):
+    conf = Configuration(os.path.join(new_configuration(tmpdir), "configuration.yml"))
+    daemon = CollectorDaemon(conf, FakeApi(), Clock())
+
+    daemon.stop(signal.SIGTERM)
+
+    assert daemon.run() == 0, "The daemon polled after it was stopped!"
+    assert daemon.polls == 0, "The daemon polled after it was stopped!"
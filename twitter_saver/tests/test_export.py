@@ -0,0 +1,67 @@
+import gzip
+import io
+import json
+
+from twitter_saver.export import export_threads, open_output, parse_since
+from twitter_saver.storage import open_store
+from twitter_saver.tests.test_utils import thread_data
+
+
+def new_store(tmpdir):
+    store = open_store(str(tmpdir.join("db.sqlite")))
+    store.add(sorted(({"id": id, "created_at": created_at, "in_reply_to_status_id": parent,
+                       "author": "nobody", "text": "", "media": []}
+                      for id, created_at, parent in thread_data), key=lambda t: -t["id"]))
+    return store
+
+
+def test_parse_since():
+    assert parse_since("1234") == (1234, None), "The tweet ID was not parsed!"
+    assert parse_since("2019-03-28") == (None, 1553731200), "The date was not parsed as UTC!"
+    assert parse_since(None) == (None, None), "No limit was not allowed!"
+
+
+def test_export_ndjson(tmpdir):
+    with new_store(tmpdir) as store:
+        f = io.StringIO()
+        count = export_threads(store, f, "ndjson")
+
+        pretty = io.StringIO()
+        export_threads(store, pretty, "json")
+
+    lines = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert len(lines) == count, "The wrong number of lines was written!"
+    assert lines == [dict(thread, root_id=thread["tweets"][0]["id"])
+                     for thread in json.loads(pretty.getvalue())["threads"]], \
+        "The NDJSON threads did not match the JSON document!"
+    assert all(None not in thread["tweets"] for thread in lines), "Empty tweets were written!"
+
+
+def test_export_since(tmpdir):
+    with new_store(tmpdir) as store:
+        everything = io.StringIO()
+        export_threads(store, everything, "ndjson")
+        by_id = io.StringIO()
+        export_threads(store, by_id, "ndjson", since="13")
+        by_date = io.StringIO()
+        export_threads(store, by_date, "ndjson", since="2019-03-30")
+
+    threads = [json.loads(line) for line in everything.getvalue().splitlines()]
+    expected = [thread for thread in threads if max(t["id"] for t in thread["tweets"]) > 13]
+    assert [json.loads(line) for line in by_id.getvalue().splitlines()] == expected, \
+        "The threads were not filtered by tweet ID!"
+    # 2019-03-30 00:00:00 UTC
+    expected = [thread for thread in threads
+                if max(t["timestamp"] for t in thread["tweets"]) >= 1553904000]
+    assert [json.loads(line) for line in by_date.getvalue().splitlines()] == expected, \
+        "The threads were not filtered by date!"
+    assert 0 < len(expected) < len(threads), "The date did not split the threads!"
+
+
+def test_open_output_compressed(tmpdir):
+    path = str(tmpdir.join("threads.ndjson.gz"))
+    with open_output(path, compress=True) as f:
+        f.write("{}\n")
+
+    with gzip.open(path, "rt") as f:
+        assert f.read() == "{}\n", "The output was not compressed!"
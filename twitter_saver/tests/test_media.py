@@ -0,0 +1,164 @@
+import http.server
+import os
+import socketserver
+import threading
+
+from PIL import Image
+import pytest
+
+from twitter_saver.media import MediaDownloader, MediaIndex, PrintMedia
+
+requests_seen = []
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        requests_seen.append(self.path)
+        if self.path == "/missing.jpg":
+            self.send_error(404)
+        elif self.path == "/flaky.jpg" and requests_seen.count(self.path) < 3:
+            self.send_error(503)
+        else:
+            body = self.path.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    requests_seen.clear()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download(server, tmpdir):
+    tmpdir.join("saved.jpg").write("already here")
+    jobs = [(server + "/{}.jpg".format(name), str(tmpdir.join("{}.jpg".format(name))))
+            for name in ["a", "b", "c", "saved", "flaky", "missing"]]
+
+    saved = []
+    with MediaDownloader(workers=4, backoff=0.01, on_saved=saved.append) as downloader:
+        summary = downloader.download(jobs)
+
+    assert summary.downloaded == 4, "The wrong number of files were downloaded!"
+    assert summary.skipped == 1, "The file already on disk was not skipped!"
+    assert summary.failed == 1, "The missing file was not counted as failed!"
+    assert len(saved) == 4, "The callback was not called for each downloaded file!"
+    assert tmpdir.join("a.jpg").read() == "/a.jpg", "The downloaded file was not correct!"
+    assert tmpdir.join("saved.jpg").read() == "already here", "The saved file was overwritten!"
+    assert requests_seen.count("/flaky.jpg") == 3, "The failing download was not retried!"
+    assert requests_seen.count("/missing.jpg") == 1, "A missing file was retried!"
+    assert not tmpdir.join("missing.jpg").exists(), "A failed download left a file behind!"
+    assert not tmpdir.listdir(lambda p: p.ext == ".part"), "A temporary file was left behind!"
+    umask = os.umask(0)
+    os.umask(umask)
+    assert tmpdir.join("a.jpg").stat().mode & 0o777 == 0o666 & ~umask, \
+        "The downloaded file did not get the usual permissions!"
+
+
+def test_download_overwrite(server, tmpdir):
+    tmpdir.join("a.jpg").write("old")
+    jobs = [(server + "/a.jpg", str(tmpdir.join("a.jpg"))),
+            (server + "/missing.jpg", str(tmpdir.join("b.jpg")))]
+    tmpdir.join("b.jpg").write("kept")
+
+    with MediaDownloader(workers=2) as downloader:
+        summary = downloader.download(jobs, overwrite=True)
+
+    assert summary.downloaded == 1, "The saved file was not downloaded again!"
+    assert tmpdir.join("a.jpg").read() == "/a.jpg", "The saved file was not replaced!"
+    assert tmpdir.join("b.jpg").read() == "kept", "A failed download removed the saved file!"
+
+
+def test_download_callback_error(server, tmpdir):
+    def on_saved(path):
+        raise KeyError(path)
+
+    with MediaDownloader(workers=2) as downloader, pytest.raises(KeyError):
+        downloader.download([(server + "/a.jpg", str(tmpdir.join("a.jpg")))], on_saved=on_saved)
+
+
+def test_media_index(tmpdir):
+    Image.new("RGB", (40, 30)).save(str(tmpdir.join("a.jpg")))
+
+    with MediaIndex(str(tmpdir)) as index:
+        assert index.dimensions("a.jpg") == (40, 30), "The dimensions were not correct!"
+        assert index.dimensions("b.jpg") is None, "A missing file had dimensions!"
+
+    assert tmpdir.join("media-index.json").exists(), "The index was not saved!"
+
+    # A new index reads the saved entry rather than the image
+    index = MediaIndex(str(tmpdir))
+    index.add = None
+    assert index.dimensions("a.jpg") == (40, 30), "The saved dimensions were not used!"
+
+
+def test_media_index_changed_file(tmpdir):
+    path = str(tmpdir.join("a.jpg"))
+    Image.new("RGB", (40, 30)).save(path)
+
+    index = MediaIndex(str(tmpdir))
+    index.dimensions("a.jpg")
+
+    Image.new("RGB", (400, 300)).save(path)
+
+    assert index.dimensions("a.jpg") == (400, 300), "The changed file was not read again!"
+
+
+def test_download_shared(server, tmpdir):
+    first, second = tmpdir.mkdir("first"), tmpdir.mkdir("second")
+
+    with MediaDownloader(workers=2) as downloader:
+        downloader.download([(server + "/a.jpg", str(first.join("a.jpg")))])
+        saved = []
+        summary = downloader.download([(server + "/a.jpg", str(second.join("a.jpg")))],
+                                      on_saved=saved.append)
+
+    assert summary.copied == 1, "The file saved for another path was not copied!"
+    assert requests_seen == ["/a.jpg"], "The same url was downloaded twice!"
+    assert second.join("a.jpg").read() == "/a.jpg", "The copied file was not correct!"
+    assert saved == [str(second.join("a.jpg"))], "The per-call callback was not used!"
+
+
+def test_print_media(tmpdir):
+    Image.new("RGB", (400, 300), "red").save(str(tmpdir.join("large.jpg")))
+    Image.new("RGBA", (400, 100)).save(str(tmpdir.join("clear.png")))
+    Image.new("RGB", (40, 30)).save(str(tmpdir.join("small.jpg")))
+    tmpdir.join("large-copy.jpg").write_binary(tmpdir.join("large.jpg").read_binary())
+    tmpdir.join("notes.txt").write("not an image")
+
+    media = PrintMedia(str(tmpdir), width=200)
+    assert media.update() == 4, "The images were not processed!"
+
+    with Image.open(str(tmpdir.join(media.file("large.jpg")))) as img:
+        assert (img.size, img.format) == ((200, 150), "JPEG"), "The image was not downscaled!"
+    with Image.open(str(tmpdir.join(media.file("clear.png")))) as img:
+        assert (img.size, img.mode) == ((200, 50), "RGBA"), "The transparency was lost!"
+    assert media.file("small.jpg") == "small.jpg", "The small image was not used as it is!"
+    assert media.file("large-copy.jpg") == media.file("large.jpg"), \
+        "The same image was processed twice!"
+    assert len(tmpdir.join("print").listdir()) == 2, "The wrong number of copies were made!"
+
+    media = PrintMedia(str(tmpdir), width=200)
+    assert media.update() == 0, "The images were processed again!"
+
+    tmpdir.join("large.jpg").remove()
+    tmpdir.join("large-copy.jpg").remove()
+    PrintMedia(str(tmpdir), width=200).update()
+    assert len(tmpdir.join("print").listdir()) == 1, "The unused copy was not removed!"
+
+    media = PrintMedia(str(tmpdir), width=100)
+    assert media.update() == 2, "The images were not processed again at the new size!"
@@ -1,9 +1,12 @@
 import json
 
+import pytest
+
 from twitter_saver.merger import main
+from twitter_saver.storage import open_store
 
-db1 = [1, 2, 3, 4, 5]
-db2 = [6, 7, 8]
+db1 = [{"id": i} for i in [1, 2, 3, 4, 5]]
+db2 = [{"id": i} for i in [6, 7, 8]]
 
 
 def test_main(tmpdir):
@@ -20,6 +23,59 @@ def test_main(tmpdir):
 
     o = d.join("db.json")
 
-    main(file1=f1, file2=f2, output=o)
+    main(files=[f1, f2], output=o)
+
+    assert json.loads(o.read())["tweets"] == sorted(db1 + db2, key=lambda t: -t["id"]), \
+        "The data in the merged file was wrong!"
+
+
+def test_main_duplicates(tmpdir):
+    files = []
+    for i, ids in enumerate([[1, 2, 3], [3, 4, 5], [5, 6, 1]]):
+        f = tmpdir.join("db{}.json".format(i))
+        f.write(json.dumps({"tweets": [{"id": n, "text": "same"} for n in ids]}))
+        files.append(str(f))
+
+    o = str(tmpdir.join("db.sqlite"))
+
+    # A small run size forces the tweets to be merged from several sorted runs
+    stats = main(files=files, output=o, run_size=2)
+
+    with open_store(o) as store:
+        assert [t["id"] for t in store] == [6, 5, 4, 3, 2, 1], \
+            "The merged database did not hold each tweet once!"
+    assert stats[files[0]]["unique"] == 3, "The first file's unique count was wrong!"
+    assert stats[files[2]]["duplicates"] == 2, "The last file's duplicate count was wrong!"
+    assert stats[files[1]]["conflicts"] == 0, "Identical copies were counted as conflicts!"
+
+
+@pytest.mark.parametrize("conflict,text", [("first", "old"), ("last", "new")])
+def test_main_conflicts(tmpdir, conflict, text):
+    f1 = tmpdir.join("db1.json")
+    f1.write(json.dumps({"tweets": [{"id": 1, "text": "old"}]}))
+    f2 = tmpdir.join("db2.json")
+    f2.write(json.dumps({"tweets": [{"text": "new", "id": 1}]}))
+    o = tmpdir.join("db.json")
+
+    stats = main(files=[f1, f2], output=o, conflict=conflict)
+
+    assert json.loads(o.read())["tweets"][0]["text"] == text, \
+        "The conflict policy did not pick the right copy!"
+    assert sum(s["conflicts"] for s in stats.values()) == 1, "The conflict was not counted!"
+
+
+def test_main_conflict_error(tmpdir):
+    f1 = tmpdir.join("db1.json")
+    f1.write(json.dumps({"tweets": [{"id": 1, "text": "old"}]}))
+    f2 = tmpdir.join("db2.json")
+    f2.write(json.dumps({"tweets": [{"id": 1, "text": "new"}]}))
+
+    output = tmpdir.join("db.json")
+    output.write(json.dumps({"tweets": [{"id": 2, "text": "kept"}]}))
 
-    assert json.loads(o.read())["tweets"] == db1 + db2, "The data in the merged file was wrong!"
+    with pytest.raises(ValueError):
+        main(files=[f1, f2], output=output, conflict="error")
+    assert json.loads(output.read())["tweets"] == [{"id": 2, "text": "kept"}], \
+        "The failed merge changed the existing output!"
+    assert sorted(f.basename for f in tmpdir.listdir()) == ["db.json", "db1.json", "db2.json"], \
+        "The failed merge left a partial file!"
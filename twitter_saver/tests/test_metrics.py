@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+from twitter_saver.metrics import Metrics
+
+
+def busy():
+    return sum(i * i for i in range(1000))
+
+
+def test_stages_and_counters():
+    metrics = Metrics("test")
+
+    for _ in range(3):
+        with metrics.stage("work"):
+            busy()
+    metrics.count("items", 2)
+    metrics.count("items")
+
+    result = metrics.to_dict()
+    assert result["stages"]["work"]["count"] == 3, "The stage runs were not counted!"
+    assert result["stages"]["work"]["seconds"] > 0, "The stage was not timed!"
+    assert result["counters"] == {"items": 3}, "The counter was not added up!"
+
+
+def test_stage_records_errors():
+    metrics = Metrics("test")
+
+    try:
+        with metrics.stage("work"):
+            raise ValueError()
+    except ValueError:
+        pass
+
+    assert metrics.timers["work"]["count"] == 1, "A failed stage was not timed!"
+
+
+def test_save(tmpdir):
+    metrics = Metrics("test", profile=True)
+    metrics.started = time.mktime((2026, 10, 18, 2, 15, 0, 0, 0, -1))
+    with metrics.stage("work", profile=True):
+        busy()
+    with metrics.stage("other"):
+        busy()
+    metrics.count("items", 5)
+
+    metrics.save(str(tmpdir.join("metrics")), str(tmpdir.join("prometheus")))
+
+    with open(str(tmpdir.join("metrics", "metrics-test-20261018T021500.json")), "r") as f:
+        assert json.load(f)["counters"] == {"items": 5}, "The JSON metrics were not saved!"
+    assert os.path.exists(str(tmpdir.join("metrics", "test-work-20261018T021500.prof"))), \
+        "The profiled stage was not saved!"
+    assert not os.path.exists(str(tmpdir.join("metrics", "test-other-20261018T021500.prof"))), \
+        "A stage that didn't ask for profiling was profiled!"
+
+    prometheus = tmpdir.join("prometheus", "twitter_saver_test.prom").read()
+    assert 'twitter_saver_count{run="test",name="items"} 5' in prometheus, \
+        "The counter was not in the Prometheus file!"
+    assert 'twitter_saver_stage_seconds{run="test",stage="work"}' in prometheus, \
+        "The stage was not in the Prometheus file!"
+
+
+def test_save_keeps_runs(tmpdir):
+    for started in (1000.0, 2000.0):
+        metrics = Metrics("test")
+        metrics.started = started
+        metrics.save(str(tmpdir))
+
+    assert len(tmpdir.listdir()) == 2, "A run overwrote the metrics of the one before!"
@@ -1,5 +1,5 @@
 from twitter import Status
-from twitter_saver.objects import parse_tweet
+from twitter_saver.objects import MediaItem, Tweet, User, parse_tweet, strip_raw_payload
 
 import pytest
 
@@ -14,6 +14,7 @@ def test_parse_tweets():
 
     tweet_json = {
         "id": 1,
+        "created_at": "Thu Mar 28 00:00:00 +0000 2019",
         "user": {"id": 1, "screen_name": "nobody"},
         "in_reply_to": "someone else",
         "in_reply_to_status_id": 0,
@@ -26,3 +27,41 @@ def test_parse_tweets():
 
     assert tweet.id == 1, "The parsed tweet's ID did not match what was expected!"
     assert tweet.media[0].filename == "a.jpg", "The expected filename was not correct!"
+    assert tweet.timestamp == 1553731200, "The tweet's epoch timestamp was not correct!"
+
+
+def test_tweet_round_trip():
+    tweet_dict = {
+        "id": 2,
+        "created_at": "2020-01-01 12:00:00",
+        "author": "nobody",
+        "in_reply_to": None,
+        "in_reply_to_status_id": None,
+        "text": "Hello, World!",
+        "media": [{"id": 3, "url": "https://domain/a.jpg", "filename": "a.jpg", "type": "photo",
+                   "_json": {"id": 3}}],
+        "_json": {"id": 2, "text": "Hello, World!"}
+    }
+
+    tweet = Tweet.new_from_json(tweet_dict)
+
+    assert isinstance(tweet.media[0], MediaItem), "The media dicts were not parsed as MediaItems!"
+    assert not hasattr(tweet, "__dict__"), "The tweet is not a slotted record!"
+    saved = tweet.to_dict()
+    assert "_json" not in saved, "The raw payload was saved with the tweet!"
+    assert "_json" not in saved["media"][0], "The raw payload was saved with the media!"
+    assert Tweet.new_from_json(saved).to_dict() == saved, "The tweet did not round trip!"
+
+
+def test_strip_raw_payload():
+    tweet_dict = {"id": 2, "media": [{"id": 3, "_json": {}}], "_json": {}}
+
+    assert strip_raw_payload(tweet_dict), "The raw payload was not reported as removed!"
+    assert tweet_dict == {"id": 2, "media": [{"id": 3}]}, "The raw payload was not removed!"
+    assert not strip_raw_payload(tweet_dict), "A clean tweet was reported as changed!"
+
+
+def test_user():
+    user = User(id=1, author="Nobody", screen_name="nobody", profile_picture="profile/a.jpg")
+
+    assert user.to_dict()["screen_name"] == "nobody", "The user was not saved correctly!"
@@ -0,0 +1,77 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from twitter_saver.objects import MediaItem, Tweet
+from twitter_saver.rendering import FragmentCache, calculate_margins, render_thread, \
+    render_threads
+
+users = {"nobody": {"name": "No_body", "profile_picture": "profile/nobody.jpg"}}
+dimensions = {"a.jpg": (100, 50), "b.jpg": None}
+
+
+def new_thread(text="Hello, World!"):
+    media = [MediaItem(id=1, filename="a.jpg", url="a", type="photo")]
+    return [Tweet(id=1, created_at="2019-03-28 00:00:00", author="nobody", text=text, media=media),
+            Tweet(id=2, created_at="2019-03-29 00:00:00", author="nobody", text="50% off")]
+
+
+def test_calculate_margins():
+    media = [MediaItem(id=1, filename="a.jpg", url="a", type="photo"),
+             MediaItem(id=2, filename="b.jpg", url="b", type="photo")]
+    tweet = Tweet(id=1, text="x" * 100, media=media)
+
+    assert calculate_margins(tweet, dimensions) == 0.7 + 0.5 + 6.25, \
+        "The margin was not correct, or the missing file was not skipped!"
+
+
+def test_render_thread():
+    fragment = render_thread(new_thread(), users, dimensions)
+
+    assert fragment.startswith("% ---------------- THREAD ---------------\n"), \
+        "The fragment did not start with a thread marker!"
+    assert "\\tweet{profile/nobody.jpg}{\\threadline{6.95}}{No\\_body}{@nobody}{Mar 28 2019}" \
+           "{Hello, World!}{\\tweetmedia{a.jpg}\n\\vspace{10pt}\n}{1}" in fragment, \
+        "The first tweet was not rendered correctly!"
+    assert "{}{No\\_body}{@nobody}{Mar 29 2019}{50\\% off}" in fragment, \
+        "The last tweet was not rendered without a thread line!"
+
+
+def test_render_print_copies(tmpdir):
+    files = {"a.jpg": "print/0123-984-85.jpg"}
+    fragment = render_thread(new_thread(), users, dimensions, files)
+
+    assert "{\\tweetmedia{print/0123-984-85.jpg}\n" in fragment, "The print copy was not used!"
+
+    cache = FragmentCache(str(tmpdir))
+    cache.render(new_thread(), users, dimensions)
+    assert cache.render(new_thread(), users, dimensions, files) == fragment and \
+        cache.misses == 2, "The thread was not rendered again with the print copies!"
+
+
+def test_fragment_cache(tmpdir):
+    cache = FragmentCache(str(tmpdir))
+
+    first = cache.render(new_thread(), users, dimensions)
+    assert cache.render(new_thread(), users, dimensions) == first, "The fragment changed!"
+    assert (cache.hits, cache.misses) == (1, 1), "The unchanged thread was rendered again!"
+
+    cache = FragmentCache(str(tmpdir))
+    changed = cache.render(new_thread("Edited"), users, dimensions)
+    assert "Edited" in changed and cache.misses == 1, "The changed thread was not rendered again!"
+
+    assert cache.prune() == 1, "The unused fragment was not pruned!"
+    assert len(tmpdir.listdir()) == 1, "The fragment in use was pruned!"
+
+
+def test_render_threads_in_order(tmpdir):
+    jobs = [(new_thread("Thread {}".format(i)), users, dimensions) for i in range(40)]
+    serial = [render_thread(*job) for job in jobs]
+
+    with ProcessPoolExecutor(2) as executor:
+        assert list(render_threads(jobs, executor, chunk_size=3)) == serial, \
+            "The threads rendered in parallel did not match the serial output!"
+
+        cache = FragmentCache(str(tmpdir))
+        cache.render(*jobs[5])
+        assert list(cache.render_many(jobs, executor, chunk_size=3, batch_size=7)) == serial, \
+            "The cached and rendered threads were not returned in order!"
+    assert (cache.hits, cache.misses) == (1, 40), "The cached thread was rendered again!"
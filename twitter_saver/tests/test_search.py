@@ -0,0 +1,72 @@
+from twitter_saver.search import Query, SearchIndex, matching_threads, parse_query, tokenize
+from twitter_saver.tests.test_export import new_store
+from twitter_saver.threads import index_threads
+
+tweets = [
+    {"id": 1, "created_at": "2019-03-01 10:00:00", "author": "Alice",
+     "text": "Offline archive of the whole timeline"},
+    {"id": 2, "created_at": "2019-03-02 10:00:00", "author": "bob",
+     "text": "The timeline archive is offline today"},
+    {"id": 3, "created_at": "2019-03-03 10:00:00", "author": "alice",
+     "text": "Nothing to see here, just a reply"},
+]
+
+
+def new_index(tmpdir):
+    index = SearchIndex(str(tmpdir.join("search-index.sqlite")))
+    index.add([dict(tweet) for tweet in tweets])
+    return index
+
+
+def test_tokenize():
+    assert tokenize("Hello, World! snake_case #tag") == ["hello", "world", "snake_case", "tag"], \
+        "The text was not split into words!"
+
+
+def test_parse_query():
+    assert parse_query('Archive "the Timeline" -today from:@Alice since:2019-03-02 nope:x') == \
+        Query(words=["archive"], phrases=[["the", "timeline"], ["nope", "x"]],
+              excluded=[["today"]], authors=["alice"], since=1551484800), \
+        "The query was not parsed!"
+
+
+def test_search(tmpdir):
+    with new_index(tmpdir) as index:
+        assert index.add([dict(tweets[0])]) == 0, "A tweet was indexed twice!"
+
+        assert index.search("archive offline") == [2, 1], "The words were not all matched!"
+        assert index.search("ARCHIVE missing") == [], "A tweet without every word was matched!"
+        assert index.search('"timeline archive"') == [2], "The phrase was not matched in order!"
+        assert index.search("archive -today") == [1], "The excluded word was not excluded!"
+        assert index.search("from:alice") == [3, 1], "The author was not matched!"
+        assert index.search("archive from:alice") == [1], "The author did not filter the words!"
+        assert index.search("since:2019-03-02 until:2019-03-03") == [2], \
+            "The dates did not filter the tweets!"
+        assert index.search("the", limit=1) == [2], "The results were not limited!"
+
+
+def test_update(tmpdir):
+    with new_store(tmpdir) as store, SearchIndex(str(tmpdir.join("index.sqlite"))) as index:
+        count = index.update(store)
+        assert count == len(store), "The saved tweets were not indexed!"
+        assert index.update(store) == 0, "The saved tweets were indexed again!"
+        assert index.search("from:nobody") == sorted(store.ids(), reverse=True), \
+            "The saved tweets were not searchable!"
+
+
+def test_matching_threads(tmpdir):
+    with new_store(tmpdir) as store:
+        expected = [ids for ids in index_threads(store.iter_keys()) if 12 in ids or 13 in ids]
+        assert matching_threads(store, [12, 13]) == expected, \
+            "The threads of the matching tweets were not found!"
+
+
+def test_rebuild(tmpdir):
+    new_index(tmpdir).close()
+
+    index = SearchIndex(str(tmpdir.join("search-index.sqlite")))
+    index._conn.execute("PRAGMA user_version = 0")
+    index.close()
+
+    with SearchIndex(str(tmpdir.join("search-index.sqlite"))) as index:
+        assert len(index) == 0, "An index from another version was kept!"
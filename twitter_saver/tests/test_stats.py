@@ -0,0 +1,65 @@
+from twitter_saver.stats import ArchiveStats, rebuild_stats
+from twitter_saver.tests.test_export import new_store
+from twitter_saver.threads import index_threads
+
+tweets = [
+    {"id": 1, "created_at": "2019-03-01 10:00:00", "author": "me", "in_reply_to_status_id": None,
+     "media": [{"id": 10, "filename": "a.jpg", "type": "photo"}]},
+    {"id": 2, "created_at": "2019-03-01 11:00:00", "author": "you", "in_reply_to_status_id": 1,
+     "media": [{"id": 20, "filename": "b.mp4", "type": "video"}]},
+    {"id": 3, "created_at": "2019-04-02 10:00:00", "author": "you", "in_reply_to_status_id": 2,
+     "media": []},
+]
+
+
+def test_add(tmpdir):
+    tmpdir.join("a.jpg").write_binary(b"x" * 100)
+    stats = ArchiveStats()
+
+    assert stats.add([dict(tweet) for tweet in tweets], str(tmpdir)) == 3, \
+        "The tweets were not counted!"
+
+    data = stats.data
+    assert (data["tweets"], data["roots"], data["replies"]) == (3, 1, 2), \
+        "The replies were not counted!"
+    assert data["days"] == {"2019-03-01": 2, "2019-04-02": 1}, "The days were not counted!"
+    assert data["weeks"] == {"2019-W09": 2, "2019-W14": 1}, "The weeks were not counted!"
+    assert data["months"] == {"2019-03": 2, "2019-04": 1}, "The months were not counted!"
+    assert data["repliers"] == {"you": 2}, "The repliers were not counted!"
+    assert data["media"] == {"items": 2, "bytes": 100, "missing": 1,
+                             "types": {"photo": 1, "video": 1}}, "The media was not counted!"
+    assert "Tweets: 3 (1 starting a conversation, 2 replies)" in stats.report(), \
+        "The report did not show the totals!"
+
+
+def test_incremental(tmpdir):
+    path = str(tmpdir.join("stats.json"))
+    stats = ArchiveStats()
+    stats.add([dict(tweets[0])])
+    stats.save(path)
+
+    stats = ArchiveStats.load(path)
+    stats.add([dict(tweet) for tweet in tweets[1:]])
+
+    everything = ArchiveStats()
+    everything.add([dict(tweet) for tweet in tweets])
+    assert stats.data == everything.data, "The statistics were not added to!"
+    assert not stats.is_stale(3) and stats.is_stale(4), "Missing tweets were not noticed!"
+
+
+def test_rebuild(tmpdir):
+    with new_store(tmpdir) as store:
+        stats = rebuild_stats(store)
+        threads = index_threads(store.iter_keys())
+
+        assert stats.data["tweets"] == len(store), "Not every tweet was counted!"
+    assert stats.data["threads"]["count"] == len(threads), "The threads were not counted!"
+    assert sum(int(length) * count for length, count in stats.data["threads"]["lengths"].items()) \
+        == sum(len(ids) for ids in threads), "The thread lengths were not counted!"
+
+
+def test_load(tmpdir):
+    path = tmpdir.join("stats.json")
+    assert ArchiveStats.load(str(path)) is None, "Missing statistics were loaded!"
+    path.write('{"version": 0}')
+    assert ArchiveStats.load(str(path)) is None, "Statistics from another version were loaded!"
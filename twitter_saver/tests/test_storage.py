@@ -0,0 +1,156 @@
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from twitter_saver import storage
+
+from twitter_saver.storage import JsonTweetStore, SQLiteTweetStore, migrate_json, open_archive, \
+    open_store
+
+tweets = [{"id": i, "text": "Tweet {}".format(i)} for i in [5, 4, 3, 2, 1]]
+
+
+@pytest.mark.parametrize("filename", ["db.json", "db.sqlite"])
+def test_store(tmpdir, filename):
+    path = str(tmpdir.join(filename))
+
+    with open_store(path) as store:
+        assert store.max_id() is None, "An empty database had a maximum ID!"
+        assert store.add(tweets[2:]) == 3, "The wrong number of tweets were added!"
+        assert store.add(tweets[:3]) == 2, "Tweets already in the database were added again!"
+
+    with open_store(path) as store:
+        assert len(store) == 5, "The tweets were not saved to the database!"
+        assert store.max_id() == 5, "The maximum ID was not correct!"
+        assert store.get(3) == tweets[2], "The tweet looked up by ID was not correct!"
+        assert store.get(6) is None, "A missing tweet was found in the database!"
+        assert 1 in store and 6 not in store, "The membership test was not correct!"
+        assert [t["id"] for t in store] == [5, 4, 3, 2, 1], "The tweets were not newest first!"
+
+
+def test_open_store_types(tmpdir):
+    assert isinstance(open_store(str(tmpdir.join("a.json"))), JsonTweetStore)
+    assert isinstance(open_store(str(tmpdir.join("a.db"))), SQLiteTweetStore)
+    with pytest.raises(ValueError):
+        open_store(str(tmpdir.join("a.txt")))
+
+
+def test_incomplete_store():
+    class PartialStore(storage.TweetStore):
+        def __len__(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_migrate_json(tmpdir, monkeypatch):
+    json_file = tmpdir.join("tweets-db.json")
+    json_file.write(json.dumps({"tweets": [dict(tweet, _json={}) for tweet in tweets]}))
+
+    # The file is streamed in batches, never loaded whole
+    monkeypatch.setattr(storage, "MIGRATE_BATCH_SIZE", 2)
+    monkeypatch.setattr(storage.json, "load", None)
+
+    with SQLiteTweetStore(str(tmpdir.join("tweets-db.sqlite"))) as store:
+        assert migrate_json(str(json_file), store) == 5, "Not every tweet was migrated!"
+        assert store.max_id() == 5, "The maximum ID was not correct after migrating!"
+        assert "_json" not in store.get(3), "The raw payload was migrated!"
+
+
+def test_open_archive_migrates(tmpdir):
+    tmpdir.join("tweets-db.json").write(json.dumps({"tweets": tweets}))
+    conf = SimpleNamespace(save_path=str(tmpdir), db_file=str(tmpdir.join("tweets-db.sqlite")))
+
+    with open_archive(conf) as store:
+        assert len(store) == 5, "The JSON database was not migrated!"
+
+
+def test_open_archive_partial_migration(tmpdir):
+    tmpdir.join("tweets-db.json").write(json.dumps({"tweets": tweets}))
+    conf = SimpleNamespace(save_path=str(tmpdir), db_file=str(tmpdir.join("tweets-db.sqlite")))
+    # A migration that was killed part way
+    with SQLiteTweetStore(str(tmpdir.join("tweets-db.part.sqlite"))) as store:
+        store.add(tweets[:2])
+
+    with open_archive(conf) as store:
+        assert len(store) == 5, "The partial migration was used!"
+    assert not tmpdir.join("tweets-db.part.sqlite").exists(), "The partial migration was kept!"
+
+
+def test_open_archive_migration_error(tmpdir, monkeypatch):
+    tmpdir.join("tweets-db.json").write(json.dumps({"tweets": tweets}))
+    conf = SimpleNamespace(save_path=str(tmpdir), db_file=str(tmpdir.join("tweets-db.sqlite")))
+    monkeypatch.setattr(storage, "migrate_json", None)
+
+    with pytest.raises(TypeError):
+        open_archive(conf)
+    assert tmpdir.listdir() == [tmpdir.join("tweets-db.json")], "A failed migration left a file!"
+
+
+def test_open_archive_missing(tmpdir):
+    conf = SimpleNamespace(save_path=str(tmpdir), db_file=str(tmpdir.join("tweets-db.sqlite")))
+
+    with pytest.raises(FileNotFoundError):
+        open_archive(conf, create=False)
+
+
+def test_iter_json_tweets(tmpdir, monkeypatch):
+    path = tmpdir.join("tweets-db.json")
+    path.write(json.dumps({"tweets": tweets}, indent=2))
+
+    # Read a few characters at a time, so tweets are split across chunks
+    monkeypatch.setattr(storage, "CHUNK_SIZE", 7)
+
+    assert list(storage.iter_json_tweets(str(path))) == tweets, \
+        "The streamed tweets did not match the database!"
+
+
+def test_write_json_tweets(tmpdir):
+    path = str(tmpdir.join("tweets-db.json"))
+
+    assert storage.write_json_tweets(path, iter(tweets)) == 5, "Not every tweet was written!"
+    assert list(storage.iter_json_tweets(path)) == tweets, "The written tweets were not correct!"
+
+
+def test_sqlite_upgrade(tmpdir):
+    path = str(tmpdir.join("tweets-db.sqlite"))
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tweets (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+    conn.execute("INSERT INTO tweets VALUES (1, ?)", (json.dumps(
+        {"id": 1, "created_at": "2019-03-28 00:00:00", "author": "a"}),))
+    conn.execute("INSERT INTO tweets VALUES (2, ?)", (json.dumps(
+        {"id": 2, "created_at": "2019-03-29 00:00:00", "author": "b",
+         "in_reply_to_status_id": 1, "media": [{"id": 3, "_json": {}}], "_json": {}}),))
+    conn.commit()
+    conn.close()
+
+    with SQLiteTweetStore(path) as store:
+        assert list(store.iter_keys()) == [(2, 1, 1553817600),
+                                           (1, None, 1553731200)], \
+            "The threading fields were not filled in for the existing tweets!"
+        assert store.authors() == {"a", "b"}, "The authors were not filled in!"
+        assert store.get(2) == {"id": 2, "created_at": "2019-03-29 00:00:00", "author": "b",
+                                "in_reply_to_status_id": 1, "media": [{"id": 3}],
+                                "timestamp": 1553817600}, \
+            "The raw payloads were not removed from the existing tweets!"
+
+
+@pytest.mark.parametrize("filename", ["db.json", "db.sqlite"])
+def test_get_many(tmpdir, filename):
+    with open_store(str(tmpdir.join(filename))) as store:
+        store.add(tweets)
+        assert store.get_many([4, 2, 9]) == {4: tweets[1], 2: tweets[3]}, \
+            "The tweets looked up by ID were not correct!"
+
+
+def test_json_store_streams(tmpdir):
+    path = tmpdir.join("tweets-db.json")
+    path.write(json.dumps({"tweets": tweets}))
+
+    store = JsonTweetStore(str(path))
+
+    assert [tweet for tweet in store] == tweets, "The tweets were not read from the file!"
+    assert store.tweets is None, "The whole file was loaded just to iterate over it!"
@@ -0,0 +1,34 @@
+from twitter_saver.storage import iter_tweets
+from twitter_saver.synthetic import generate_tweets, write_archive
+
+
+def test_generate_tweets():
+    tweets = generate_tweets(2000, max_depth=5, media_density=0.5, seed=1)
+
+    assert [tweet["id"] for tweet in tweets] == list(range(2000, 0, -1)), \
+        "The tweets were not generated newest first!"
+    assert tweets == generate_tweets(2000, max_depth=5, media_density=0.5, seed=1), \
+        "The same seed did not generate the same archive!"
+
+    by_id = {tweet["id"]: tweet for tweet in tweets}
+    depths = {}
+    for tweet in reversed(tweets):
+        parent = tweet["in_reply_to_status_id"]
+        assert parent is None or parent < tweet["id"], "A tweet replied to a newer tweet!"
+        depths[tweet["id"]] = 0 if parent is None else depths[parent] + 1
+        if parent is not None:
+            assert by_id[parent]["timestamp"] < tweet["timestamp"], \
+                "A reply was older than its parent!"
+
+    assert max(depths.values()) == 5, "The reply chains did not reach the maximum depth!"
+    assert 0 < sum(1 for tweet in tweets if tweet["media"]) < 2000, \
+        "The media density was not applied!"
+
+
+def test_write_archive(tmpdir):
+    tweets = generate_tweets(100)
+
+    for filename in ["db.json", "db.sqlite"]:
+        path = str(tmpdir.join(filename))
+        assert write_archive(path, tweets) == 100, "The wrong number of tweets was written!"
+        assert list(iter_tweets(path)) == tweets, "The archive did not read back the same!"
@@ -0,0 +1,76 @@
+import datetime
+import random
+
+import pytest
+
+from twitter_saver.objects import Tweet, MediaItem
+from twitter_saver.storage import open_store
+from twitter_saver.tests.test_utils import thread_data
+from twitter_saver import threads, utils
+
+
+def random_archive(n_tweets, seed):
+    """
+    Builds a shuffled archive with out-of-order replies, long gaps
+    between replies, branching conversations and media.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2019, 3, 28)
+    tweets = []
+    for i in range(1, n_tweets + 1):
+        created = start + datetime.timedelta(hours=rng.randint(0, 24 * 60))
+        if i == 1 or rng.random() < 0.2:
+            parent = None
+        else:
+            parent = rng.randint(1, i - 1)
+        media = [MediaItem(id=i * 10 + m, filename="{}.jpg".format(m), url="", type="photo")
+                 for m in range(rng.choice([0, 0, 0, 1, 2]))]
+        tweets.append(Tweet(id=i,
+                            created_at=created.strftime("%a %b %d %H:%M:%S +0000 %Y"),
+                            in_reply_to_status_id=parent,
+                            media=media))
+    rng.shuffle(tweets)
+    return tweets
+
+
+def thread_ids(thread_list):
+    return [[(t.id, [m.id for m in t.media]) for t in thread] for thread in thread_list]
+
+
+def test_create_threads():
+    tweets = [Tweet(id=entry[0], created_at=entry[1], in_reply_to_status_id=entry[2])
+              for entry in thread_data]
+
+    result = threads.create_threads(tweets)
+
+    assert len(result) == 6, "The number of threads was not correct!"
+    assert [t.id for t in result[0]] == [1, 2, 5, 6, 7], \
+        "The expected ids in thread 1 were not present!"
+    assert [t.id for t in result[4]] == [12, 13, 15], \
+        "The expected ids in thread 6 were not present!"
+    assert result[-1][-1].id == 14, "The tweets are not in order!"
+
+
+def test_create_threads_parity():
+    for seed in range(10):
+        tweets = random_archive(200, seed)
+
+        expected = utils.create_threads(tweets)
+        result = threads.create_threads(tweets)
+
+        assert thread_ids(result) == thread_ids(expected), \
+            "The indexed threads did not match the original threads (seed {})!".format(seed)
+
+
+@pytest.mark.parametrize("filename", ["db.json", "db.sqlite"])
+def test_iter_threads(tmpdir, filename):
+    tweets = random_archive(200, 0)
+    with open_store(str(tmpdir.join(filename))) as store:
+        store.add(sorted([t.to_dict() for t in tweets], key=lambda t: -t["id"]))
+
+    with open_store(str(tmpdir.join(filename))) as store:
+        streamed = list(threads.iter_threads(store))
+
+    expected = threads.create_threads(sorted(tweets, key=lambda t: -t.id))
+    assert thread_ids(streamed) == thread_ids(expected), \
+        "The streamed threads did not match the threads made in memory!"
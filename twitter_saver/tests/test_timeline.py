@@ -0,0 +1,67 @@
+import pytest
+from twitter import Status
+
+from twitter_saver.timeline import TimelineCheckpoint, fetch_timeline
+
+
+class FakeApi:
+    """
+    Serves a timeline of tweets 1 to 50, where every tenth tweet is a retweet
+    """
+
+    def __init__(self, fail_on_call=None):
+        self.calls = []
+        self.fail_on_call = fail_on_call
+        self.timeline = [Status(id=i, retweeted_status=Status(id=1000 + i) if i % 10 == 0 else None)
+                         for i in range(50, 0, -1)]
+
+    def GetUserTimeline(self, screen_name, since_id=None, max_id=None, count=20,
+                        include_rts=True):
+        self.calls.append((since_id, max_id))
+        if len(self.calls) == self.fail_on_call:
+            raise ConnectionError("Connection lost")
+        tweets = [t for t in self.timeline
+                  if (since_id is None or t.id > since_id) and (max_id is None or t.id <= max_id)]
+        return tweets[:count]
+
+
+def test_fetch_timeline(tmpdir):
+    checkpoint = TimelineCheckpoint(str(tmpdir.join("checkpoint.json")))
+    pages = []
+
+    total = fetch_timeline(FakeApi(), "user", None, pages.append, checkpoint, page_size=20)
+
+    ids = [t.id for page in pages for t in page]
+    assert total == 45, "The wrong number of tweets were downloaded!"
+    assert ids == [i for i in range(50, 0, -1) if i % 10 != 0], \
+        "The pages did not cover the timeline, without retweets!"
+    assert not tmpdir.join("checkpoint.json").exists(), "The checkpoint was not cleared!"
+
+
+def test_fetch_timeline_since(tmpdir):
+    checkpoint = TimelineCheckpoint(str(tmpdir.join("checkpoint.json")))
+    pages = []
+
+    fetch_timeline(FakeApi(), "user", 35, pages.append, checkpoint, page_size=4)
+
+    assert min(t.id for page in pages for t in page) == 36, "Tweets before since_id were saved!"
+
+
+def test_fetch_timeline_resume(tmpdir):
+    checkpoint = TimelineCheckpoint(str(tmpdir.join("checkpoint.json")))
+    pages = []
+
+    with pytest.raises(ConnectionError):
+        fetch_timeline(FakeApi(fail_on_call=3), "user", 5, pages.append, checkpoint, page_size=10)
+
+    assert checkpoint.load("user") == {"screen_name": "user", "since_id": 5, "max_id": 30}, \
+        "The position of the last saved page was not checkpointed!"
+    assert checkpoint.load("someone else") is None, "Another user's checkpoint was used!"
+
+    api = FakeApi()
+    fetch_timeline(api, "user", 49, pages.append, checkpoint, page_size=10)
+
+    ids = [t.id for page in pages for t in page]
+    assert api.calls[0] == (5, 30), "The download did not resume from the checkpoint!"
+    assert ids == [i for i in range(50, 5, -1) if i % 10 != 0], \
+        "The resumed download did not carry on from where it stopped!"
@@ -0,0 +1,32 @@
+import pytest
+
+from twitter_saver.timestamps import format_timestamp, parse_date, stamp_tweet, tweet_epoch
+
+
+def test_format_timestamp():
+    assert format_timestamp(1553731200) == "Mar 28 2019", "The epoch was not formatted correctly!"
+    assert format_timestamp("Thu Mar 28 00:00:00 +0000 2019") == format_timestamp(1553731200), \
+        "The creation string and the epoch did not give the same date!"
+
+
+def test_tweet_epoch():
+    assert tweet_epoch("Thu Mar 28 00:00:00 +0000 2019") == 1553731200, \
+        "The twitter timestamp was not converted correctly!"
+    assert tweet_epoch("2019-03-28 00:00:00") == 1553731200, \
+        "The naive timestamp was not treated as UTC!"
+
+
+def test_stamp_tweet():
+    tweet = {"id": 1, "created_at": "2019-03-28 00:00:00"}
+
+    assert stamp_tweet(tweet), "The tweet was not reported as changed!"
+    assert tweet["timestamp"] == 1553731200, "The epoch timestamp was not added!"
+    assert not stamp_tweet(tweet), "A tweet with a timestamp was changed again!"
+
+
+def test_parse_date():
+    assert parse_date("2019-03-28") == 1553731200, "The date was not read as UTC midnight!"
+    assert parse_date("2019-03-28T01:00:00") == 1553734800, "The time was not read!"
+    assert parse_date("2019-03-28 02:00:00+01:00") == 1553734800, "The UTC offset was ignored!"
+    with pytest.raises(ValueError):
+        parse_date("28/03/2019")
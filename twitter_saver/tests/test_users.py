@@ -0,0 +1,126 @@
+import json
+import os
+
+import pytest
+import twitter
+
+from twitter_saver.api import NO_USER_MATCHES
+from twitter_saver.users import UserDatabase
+
+
+class FakeApi:
+    def __init__(self, missing=(), fail_on_call=None):
+        self.calls = []
+        self.missing = set(missing)
+        self.fail_on_call = fail_on_call
+
+    def UsersLookup(self, screen_name, include_entities=True):
+        self.calls.append(list(screen_name))
+        if len(self.calls) == self.fail_on_call:
+            raise twitter.error.TwitterError("Rate limit exceeded")
+        found = [name for name in screen_name if name not in self.missing]
+        if not found:
+            raise twitter.error.TwitterError([{"code": NO_USER_MATCHES,
+                                               "message": "No user matches"}])
+        return [twitter.User(screen_name=name.upper(), name="Name " + name,
+                             profile_image_url="http://images/{}.jpg".format(name))
+                for name in found]
+
+
+class FakeDownloader:
+    """
+    Saves each picture's URL as its content, except for the failing URLs
+    """
+
+    def __init__(self, failing=()):
+        self.jobs = []
+        self.failing = set(failing)
+
+    def download(self, jobs, on_saved=None, overwrite=False):
+        for url, path in jobs:
+            self.jobs.append((url, path))
+            if url in self.failing or (os.path.exists(path) and not overwrite):
+                continue
+            with open(path, "w") as f:
+                f.write(url)
+            if on_saved is not None:
+                on_saved(path)
+
+
+def new_database(tmpdir, ttl_days=30):
+    return UserDatabase(str(tmpdir.join("users-db.json")), str(tmpdir), "http://default.jpg",
+                        ttl_days)
+
+
+def test_prefetch_batches(tmpdir):
+    api = FakeApi(missing={"user_5"})
+    downloader = FakeDownloader()
+    users = new_database(tmpdir)
+
+    names = ["user_{}".format(i) for i in range(250)]
+    assert users.prefetch(api, names + names, downloader) == 250, "Not every user was looked up!"
+
+    assert [len(call) for call in api.calls] == [100, 100, 50], "The lookups were not batched!"
+    assert len(downloader.jobs) == 250, "Not every profile picture was downloaded!"
+    assert users.get("user_1")["name"] == "Name user_1", "The user's name was not saved!"
+    assert users.get("user_5")["profile_image_url"] == "http://default.jpg", \
+        "The missing user did not get the default picture!"
+
+    assert users.prefetch(api, names, downloader) == 0, "Known users were looked up again!"
+
+
+def test_prefetch_no_matches(tmpdir):
+    users = new_database(tmpdir)
+
+    users.prefetch(FakeApi(missing={"gone"}), ["gone"], FakeDownloader())
+
+    assert users.get("gone")["profile_image_url"] == "http://default.jpg", \
+        "The missing user did not get the default picture!"
+
+
+def test_prefetch_resumes(tmpdir):
+    names = ["user_{}".format(i) for i in range(150)]
+
+    with pytest.raises(twitter.error.TwitterError):
+        new_database(tmpdir).prefetch(FakeApi(fail_on_call=2), names, FakeDownloader())
+
+    saved = json.loads(tmpdir.join("users-db.json").read())
+    assert len(saved) == 100, "The first batch was not saved before the error!"
+
+    api = FakeApi()
+    new_database(tmpdir).prefetch(api, names, FakeDownloader())
+    assert [len(call) for call in api.calls] == [50], "The resumed run looked up saved users!"
+
+
+def test_prefetch_stale(tmpdir):
+    tmpdir.join("user.jpg").write("old picture")
+    tmpdir.join("users-db.json").write(json.dumps({"user": {
+        "name": "Old name",
+        "profile_picture": "profile/user.jpg",
+        "profile_image_url": "http://images/old.jpg",
+        "fetched_at": 0,
+    }}))
+
+    users = new_database(tmpdir)
+    users.prefetch(FakeApi(), ["user"], FakeDownloader())
+
+    assert users.get("user")["name"] == "Name user", "The stale user was not refreshed!"
+    assert tmpdir.join("user.jpg").read() == "http://images/user.jpg", \
+        "The old profile picture was not replaced!"
+
+
+def test_prefetch_failed_picture(tmpdir):
+    tmpdir.join("user.jpg").write("old picture")
+    old = {"name": "Old name",
+           "profile_picture": "profile/user.jpg",
+           "profile_image_url": "http://images/old.jpg",
+           "fetched_at": 0}
+    tmpdir.join("users-db.json").write(json.dumps({"user": old}))
+
+    users = new_database(tmpdir)
+    users.prefetch(FakeApi(), ["user", "new"],
+                   FakeDownloader(failing={"http://images/user.jpg", "http://images/new.jpg"}))
+
+    assert tmpdir.join("user.jpg").read() == "old picture", "The old profile picture was lost!"
+    assert users.get("user") == old, "The user's info changed without their new picture!"
+    assert users.is_stale("new"), "A user without a picture will not be looked up again!"
@@ -31,6 +31,9 @@ thread_data = [
 def test_clean_text():
     text = "& # _ % $ { }"
     assert clean_text(text) == "\\& \\# \\_ \\% \\$ \\{ \\}", "The text was not properly cleaned!"
+    assert clean_text("\\ ~ ^ \\&") == \
+        "\\textbackslash{} \\textasciitilde{} \\textasciicircum{} \\textbackslash{}\\&", \
+        "The backslash, tilde and caret were not escaped!"
 
 
 def test_create_threads():
@@ -0,0 +1,84 @@
+import json
+import os
+
+from twitter_saver.objects import MediaItem, Tweet
+from twitter_saver.website import SiteBuilder, shard_name, tokenize
+
+users = {"nobody": {"name": "No <body>", "profile_picture": "profile/nobody.jpg"}}
+
+
+def new_threads(count, edited=None):
+    threads = []
+    for i in range(1, count + 1):
+        text = "Edited" if i == edited else "Thread number {} & more".format(i)
+        media = [MediaItem(id=i, filename="{}.jpg".format(i), url="", type="photo")]
+        threads.append([Tweet(id=i * 10, created_at="2019-03-28 00:00:00", author="nobody",
+                              text=text, media=media),
+                        Tweet(id=i * 10 + 1, created_at="2019-03-28 00:01:00", author="nobody",
+                              text="reply", in_reply_to_status_id=i * 10)])
+    return threads
+
+
+def new_site(path, page_threads=10, page_tweets=500):
+    return SiteBuilder(str(path), "Archive", users.get,
+                       lambda filename: (100, 50) if filename != "2.jpg" else None,
+                       page_threads=page_threads, page_tweets=page_tweets)
+
+
+def test_tokenize():
+    assert tokenize("Hello, World! snake_case #tag") == ["hello", "world", "snake_case", "tag"], \
+        "The text was not split into words!"
+    assert [shard_name(t) for t in ["hello", "a", "über"]] == ["he", "a_", "_b"], \
+        "The words were not put in the right index files!"
+
+
+def test_build(tmpdir):
+    site = new_site(tmpdir)
+
+    assert site.build(new_threads(25)) == 3, "The threads were not split into pages!"
+
+    page = tmpdir.join("page-00001.html").read()
+    assert page.count('<article class="thread"') == 10, "A page had the wrong number of threads!"
+    assert "No &lt;body&gt;" in page and "Thread number 1 &amp; more" in page, \
+        "The text was not escaped!"
+    assert 'src="../media/1.jpg" loading="lazy" width="100" height="50"' in page, \
+        "The image was not lazy loaded with its size!"
+    assert 'src="../media/2.jpg" loading="lazy" alt=""' in page, \
+        "The missing image was given a size!"
+    assert 'rel="next" href="page-00002.html"' in page, "The next page was not linked!"
+    assert 'rel="next"' not in tmpdir.join("page-00003.html").read(), \
+        "The last page linked to a next page!"
+
+    shard = json.loads(tmpdir.join("search", "nu.json").read())
+    assert shard["number"] == list(range(1, 26)), "The search index did not list every thread!"
+    docs = json.loads(tmpdir.join("search", "threads-0.json").read())
+    assert docs["12"][0] == "page-00002.html", "The thread was not found on its page!"
+
+
+def test_page_tweets(tmpdir):
+    site = new_site(tmpdir, page_threads=100, page_tweets=5)
+
+    assert site.build(new_threads(5)) == 3, "The pages were not limited by their tweets!"
+
+
+def test_incremental_build(tmpdir):
+    new_site(tmpdir).build(new_threads(25))
+
+    site = new_site(tmpdir)
+    site.build(new_threads(25))
+    assert site.written == 0, "Unchanged files were written again!"
+
+    site = new_site(tmpdir)
+    site.build(new_threads(25, edited=15))
+    assert "Edited" in tmpdir.join("page-00002.html").read(), "The changed page was not written!"
+    # The page, the thread summaries, and the index files of the words that changed
+    assert site.written == 6, "Unchanged pages were written again!"
+    assert not os.path.exists(str(tmpdir.join("search", "15.json"))), \
+        "The index file of a word that is no longer used was left behind!"
+
+    site = new_site(tmpdir)
+    assert site.build(new_threads(15)) == 2, "The pages were not counted!"
+    assert not os.path.exists(str(tmpdir.join("page-00003.html"))), \
+        "A page that is no longer part of the site was left behind!"
+    assert 'rel="next"' not in tmpdir.join("page-00002.html").read(), \
+        "The new last page was not written again!"
@@ -1,58 +1,48 @@
-import argparse
-import json
 import logging
 import os
+import sys
 
 from twitter_saver.configuration import Configuration
-from twitter_saver.objects import Tweet
-from twitter_saver.utils import create_threads
-
-parser = argparse.ArgumentParser()
-parser.add_argument("--configuration", "-c", help="the path to the config folder", type=str)
-parser.add_argument("--log", "-l", help="set the logging level", type=str, default="INFO")
-
-args = parser.parse_args()
-if args.configuration is None:
-    print(parser.format_help())
-    raise FileNotFoundError("You have not specified a configuration path")
+from twitter_saver.export import export_threads, open_output
+from twitter_saver.storage import open_archive
+
+
+def main(conf: Configuration,
+         fmt: str = "json",
+         compress: bool = False,
+         since: str = None,
+         output: str = None) -> int:
+    """
+    Writes a user's threads to a file, as they are produced
+    :param conf: the Configuration for the user
+    :param fmt: 'json', or 'ndjson' for one thread per line
+    :param compress: whether to gzip the file
+    :param since: only export the threads with tweets newer than this tweet ID or date
+    :param output: the file to write (defaults to tweets-threaded.<format> in the user's folder)
+    :return: the number of threads written
+    """
+    try:
+        store = open_archive(conf, create=False)
+        logging.info("Loaded tweet database")
+    except FileNotFoundError:
+        logging.error("Database not found!")
+        raise
 
-numeric_level = getattr(logging, args.log.upper(), None)
-if not isinstance(numeric_level, int):
-    raise ValueError("Invalid log level: {}".format(args.log))
+    if output is None:
+        output = os.path.join(conf.save_path, "tweets-threaded.{}".format(fmt))
+        if compress:
+            output += ".gz"
 
-logging.basicConfig(level=numeric_level,
-                    format="%(asctime)s [%(levelname)s] %(message)s",
-                    datefmt='%Y-%m-%d %H:%M:%S'
-                    )
+    # The threads are written as they are produced, rather than built up in memory
+    with open_output(output, compress) as f:
+        count = export_threads(store, f, fmt, since)
+    store.close()
 
-yaml_conf = os.path.join(args.configuration, "configuration.yml")
+    logging.info("Wrote {} threads to {}".format(count, output))
+    return count
 
-conf = Configuration(yaml_conf)
 
-db_file = os.path.join(conf.save_path, "tweets-db.json")
+if __name__ == "__main__":
+    from twitter_saver.cli import main as cli_main
 
-# Database file (JSON)
-try:
-    with open(db_file, "r") as f:
-        jdb = json.load(f)
-        logging.info("Loaded tweet database")
-except FileNotFoundError:
-    logging.error("Database not found!")
-    raise
-
-all_tweets = []
-
-for j_tweet in jdb["tweets"]:
-    tweet = Tweet.new_from_json(j_tweet)
-    all_tweets.append(tweet)
-
-threads = create_threads(all_tweets)
-
-# Write the threads to a json file (pretty format)
-with open(os.path.join(conf.save_path, "tweets-threaded.json"), "w") as f:
-    thread_json = {"threads": []}
-    for i, thread in enumerate(threads):
-        thread_list = [tweet.to_dict().pop("_json", None) for tweet in thread]
-        thread_json["threads"].append({"id": i + 1, "tweets": thread_list})
-    print(thread_json)
-    json.dump(thread_json, f, indent=4, sort_keys=True)
+    sys.exit(cli_main(["thread"] + sys.argv[1:]))
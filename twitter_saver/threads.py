@@ -0,0 +1,177 @@
+from array import array
+import bisect
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from twitter_saver.objects import Tweet
+from twitter_saver.storage import TweetKey, TweetStore
+from twitter_saver.timestamps import tweet_epoch
+from twitter_saver.utils import split_media
+
+# Day period in which to look forward while filtering threads
+WINDOW_DAYS = 7
+
+# A lightweight threading key: (tweet id, in_reply_to_status_id, epoch seconds)
+ThreadKey = Tuple[int, Optional[int], int]
+
+
+def _chain(roots: List[int],
+           replies: List[int],
+           keys: Sequence[ThreadKey],
+           span: int) -> Tuple[List[List[int]], Set[int], int]:
+    """
+    Follows the reply chain down from each root, always taking the earliest
+    reply (in time order) to the current end of the thread, as long as it
+    falls inside the window.
+
+    :param roots: positions (into keys) of the tweets that start a thread
+    :param replies: positions (into keys) of the candidate replies, in time order
+    :param keys: the sorted threading keys
+    :param span: the window, in seconds, measured from the end of the thread
+    :return: the threads (as positions), the ids that were threaded, and how
+             many of the replies fell inside at least one thread's window
+    """
+    times = array("q", (keys[i][2] for i in replies))
+
+    # Parent id -> positions into replies, ascending
+    children: Dict[int, List[int]] = {}
+    for pos, i in enumerate(replies):
+        children.setdefault(keys[i][1], []).append(pos)
+
+    threads = []
+    threaded = set()
+    covered = 0
+
+    for root in roots:
+        thread = [root]
+        last, pos = root, -1
+        while True:
+            candidates = children.get(keys[last][0])
+            if candidates is None:
+                break
+            k = bisect.bisect_right(candidates, pos)
+            if k == len(candidates):
+                break
+            pos = candidates[k]
+            # Replies are in time order: if the earliest one is outside the
+            # window, then so are all of the ones after it.
+            if times[pos] - keys[last][2] >= span:
+                break
+            last = replies[pos]
+            thread.append(last)
+            threaded.add(keys[last][0])
+
+        covered = max(covered, bisect.bisect_left(times, keys[last][2] + span))
+        threads.append(thread)
+
+    return threads, threaded, covered
+
+
+def thread_positions(keys: Sequence[ThreadKey], window: int = WINDOW_DAYS) -> List[List[int]]:
+    """
+    Threads tweets using only their threading keys, which must already be
+    sorted by creation time. Each reply is found through a parent id index,
+    rather than by scanning every reply for every thread.
+
+    :param keys: (id, in_reply_to_status_id, epoch) for each tweet, sorted by epoch
+    :param window: day period in which to look forward while filtering threads
+    :return: A list of threads, each a list of positions into keys
+    """
+    # A reply is inside the window while it is less than a whole day
+    # past the window, as measured from the end of the thread
+    span = (window + 1) * 86400
+
+    # Start with the true parents, the tweets not in reply to anyone
+    roots = [i for i, key in enumerate(keys) if key[1] is None]
+    replies = [i for i, key in enumerate(keys) if key[1] is not None]
+
+    logging.info("Creating base threads")
+    threads, threaded, covered = _chain(roots, replies, keys, span)
+
+    # Only redo threading for replies that were seen, but not already in a thread
+    remainder = [i for i in replies[:covered] if keys[i][0] not in threaded]
+
+    # For the threads that are made from branches of other threads
+    roots = [i for i in remainder if keys[i][1] in threaded]
+    replies = [i for i in remainder if keys[i][1] not in threaded]
+
+    logging.info("Adding out-of-order replies to original threads")
+    branches, _, _ = _chain(roots, replies, keys, span)
+
+    # Sort the threads by the parent's creation date
+    return sorted(threads + branches, key=lambda thread: keys[thread[0]][2])
+
+
+def _split_thread(tweets: List[Tweet], split_media_bool: bool) -> List[Tweet]:
+    thread = [tweets[0]]
+    for tweet in tweets[1:]:
+        # Split the tweet by the amount of media it has
+        if split_media_bool and len(tweet.media) != 0:
+            thread.extend(split_media(tweet))
+        else:
+            thread.append(tweet)
+    return thread
+
+
+def create_threads(tweets: List[Tweet],
+                   split_media_bool: bool = True,
+                   window: int = WINDOW_DAYS) -> List[List[Tweet]]:
+    """
+    Attempts to thread tweets based on their creation
+    timestamp, and who replied to each tweet.
+
+    Produces the same threads as utils.create_threads, but sorts on the
+    saved epoch timestamps and walks the reply chains through an index,
+    so it runs in roughly linear time.
+
+    :param tweets: The database collection of tweets (as a list)
+    :param split_media_bool: Split replies by the amount of media they have
+    :param window: Day period in which to look forward while filtering threads
+    :return: A list of threaded tweets
+    """
+    epochs = array("q", (tweet.timestamp for tweet in tweets))
+    order = sorted(range(len(tweets)), key=epochs.__getitem__)
+
+    tweets = [tweets[i] for i in order]
+    keys = [(tweet.id, tweet.in_reply_to_status_id, epochs[i])
+            for tweet, i in zip(tweets, order)]
+
+    return [_split_thread([tweets[pos] for pos in positions], split_media_bool)
+            for positions in thread_positions(keys, window)]
+
+
+def index_threads(keys: Iterable[TweetKey], window: int = WINDOW_DAYS) -> List[List[int]]:
+    """
+    Threads tweets using only their IDs, parents and creation times, so
+    that the full tweets don't need to be held in memory.
+
+    :param keys: (id, in_reply_to_status_id, timestamp) for each tweet
+    :param window: Day period in which to look forward while filtering threads
+    :return: A list of threads, each a list of tweet IDs
+    """
+    keys = list(keys)
+    epochs = array("q", (key[2] for key in keys))
+    keys = [keys[i] for i in sorted(range(len(keys)), key=epochs.__getitem__)]
+    return [[keys[pos][0] for pos in positions] for positions in thread_positions(keys, window)]
+
+
+def iter_threads(store: TweetStore,
+                 thread_ids: List[List[int]] = None,
+                 split_media_bool: bool = True,
+                 window: int = WINDOW_DAYS) -> Iterator[List[Tweet]]:
+    """
+    Yields the same threads as create_threads, reading the tweets of each
+    thread from the database only when it is reached.
+
+    :param store: The tweet database
+    :param thread_ids: The threads from index_threads, if they are already known
+    :param split_media_bool: Split replies by the amount of media they have
+    :param window: Day period in which to look forward while filtering threads
+    """
+    if thread_ids is None:
+        thread_ids = index_threads(store.iter_keys(), window)
+
+    for ids in thread_ids:
+        records = store.get_many(ids)
+        yield _split_thread([Tweet.new_from_json(records[tweet_id]) for tweet_id in ids],
+                            split_media_bool)
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+if TYPE_CHECKING:
+    import twitter
+
+# The most tweets that statuses/user_timeline returns per page
+MAX_PAGE_SIZE = 200
+
+
+class TimelineCheckpoint:
+    """
+    Saves the position of a paged timeline download to disk, so that an
+    interrupted run carries on from the last page that was saved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def load(self, screen_name: str) -> Optional[dict]:
+        """
+        :return: the saved position for the user, or None if there isn't one
+        """
+        try:
+            with open(self.path, "r") as f:
+                cursor = json.load(f)
+        except FileNotFoundError:
+            return None
+        if cursor.get("screen_name") != screen_name:
+            return None
+        return cursor
+
+    def save(self, screen_name: str, since_id: Optional[int], max_id: Optional[int]) -> None:
+        temp_path = self.path + ".part"
+        with open(temp_path, "w") as f:
+            json.dump({"screen_name": screen_name, "since_id": since_id, "max_id": max_id}, f)
+        os.replace(temp_path, self.path)
+
+
+def fetch_timeline(api: "twitter.Api",
+                   screen_name: str,
+                   since_id: Optional[int],
+                   on_page: Callable[[List["twitter.Status"]], None],
+                   checkpoint: TimelineCheckpoint,
+                   page_size: int = MAX_PAGE_SIZE) -> int:
+    """
+    Pages backwards through a user's timeline, from the newest tweet down to
+    since_id (or as far back as the API allows), handing each page over as
+    soon as it arrives. Retweets are dropped.
+
+    If the checkpoint holds the position of an interrupted run for the same
+    user, the download resumes from there instead, with the original since_id.
+
+    :param api: the twitter.Api
+    :param screen_name: the user whose timeline to download
+    :param since_id: only get tweets newer than this ID (None for everything)
+    :param on_page: called with the tweets of each page, newest first
+    :param checkpoint: where the position is saved after each page
+    :param page_size: the number of tweets to request per page
+    :return: the number of tweets downloaded
+    """
+    max_id = None
+
+    cursor = checkpoint.load(screen_name)
+    if cursor is not None:
+        since_id, max_id = cursor.get("since_id"), cursor.get("max_id")
+        logging.info("Resuming timeline download before tweet.id = {}".format(max_id))
+
+    total = 0
+    while True:
+        page = api.GetUserTimeline(screen_name=screen_name,
+                                   since_id=since_id,
+                                   max_id=max_id,
+                                   count=min(page_size, MAX_PAGE_SIZE),
+                                   include_rts=True)
+        if len(page) == 0:
+            break
+
+        # Retweets are requested and then dropped, so that a page made up
+        # entirely of retweets doesn't look like the end of the timeline.
+        tweets = [tweet for tweet in page if tweet.retweeted_status is None]
+        if tweets:
+            on_page(tweets)
+            total += len(tweets)
+
+        max_id = min(tweet.id for tweet in page) - 1
+        checkpoint.save(screen_name, since_id, max_id)
+        logging.debug("Saved {} tweets, up to tweet.id = {}".format(total, max_id))
+
+    checkpoint.clear()
+    return total
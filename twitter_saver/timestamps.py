@@ -0,0 +1,72 @@
+import datetime
+import re
+
+# The format of the dates on the title page and on each tweet
+DATE_FORMAT = "%b %d %Y"
+
+# The dates, and dates and times, accepted on the command line and in searches
+DATE_INPUT_FORMATS = ["%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S",
+                      "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d %H:%M:%S%z"]
+
+# Python 3.6's %z doesn't accept a colon in the UTC offset
+_OFFSET_COLON = re.compile(r"([+-]\d\d):(\d\d)$")
+
+
+def create_timestamp(time: str) -> datetime.datetime:
+    try:
+        my_date = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        my_date = datetime.datetime.strptime(time, '%a %b %d %H:%M:%S %z %Y')
+    return my_date
+
+
+def tweet_epoch(created_at: str) -> int:
+    """
+    Converts a tweet's creation string into whole seconds since the epoch.
+    Timestamps without a timezone are treated as UTC.
+    """
+    timestamp = create_timestamp(created_at)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return int(timestamp.timestamp())
+
+
+def stamp_tweet(tweet: dict) -> bool:
+    """
+    Adds the epoch 'timestamp' to a saved tweet that only has its creation string
+    :param tweet: a saved tweet dict, which is changed in place
+    :return: whether the timestamp was added
+    """
+    if tweet.get("timestamp") is not None or tweet.get("created_at") is None:
+        return False
+    tweet["timestamp"] = tweet_epoch(tweet["created_at"])
+    return True
+
+
+def parse_date(value: str) -> int:
+    """
+    :param value: a date (YYYY-MM-DD), or an ISO date and time, UTC if no timezone is given
+    :return: the date in seconds since the epoch
+    """
+    text = _OFFSET_COLON.sub(r"\1\2", value.strip())
+    for date_format in DATE_INPUT_FORMATS:
+        try:
+            date = datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return int(date.timestamp())
+    raise ValueError("Invalid date: {}".format(value))
+
+
+def format_timestamp(timestamp) -> str:
+    """
+    :param timestamp: seconds since the epoch (UTC), or a creation string
+    :return: the date, as shown in the LaTeX output
+    """
+    if isinstance(timestamp, int):
+        date = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    else:
+        date = create_timestamp(timestamp)
+    return date.strftime(DATE_FORMAT)
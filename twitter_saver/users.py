@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import TYPE_CHECKING, Iterable, List
+
+from twitter_saver.api import no_user_matches
+from twitter_saver.media import MediaDownloader
+
+if TYPE_CHECKING:
+    import twitter
+
+# The most users that can be requested in one users/lookup call
+LOOKUP_BATCH_SIZE = 100
+
+
+class UserDatabase:
+    """
+    The profile info (display name and profile picture) of every tweet author,
+    saved to users-db.json and keyed by screen name.
+    """
+
+    def __init__(self,
+                 path: str,
+                 profile_path: str,
+                 default_image: str,
+                 ttl_days: float = 30):
+        """
+        :param path: location of the users database
+        :param profile_path: where to save the profile pictures
+        :param default_image: the picture to use for users that no longer exist
+        :param ttl_days: how long before a user's profile info is looked up again
+        """
+        self.path = path
+        self.profile_path = profile_path
+        self.default_image = default_image
+        self.ttl = ttl_days * 24 * 60 * 60
+
+        try:
+            with open(path, "r") as f:
+                self.users = json.load(f)
+                logging.info("Loaded user database")
+        except FileNotFoundError:
+            self.users = {}
+            logging.info("Creating new user database")
+
+    def __contains__(self, screen_name: str) -> bool:
+        return screen_name in self.users
+
+    def get(self, screen_name: str) -> dict:
+        return self.users[screen_name]
+
+    def is_stale(self, screen_name: str, now: float = None) -> bool:
+        """
+        :return: whether the user needs to be looked up (again)
+        """
+        user = self.users.get(screen_name)
+        if user is None:
+            return True
+        now = time.time() if now is None else now
+        return now - user.get("fetched_at", 0) > self.ttl
+
+    def save(self) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".part")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.users, f)
+        os.replace(temp_path, self.path)
+
+    def _lookup(self, api: "twitter.Api", screen_names: List[str]) -> dict:
+        import twitter
+
+        try:
+            users = api.UsersLookup(screen_name=screen_names, include_entities=False)
+        except twitter.error.TwitterError as e:
+            if not no_user_matches(e):
+                raise
+            users = []
+        return {user.screen_name.lower(): user for user in users}
+
+    def prefetch(self,
+                 api: "twitter.Api",
+                 screen_names: Iterable[str],
+                 downloader: MediaDownloader) -> int:
+        """
+        Looks up every new or stale user, in batches, and downloads their
+        profile pictures. The database is saved after each batch, so an
+        interrupted run carries on from where it stopped.
+
+        :param api: the twitter.Api
+        :param screen_names: the authors to look up
+        :param downloader: used to download the profile pictures
+        :return: the number of users looked up
+        """
+        now = time.time()
+        pending = sorted(name for name in set(screen_names) if self.is_stale(name, now))
+        if pending:
+            logging.info("Looking up profile info for {} users".format(len(pending)))
+
+        for start in range(0, len(pending), LOOKUP_BATCH_SIZE):
+            batch = pending[start:start + LOOKUP_BATCH_SIZE]
+            found = self._lookup(api, batch)
+
+            pictures, replaced, entries = [], [], {}
+            for screen_name in batch:
+                user = found.get(screen_name.lower())
+                if user is None:
+                    logging.debug("No profile info found for user: {}".format(screen_name))
+                    name, image_url = screen_name, self.default_image
+                else:
+                    name, image_url = user.name, user.profile_image_url
+
+                path = os.path.join(self.profile_path, "{}.jpg".format(screen_name))
+                previous = self.users.get(screen_name, {}).get("profile_image_url")
+                if previous is not None and previous != image_url and os.path.exists(path):
+                    # The user has changed their profile picture: the old one is kept until
+                    # the new one has been saved over it
+                    replaced.append((image_url, path))
+                else:
+                    pictures.append((image_url, path))
+
+                entries[screen_name] = {
+                    "name": name,
+                    "profile_picture": "profile/{}.jpg".format(screen_name),
+                    "profile_image_url": image_url,
+                    "fetched_at": int(now),
+                }
+
+            saved = set()
+            downloader.download(pictures, on_saved=saved.add)
+            downloader.download(replaced, on_saved=saved.add, overwrite=True)
+            replaced_paths = {path for _, path in replaced}
+
+            for screen_name, entry in entries.items():
+                path = os.path.join(self.profile_path, "{}.jpg".format(screen_name))
+                if path in saved or (path not in replaced_paths and os.path.exists(path)):
+                    self.users[screen_name] = entry
+                elif screen_name not in self.users:
+                    # The picture could not be downloaded: look the user up again next time
+                    entry["fetched_at"] = 0
+                    self.users[screen_name] = entry
+                # Otherwise the user keeps their old info and picture until the next lookup
+            self.save()
+
+        return len(pending)
@@ -2,32 +2,42 @@ import datetime
 from functools import reduce
 import json
 import logging
-from tqdm import tqdm
+import re
 from typing import List
-import twitter
 
 from twitter_saver.objects import MediaItem, Tweet
+from twitter_saver.timestamps import create_timestamp, format_timestamp
 
 
 def calc_day_diff(time1: str, time2: str) -> datetime.timedelta:
     return create_timestamp(time1) - create_timestamp(time2)
 
 
+# Every character with a special meaning in LaTeX, and how to print it
+LATEX_ESCAPES = {
+    "&": "\\&",
+    "#": "\\#",
+    "_": "\\_",
+    "%": "\\%",
+    "$": "\\$",
+    "{": "\\{",
+    "}": "\\}",
+    "\\": "\\textbackslash{}",
+    "~": "\\textasciitilde{}",
+    "^": "\\textasciicircum{}",
+}
+_LATEX_SPECIAL = re.compile("[{}]".format(re.escape("".join(LATEX_ESCAPES))))
+
+
+def _escape(match) -> str:
+    return LATEX_ESCAPES[match.group()]
+
+
 def clean_text(text: str) -> str:
     """
-    Removes unwanted characters from a tweet's fulltext
+    Escapes the LaTeX special characters in a tweet's fulltext, in a single pass
     """
-    for char in ['&', '#', '_', '%', '$', '{', '}']:
-        text = str(text).replace(char, '\\{}'.format(char))
-    return str(text)
-
-
-def create_timestamp(time: str) -> datetime.datetime:
-    try:
-        my_date = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M:%S')
-    except ValueError:
-        my_date = datetime.datetime.strptime(time, '%a %b %d %H:%M:%S %z %Y')
-    return my_date
+    return _LATEX_SPECIAL.sub(_escape, str(text))
 
 
 def create_threads(tweets: List[Tweet]) -> List[List[Tweet]]:
@@ -74,6 +84,9 @@ def create_threads(tweets: List[Tweet]) -> List[List[Tweet]]:
     tweet_set = set()
     remainder = []
 
+    # Only needed by this original version of the threading
+    from tqdm import tqdm
+
     threads = []
     logging.info("Creating base threads")
     for thread in tqdm(parents):
@@ -94,10 +107,6 @@ def create_threads(tweets: List[Tweet]) -> List[List[Tweet]]:
     return sorted(threads, key=lambda thread: create_timestamp(thread[0].created_at))
 
 
-def format_timestamp(timestamp: str) -> str:
-    return create_timestamp(timestamp).strftime("%b %d %Y")
-
-
 def split_media(tweet: Tweet) -> List[Tweet]:
     """
     Splits a tweet based on the number of media.
@@ -105,9 +114,4 @@ def split_media(tweet: Tweet) -> List[Tweet]:
     than two pictures can often overrun the page
     margins.
     """
-    split_tweets = []
-    tweet_dict = tweet.to_dict()
-    for media in tweet_dict["media"]:
-        tweet_dict["media"] = [media]
-        split_tweets.append(Tweet.new_from_json(tweet_dict))
-    return split_tweets
+    return [tweet.with_media([media]) for media in tweet.media]
@@ -0,0 +1,309 @@
+import datetime
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from twitter_saver.objects import Tweet
+from twitter_saver.search import tokenize
+from twitter_saver.timestamps import format_timestamp
+
+# Change this whenever the HTML output changes, so every page is written again
+SITE_VERSION = 1
+
+# The most threads, and tweets, on one page (a thread is never split across pages)
+PAGE_THREADS = 50
+PAGE_TWEETS = 500
+
+# The number of threads described in each file of thread summaries
+SEARCH_DOCS_SIZE = 1000
+
+# The length of the text shown with each search result
+SNIPPET_LENGTH = 140
+
+RESOURCES = os.path.join(os.path.dirname(__file__), "resources", "site")
+
+_SHARD_CHARACTER = re.compile(r"[a-z0-9]")
+
+PAGE_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<link rel="stylesheet" href="style.css">
+</head>
+<body>
+<header><a href="index.html">{heading}</a></header>
+<main>
+{body}
+</main>
+{footer}
+</body>
+</html>
+"""
+
+
+def shard_name(token: str) -> str:
+    """
+    :return: the search index file a word is kept in, named after its first two characters
+    """
+    prefix = (token + "__")[:2]
+    return "".join(c if _SHARD_CHARACTER.match(c) else "_" for c in prefix)
+
+
+def _hash(content) -> str:
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Page:
+    """
+    The threads on one page of the site, and what they need to be rendered
+    """
+
+    def __init__(self, number: int):
+        self.number = number
+        self.threads: List[Tuple[int, List[Tweet]]] = []
+        self.tweets = 0
+
+    @property
+    def filename(self) -> str:
+        return "page-{:05d}.html".format(self.number)
+
+    def is_full(self, thread: List[Tweet], page_threads: int, page_tweets: int) -> bool:
+        return len(self.threads) >= page_threads or \
+            (len(self.threads) > 0 and self.tweets + len(thread) > page_tweets)
+
+    def add(self, position: int, thread: List[Tweet]) -> None:
+        self.threads.append((position, thread))
+        self.tweets += len(thread)
+
+
+class SiteBuilder:
+    """
+    Writes a paginated static HTML site of an archive's threads, along with
+    a search index split into small JSON files, which the browser only
+    fetches for the words searched for.
+
+    The build is incremental: each page is only rendered and written if the
+    threads on it (or the users and images they show) changed since the
+    last build, and each index file is only written if its content changed.
+    """
+
+    def __init__(self,
+                 path: str,
+                 title: str,
+                 users: Callable[[str], dict],
+                 dimensions: Callable[[str], Optional[Tuple[int, int]]],
+                 media_url: str = "../media",
+                 page_threads: int = PAGE_THREADS,
+                 page_tweets: int = PAGE_TWEETS):
+        """
+        :param path: the folder to write the site to
+        :param title: the title of the site
+        :param users: gives the user data (name, profile_picture) of an author
+        :param dimensions: gives the (width, height) of a media file, or None if it is missing
+        :param media_url: the URL of the media folder, relative to the site
+        :param page_threads: the most threads on a page
+        :param page_tweets: the most tweets on a page, unless one thread is longer
+        """
+        self.path = path
+        self.title = title
+        self.users = users
+        self.dimensions = dimensions
+        self.media_url = media_url
+        self.page_threads = page_threads
+        self.page_tweets = page_tweets
+        self.written = 0
+        self.unchanged = 0
+
+        os.makedirs(os.path.join(path, "search"), exist_ok=True)
+        self._manifest_file = os.path.join(path, "site-manifest.json")
+        try:
+            with open(self._manifest_file, "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        self._old_files: Dict[str, str] = manifest.get("files", {})
+        self._files: Dict[str, str] = {}
+
+    def build(self, threads: Iterable[List[Tweet]]) -> int:
+        """
+        :param threads: every thread of the archive, in order
+        :return: the number of pages
+        """
+        postings: Dict[str, List[int]] = {}
+        docs: Dict[int, list] = {}
+        pages = []
+
+        page = Page(1)
+        for position, thread in enumerate(threads, 1):
+            if page.is_full(thread, self.page_threads, self.page_tweets):
+                pages.append(self._write_page(page, has_next=True))
+                page = Page(page.number + 1)
+            page.add(position, thread)
+
+            for token in {token for tweet in thread
+                          for token in tokenize(tweet.text) + tokenize(tweet.author)}:
+                postings.setdefault(token, []).append(position)
+            root = thread[0]
+            docs[position] = [page.filename, format_timestamp(root.timestamp), root.author,
+                              root.text[:SNIPPET_LENGTH]]
+
+        if page.threads:
+            pages.append(self._write_page(page, has_next=False))
+
+        self._write_search_index(postings, docs)
+        self._write_index(pages)
+        for resource in ["style.css", "search.js"]:
+            with open(os.path.join(RESOURCES, resource), "r", encoding="utf-8") as f:
+                self._write(resource, f.read())
+        self._finish()
+
+        logging.info("Wrote {} site files, {} were unchanged".format(self.written, self.unchanged))
+        return len(pages)
+
+    def _write(self, name: str, content: str, key: str = None) -> None:
+        """
+        Writes a file of the site, unless it is the same as in the last build
+        :param key: a hash of what the file was made from, if not of its content
+        """
+        key = key or hashlib.sha1(content.encode("utf-8")).hexdigest()
+        self._files[name] = key
+        path = os.path.join(self.path, name)
+        if self._old_files.get(name) == key and os.path.exists(path):
+            self.unchanged += 1
+            return
+        temp_path = path + ".part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        self.written += 1
+
+    def _is_unchanged(self, name: str, key: str) -> bool:
+        if self._old_files.get(name) == key and os.path.exists(os.path.join(self.path, name)):
+            self._files[name] = key
+            self.unchanged += 1
+            return True
+        return False
+
+    def _write_page(self, page: Page, has_next: bool) -> dict:
+        first, last = page.threads[0][1][0], page.threads[-1][1][0]
+        summary = {"filename": page.filename,
+                   "threads": len(page.threads),
+                   "tweets": page.tweets,
+                   "from": format_timestamp(first.timestamp),
+                   "to": format_timestamp(last.timestamp)}
+
+        authors = {tweet.author for _, thread in page.threads for tweet in thread}
+        users = {author: self.users(author) for author in authors}
+        dimensions = {m.filename: self.dimensions(m.filename)
+                      for _, thread in page.threads for tweet in thread for m in tweet.media}
+        key = _hash({"version": SITE_VERSION,
+                     "title": self.title,
+                     "number": page.number,
+                     "has_next": has_next,
+                     "threads": [[position, [tweet.to_dict() for tweet in thread]]
+                                 for position, thread in page.threads],
+                     "users": {author: [user.get("name"), user.get("profile_picture")]
+                               for author, user in users.items()},
+                     "dimensions": dimensions})
+        if self._is_unchanged(page.filename, key):
+            return summary
+
+        body = "\n".join(self._render_thread(position, thread, users, dimensions)
+                         for position, thread in page.threads)
+        links = ['<a href="index.html">Contents</a>']
+        if page.number > 1:
+            links.insert(0, '<a rel="prev" href="page-{:05d}.html">Previous</a>'
+                         .format(page.number - 1))
+        if has_next:
+            links.append('<a rel="next" href="page-{:05d}.html">Next</a>'.format(page.number + 1))
+        title = "{} - page {}".format(self.title, page.number)
+        content = PAGE_HTML.format(title=html.escape(title),
+                                   heading=html.escape(self.title),
+                                   body=body,
+                                   footer="<nav>{}</nav>".format(" ".join(links)))
+        self._write(page.filename, content, key)
+        return summary
+
+    def _render_thread(self,
+                       position: int,
+                       thread: List[Tweet],
+                       users: Dict[str, dict],
+                       dimensions: Dict[str, Optional[Tuple[int, int]]]) -> str:
+        parts = ['<article class="thread" id="t{}">'.format(position)]
+        for tweet in thread:
+            user = users[tweet.author]
+            date = datetime.datetime.fromtimestamp(tweet.timestamp, datetime.timezone.utc)
+            text = html.escape(tweet.text).replace("\n", "<br>")
+            parts.append('<div class="tweet" id="tweet-{id}">'
+                         '<img class="avatar" src="{media}/{picture}" loading="lazy" '
+                         'width="48" height="48" alt="">'
+                         '<div class="body"><div class="meta">'
+                         '<span class="name">{name}</span> <span class="handle">@{author}</span> '
+                         '<a href="https://twitter.com/{author}/status/{id}">'
+                         '<time datetime="{iso}">{date}</time></a></div>'
+                         '<p class="text">{text}</p>'
+                         .format(id=tweet.id,
+                                 media=self.media_url,
+                                 picture=html.escape(str(user.get("profile_picture")), True),
+                                 name=html.escape(str(user.get("name"))),
+                                 author=html.escape(tweet.author),
+                                 iso=date.isoformat(),
+                                 date=format_timestamp(tweet.timestamp),
+                                 text=text))
+            if tweet.media:
+                parts.append('<div class="media">')
+                for m in tweet.media:
+                    size = dimensions.get(m.filename)
+                    size_attributes = "" if size is None else \
+                        ' width="{}" height="{}"'.format(*size)
+                    parts.append('<img src="{}/{}" loading="lazy"{} alt="">'
+                                 .format(self.media_url, html.escape(m.filename, True),
+                                         size_attributes))
+                parts.append('</div>')
+            parts.append('</div></div>')
+        parts.append('</article>')
+        return "\n".join(parts)
+
+    def _write_index(self, pages: List[dict]) -> None:
+        rows = "\n".join('<li><a href="{filename}">{from} &ndash; {to}</a> '
+                         '<span class="count">{threads} threads, {tweets} tweets</span></li>'
+                         .format(**page) for page in pages)
+        body = ('<form id="search"><input type="search" name="q" placeholder="Search tweets" '
+                'autocomplete="off"><button>Search</button></form>\n'
+                '<ol id="results"></ol>\n'
+                '<ol class="pages">\n{}\n</ol>'.format(rows))
+        self._write("index.html", PAGE_HTML.format(title=html.escape(self.title),
+                                                   heading=html.escape(self.title),
+                                                   body=body,
+                                                   footer='<script src="search.js"></script>'))
+
+    def _write_search_index(self, postings: Dict[str, List[int]], docs: Dict[int, list]) -> None:
+        shards: Dict[str, Dict[str, List[int]]] = {}
+        for token, positions in postings.items():
+            shards.setdefault(shard_name(token), {})[token] = positions
+        for name, shard in shards.items():
+            self._write("search/{}.json".format(name), json.dumps(shard, sort_keys=True))
+
+        chunks: Dict[int, Dict[int, list]] = {}
+        for position, doc in docs.items():
+            chunks.setdefault(position // SEARCH_DOCS_SIZE, {})[position] = doc
+        for number, chunk in chunks.items():
+            self._write("search/threads-{}.json".format(number),
+                        json.dumps(chunk, sort_keys=True))
+
+    def _finish(self) -> None:
+        # Remove the pages and index files that are no longer part of the site
+        for name in set(self._old_files) - set(self._files):
+            path = os.path.join(self.path, name)
+            if os.path.exists(path):
+                os.remove(path)
+        temp_path = self._manifest_file + ".part"
+        with open(temp_path, "w") as f:
+            json.dump({"version": SITE_VERSION, "files": self._files}, f)
+        os.replace(temp_path, self._manifest_file)